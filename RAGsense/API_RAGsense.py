@@ -1,18 +1,61 @@
-﻿import logging
+﻿import asyncio
+import json
+import logging
 import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
 from Models import *
-from services.rag_service import RAGService
+from services.async_rag_service import AsyncRAGService
+from services.batch_search import BatchSearch
+from services.context_builder import context_builder
+from services.instrumentation import (
+    METRICS_AVAILABLE, ServerTimingMiddleware, current_timings, render_metrics, set_search_type, stage
+)
+from services.llm_scheduler import LLMOverloadedError, LLMPriority, llm_scheduler
+from services.search_cursor import CursorExpiredError, InvalidCursorError, decode_cursor, encode_cursor, request_fingerprint
+from services.rag_service import (
+    DEFAULT_EMBEDDING_MODEL, SYSTEM_PROMPT, document_prompt_instructions, query_embedding_cache, query_encoder
+)
+from services.result_merge import merge_top_k, normalize_scores
 
 load_dotenv()  # ← muss vor jedem os.getenv stehen
 
 print("→ ELASTICSEARCH_URI =", os.getenv("ELASTICSEARCH_URI"))
 
-app = FastAPI(title="RAG Service API")
+# Initialisiere den RAGServiceHandler
+elasticsearch_uri = os.getenv("ELASTICSEARCH_URI")
+groq_api_key = os.getenv("GROQ_API_KEY")
+username = os.getenv("ELASTIC_USERNAME")
+password = os.getenv("ELASTIC_PASSWORD")
+logging.info("Das Programm startet jetzt")
+logging.info(elasticsearch_uri)
+rag: AsyncRAGService = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Erzeugt den RAG-Service beim Start (ohne Netzwerkzugriffe) und wärmt ES, LLM und
+    Embedding-Modell im Hintergrund auf, damit der Server sofort Anfragen annimmt.
+    """
+    global rag
+    rag = AsyncRAGService(elasticsearch_uri, groq_api_key, username, password)
+
+    model_names = [DEFAULT_EMBEDDING_MODEL] if os.getenv("EMBEDDING_WARMUP", "true").lower() == "true" else []
+    warm_up_task = asyncio.create_task(rag.warm_up(model_names))
+    yield
+    warm_up_task.cancel()
+    # Gepoolte Verbindungen zu Elasticsearch und LLM sauber schließen
+    await rag.close()
+
+
+app = FastAPI(title="RAG Service API", lifespan=lifespan)
 
 # Alles erlauben was CORS angeht
 app.add_middleware(
@@ -22,30 +65,140 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Dauer der Verarbeitungsschritte als Server-Timing-Header und Prometheus-Histogramme
+app.add_middleware(ServerTimingMiddleware)
+
+
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded_handler(request, exc: LLMOverloadedError):
+    """
+    Abgewiesene LLM-Anfragen (Warteschlange voll bzw. Deadline abgelaufen) mit 429/503 und Retry-After beantworten.
+    """
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_handler(request, exc: InvalidCursorError):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
 
-# Initialisiere den RAGServiceHandler
-elasticsearch_uri = os.getenv("ELASTICSEARCH_URI")
-groq_api_key = os.getenv("GROQ_API_KEY")
-username = os.getenv("ELASTIC_USERNAME")
-password = os.getenv("ELASTIC_PASSWORD")
-logging.info("Das Programm startet jetzt")
-logging.info(elasticsearch_uri)
-rag = RAGService(elasticsearch_uri, groq_api_key, username, password)
+
+@app.exception_handler(CursorExpiredError)
+async def cursor_expired_handler(request, exc: CursorExpiredError):
+    """
+    Abgelaufener Point-in-Time: die Suche muss ohne cursor neu beginnen.
+    """
+    return JSONResponse(status_code=410, content={"detail": f"Cursor abgelaufen: {exc}"})
+
+
+def llm_options(req) -> Tuple[LLMPriority, Optional[float]]:
+    """
+    Priorität und Deadline (Sekunden) für den llm_scheduler aus priority/deadlineMs der Anfrage.
+    """
+    deadline = req.deadlineMs / 1000 if req.deadlineMs is not None else None
+    return LLMPriority[req.priority.value], deadline
+
+
+def sse_event(event: str, data) -> str:
+    """
+    Formatiert ein Server-Sent Event; data wird als JSON serialisiert.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_tokens(
+    prompt: str,
+    done: Optional[dict] = None,
+    doc_refs: Optional[List[str]] = None,
+    query: Optional[str] = None,
+    priority: LLMPriority = LLMPriority.interactive,
+    deadline: Optional[float] = None,
+    instructions: str = "",
+) -> AsyncIterator[str]:
+    """
+    Leitet die Tokens des LLM als 'token'-Events weiter und schließt mit 'done' (optional mit done als Daten)
+    bzw. 'error' ab. Mit doc_refs läuft die Anfrage über den Antwort-Cache (instructions siehe cached_answer).
+    """
+    try:
+        if doc_refs is None:
+            tokens = rag.stream_languageModel(prompt, priority, deadline)
+        else:
+            tokens = rag.stream_cached_answer(prompt, doc_refs, query, priority, deadline, instructions)
+        async for token in tokens:
+            yield sse_event("token", token)
+        yield sse_event("done", done or {})
+    except LLMOverloadedError as e:
+        # Der Statuscode ist bereits gesendet: Abweisung als Event mit Retry-After
+        yield sse_event("error", {"detail": str(e), "status": e.status_code, "retryAfter": e.retry_after})
+    except Exception as e:
+        yield sse_event("error", {"detail": f"LLM-Fehler: {str(e)}"})
+
+
+def event_stream(events: AsyncIterator[str]) -> StreamingResponse:
+    # X-Accel-Buffering: nginx soll die Events nicht puffern
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/api/health")
-def health_check():
+async def health_check():
     """
     Gesundheitsprüfung: Elasticsearch + optional LLM-Gateway
     """
-    es_ok = rag._elastic_client.ping()
+    es_ok = await rag._elastic_client.ping()
     if not es_ok:
         raise HTTPException(status_code=503, detail="Elasticsearch nicht erreichbar")
     # Optional: hier könnte man noch Groq-Ping o.ä. abfragen
     return {"status": "ok"}
 
 
+@app.get("/api/ready")
+async def readiness_check():
+    """
+    Readiness-Prüfung: Warm-Zustand von Elasticsearch, LLM und Embedding-Modell.
+    Antwortet mit 503, solange nicht alle Abhängigkeiten bereit sind.
+    """
+    body = {"ready": rag.is_ready(), "dependencies": rag.readiness}
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+
+@app.get("/api/stats")
+async def service_stats():
+    """
+    Laufzeit-Statistiken der Caches (Query-Embeddings, LLM-Antworten), des Query-Encoders
+    (Batch-Größen, Wartezeit in der Queue), des LLM-Schedulers (Slots, Queue-Tiefe, Wartezeit),
+    des Such-Caches (Trefferquote, eingesparte Suchzeit), der Point-in-Times der Cursor-Pagination
+    und der adaptiven Abfragetiefe je Quelle (Anteile an der Top-K, nachgeladene Quellen).
+    """
+    return {
+        "embedding_cache": query_embedding_cache.stats(),
+        "query_encoder": query_encoder.stats(),
+        "answer_cache": rag.answer_cache.stats() if rag.answer_cache is not None else None,
+        "llm_scheduler": llm_scheduler.stats(),
+        "search_cache": rag.search_cache.stats() if rag.search_cache is not None else None,
+        "search_pits": rag.pit_stats(),
+        "source_depths": rag.source_depths.stats(),
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus-Metriken: Dauer je Verarbeitungsschritt (Quelle, Suchtyp), je Endpunkt sowie LLM-Tokens und Tokens/s.
+    """
+    if not METRICS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="prometheus_client ist nicht installiert")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/api/sources")
-def list_sources():
+async def list_sources():
     """
     Listet alle konfigurierten Indices/Datenquellen auf.
     """
@@ -59,65 +212,209 @@ def list_sources():
         ]
     )
 
+@app.get("/api/document/{index}/{doc_id}", response_model=SearchResult)
+async def get_document(index: str, doc_id: str):
+    """
+    Lädt ein einzelnes Dokument inkl. content nach, z.B. nach einer Suche mit includeContent=False.
+    """
+    hit = await rag.get_document(index, doc_id)
+    if hit is None:
+        raise HTTPException(status_code=404, detail=f"Dokument {index}/{doc_id} nicht gefunden")
+    return to_search_results([hit])[0]
+
 @app.post("/api/generate", response_model=LLMResponse)
-def generate_llm_response(query: LLMQuery):
+async def generate_llm_response(query: LLMQuery):
     """
     Anfrage an das LLM senden und Antwort generieren
     """
     try:
-        result = rag.query_languageModel(query.prompt)
+        result = await rag.query_languageModel(query.prompt, *llm_options(query))
         return LLMResponse(response=result)
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM-Fehler: {str(e)}")
         
+@app.post("/api/generate/stream")
+async def generate_llm_response_stream(query: LLMQuery):
+    """
+    Wie /api/generate, streamt die Antwort aber tokenweise als Server-Sent Events.
+    """
+    priority, deadline = llm_options(query)
+    llm_scheduler.check_admission(priority)
+    return event_stream(stream_tokens(query.prompt, priority=priority, deadline=deadline))
+
 @app.post("/api/llm/doc_query", response_model=LLMResponse)
-def query_single_document(request: DocumentQueryRequest):
+async def query_single_document(request: DocumentQueryRequest):
     """
     LLM-Anfrage basierend auf einem bestimmten Elasticsearch-Dokument.
     """
+    priority, deadline = llm_options(request)
     try:
-        answer = rag.combined_query(
+        answer, context_tokens, cache_tier = await rag.combined_query(
             index=request.index,
             doc_id=request.doc_id,
-            user_query=request.user_query
+            user_query=request.user_query,
+            priority=priority,
+            deadline=deadline
         )
-        return LLMResponse(answer=answer)
+        return LLMResponse(response=answer, contextTokens=context_tokens, answerCache=cache_tier)
+    except LLMOverloadedError:
+        raise
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Interner Fehler: {str(e)}")
 
-@app.post("/api/search", response_model=SearchResponse)
-def search(req: SearchRequest):
+@app.post("/api/llm/doc_query/stream")
+async def query_single_document_stream(request: DocumentQueryRequest):
     """
-    Ein einziger Search-Endpoint, der
-     - Keyword-, Vektor- oder Hybrid-Suche ausführt
-     - optional eine generative RAG-Antwort anfordert
+    Wie /api/llm/doc_query, streamt die Antwort aber tokenweise als Server-Sent Events.
     """
-    # 1) Dokumente holen
-    if req.searchType == SearchType.keyword:
-        hits = []
-        for src in req.sources:
-            hits += rag.search_elasticsearch(req.query, index=src, max_results=req.topK)
-    elif req.searchType == SearchType.embedding:
-        hits = []
-        for src in req.sources:
-            hits += rag.vector_search_elasticsearch(src, req.query, top_k=req.topK)
-    else:  # hybrid
-        hits = []
-        for src in req.sources:
-        # simple hybrid: beide Modi kombinieren und nach score sortieren
-            hits += rag.hybrid_search_elasticsearch(src, req.query, top_k=req.topK)
+    priority, deadline = llm_options(request)
+    llm_scheduler.check_admission(priority)
+    try:
+        prompt, context_tokens = await rag.document_prompt(request.index, request.doc_id, request.user_query)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return event_stream(stream_tokens(
+        prompt, {"contextTokens": context_tokens}, [f"{request.index}/{request.doc_id}"], request.user_query,
+        priority, deadline, document_prompt_instructions()
+    ))
 
-    # 2) Optional: generative Antwort
-    answer = None
-    if req.enableGenerative:
-        # wir nutzen einfach die relevantesten Snippets als Prompt-Extension
-        snippets = "\n".join(f"{h['source']} — ID: {h.get('id','')}; " f"Titel: {h.get('title','')}; "    f"Summary: {h.get('summary','')}; "  "----" for h in hits[:req.generativeDocs])
-        payload = f"{req.promptExtension or ''}\n\nOriginal query: {req.query}\n\nSnippets:\n{snippets}"
-        answer = rag.query_languageModel(payload)
+async def run_search(req: SearchRequest) -> Tuple[List[dict], List[str], Optional[str]]:
+    """
+    Holt die Dokumente aller Quellen parallel; das Query-Embedding wird nur einmal berechnet.
+    Mit paginate bzw. cursor wird eine Seite geholt (siehe run_search_page), sonst ist nextCursor None.
+    """
+    set_search_type(req.searchType.value)
+    query_vector = None
+    if req.searchType != SearchType.keyword:
+        query_vector = await rag.encode_query(req.query)
 
-    # 3) Mapping auf das gemeinsame Result-DTO
+    if req.paginate or req.cursor:
+        return await run_search_page(req, query_vector)
+
+    async def search_source(src: str, depth: int):
+        if req.searchType == SearchType.keyword:
+            return await rag.search_elasticsearch(
+                req.query, index=src, max_results=depth, include_content=req.includeContent
+            )
+        elif req.searchType == SearchType.embedding and req.passageSearch:
+            return await rag.passage_search_elasticsearch(
+                src, req.query, top_k=depth, num_candidates=req.numCandidates,
+                passages_per_parent=req.passagesPerDocument, query_vector=query_vector,
+                include_content=req.includeContent
+            )
+        elif req.searchType == SearchType.embedding:
+            return await rag.vector_search_elasticsearch(
+                src, req.query, top_k=depth, mode=req.vectorMode,
+                num_candidates=req.numCandidates, query_vector=query_vector,
+                include_content=req.includeContent
+            )
+        else:  # hybrid
+            return await rag.hybrid_search_elasticsearch(
+                src, req.query, top_k=depth, mode=req.hybridMode,
+                window_size=req.rrfWindowSize, rank_constant=req.rrfRankConstant,
+                num_candidates=req.numCandidates, query_vector=query_vector,
+                include_content=req.includeContent, passages=req.passageSearch,
+                passages_per_parent=req.passagesPerDocument
+            )
+
+    # Globale Top-K über alle Quellen, jede Quelle nur so tief wie nötig abgefragt
+    hits, failed_sources = await rag.search_sources_top_k(
+        req.sources, search_source, req.topK or 10, req.searchType.name
+    )
+    return hits, failed_sources, None
+
+
+# Felder, die das Suchergebnis nicht beeinflussen und sich zwischen den Seiten ändern dürfen
+CURSOR_IGNORED_FIELDS = {
+    "cursor", "paginate", "enableGenerative", "promptExtension", "generativeDocs", "priority", "deadlineMs",
+    "includeTimings",
+}
+
+
+async def run_search_page(req: SearchRequest, query_vector: Optional[List[float]]) -> Tuple[List[dict], List[str], Optional[str]]:
+    """
+    Eine Seite mit bis zu topK Treffern pro Quelle über rag.search_page; der Zustand der Quellen
+    (Point-in-Time, search_after bzw. Offset) steckt im Cursor. Eine ausgefallene Quelle behält
+    ihren Zustand und wird mit der nächsten Seite erneut versucht.
+    """
+    fingerprint = request_fingerprint(req.model_dump(mode="json", exclude=CURSOR_IGNORED_FIELDS))
+    states = decode_cursor(req.cursor, fingerprint) if req.cursor else {}
+    next_states = dict(states)
+    # Die Seiten der Quellen nur zusammenführen; die Tiefe legt der Cursor fest. Normalisiert wird auf
+    # den besten Score der ersten Seite (im Cursor), damit die Scores über alle Seiten vergleichbar sind
+    best_scores = {}
+
+    async def search_source(src: str):
+        results, next_states[src] = await rag.search_page(
+            src, req.searchType.name, req.query, req.topK or 10, states.get(src),
+            query_vector=query_vector, vector_mode=req.vectorMode, hybrid_mode=req.hybridMode,
+            num_candidates=req.numCandidates, window_size=req.rrfWindowSize, rank_constant=req.rrfRankConstant,
+            passages=req.passageSearch, passages_per_parent=req.passagesPerDocument,
+            include_content=req.includeContent
+        )
+        best_scores[src] = next_states[src].get("best")
+        return results
+
+    hits, failed_sources = await rag.search_sources_top_k(
+        req.sources, lambda src, _: search_source(src), (req.topK or 10) * len(req.sources), req.searchType.name,
+        adaptive=False, best_scores=best_scores
+    )
+    if all(next_states.get(src, {}).get("done") for src in req.sources):
+        return hits, failed_sources, None
+    return hits, failed_sources, encode_cursor(fingerprint, next_states)
+
+
+async def generative_prompt(req: SearchRequest, hits: List[dict]) -> Tuple[str, int]:
+    """
+    Prompt für die generative Antwort aus den relevantesten Treffern. Summary bzw. Passagen
+    (bei der Passagen-Suche) werden per ContextBuilder auf das Token-Budget gekürzt.
+
+    Returns:
+        Tuple[str, int]: Prompt und Anzahl seiner Tokens.
+    """
+    sources = [
+        {
+            "label": f"{h['source']} — ID: {h.get('id','')}; Titel: {h.get('title','')}",
+            "passages": h.get("passages"),
+            "text": h.get("summary") or "",
+        }
+        for h in hits[:req.generativeDocs]
+    ]
+    template = generative_template(req, req.query)
+    with stage("context"):
+        context = await asyncio.to_thread(context_builder.build, req.query, sources, SYSTEM_PROMPT + "\n" + template)
+    return template + context.text, context.tokens
+
+
+def generative_template(req: SearchRequest, query: str) -> str:
+    # Prompt der generativen Antwort ohne Kontext
+    return f"{req.promptExtension or ''}\n\nOriginal query: {query}\n\nSnippets:\n"
+
+
+def generative_instructions(req: SearchRequest) -> str:
+    # Prompt-Teile ohne Frage und Kontext, für den Schlüssel des Antwort-Caches
+    return SYSTEM_PROMPT + "\n" + generative_template(req, "")
+
+
+def generative_doc_refs(req: SearchRequest, hits: List[dict]) -> List[str]:
+    # Dokumente, aus denen der generative Prompt gebaut wird ("index/id", für den Antwort-Cache)
+    return [f"{h.get('index')}/{h.get('doc_id')}" for h in hits[:req.generativeDocs]]
+
+
+def request_timings(req: SearchRequest) -> Optional[Timings]:
+    # timings-Block der SearchResponse, nur auf Anfrage (includeTimings)
+    timings = current_timings()
+    return Timings(**timings.as_dict()) if req.includeTimings and timings is not None else None
+
+
+def to_search_results(hits: List[dict]) -> List[SearchResult]:
+    """
+    Mapping auf das gemeinsame Result-DTO
+    """
     results = []
     for h in hits:
         src = h["source"]
@@ -133,9 +430,195 @@ def search(req: SearchRequest):
                 created=h.get("created") if "created" in h else None,
                 creator=h.get("creator") if "creator" in h else None,
                 score=h["score"],
-                content=h.get("content")
+                rawScore=h.get("raw_score"),
+                content=h.get("content"),
+                docId=h.get("doc_id"),
+                passages=h.get("passages")
             )
        )
+    return results
+
+
+@app.post("/api/search", response_model=SearchResponse)
+async def search(req: SearchRequest):
+    """
+    Ein einziger Search-Endpoint, der
+     - Keyword-, Vektor- oder Hybrid-Suche ausführt
+     - optional eine generative RAG-Antwort anfordert
+    """
+    # 1) Dokumente holen – alle Quellen parallel
+    hits, failed_sources, next_cursor = await run_search(req)
+
+    # 2) Optional: generative Antwort
+    answer, context_tokens, cache_tier = None, None, None
+    if req.enableGenerative:
+        prompt, context_tokens = await generative_prompt(req, hits)
+        answer, cache_tier = await rag.cached_answer(
+            prompt, generative_doc_refs(req, hits), req.query, *llm_options(req), generative_instructions(req)
+        )
+
+    # 3) Mapping auf das gemeinsame Result-DTO
+    with stage("serialize"):
+        results = to_search_results(hits)
+
+    return SearchResponse(
+        results=results, answer=answer, failedSources=failed_sources, contextTokens=context_tokens, answerCache=cache_tier,
+        timings=request_timings(req), nextCursor=next_cursor
+    )
+
+
+@app.post("/api/search/stream")
+async def search_stream(req: SearchRequest):
+    """
+    Wie /api/search, aber als Server-Sent Events:
+     - 'hits': die Treffer (SearchResponse ohne answer), sobald die Suche fertig ist
+     - 'token': die Tokens der generativen Antwort (nur bei enableGenerative)
+     - 'done' bzw. 'error' zum Abschluss
+    """
+    if req.enableGenerative:
+        llm_scheduler.check_admission(LLMPriority[req.priority.value])
+    hits, failed_sources, next_cursor = await run_search(req)
+    prompt, context_tokens = await generative_prompt(req, hits) if req.enableGenerative else (None, None)
+    with stage("serialize"):
+        results = to_search_results(hits)
+    response = SearchResponse(
+        results=results, failedSources=failed_sources, contextTokens=context_tokens, timings=request_timings(req),
+        nextCursor=next_cursor
+    )
+
+    async def events():
+        yield sse_event("hits", response.model_dump(mode="json"))
+        if req.enableGenerative:
+            async for event in stream_tokens(
+                prompt, {"contextTokens": context_tokens}, generative_doc_refs(req, hits), req.query,
+                *llm_options(req), generative_instructions(req)
+            ):
+                yield event
+        else:
+            yield sse_event("done", {})
+
+    return event_stream(events())
+
+
+def batch_line(index: int, response: Optional[SearchResponse] = None, error: Optional[dict] = None) -> str:
+    # Eine NDJSON-Zeile von /api/search/batch
+    line = {"index": index}
+    if response is not None:
+        line["response"] = response.model_dump(mode="json")
+    if error is not None:
+        line["error"] = error
+    return json.dumps(line, ensure_ascii=False) + "\n"
+
+
+async def run_search_batch(batch: BatchSearchRequest, concurrency: int, chunk_size: int) -> AsyncIterator[Tuple[int, str]]:
+    """
+    Beantwortet alle Anfragen des Batches und liefert (index, NDJSON-Zeile), sobald eine Anfrage fertig ist.
+
+    Die Query-Embeddings aller Anfragen entstehen in einem model.encode, die Suchen je Anfrage und
+    Quelle laufen gebündelt als _msearch (BatchSearch). Jede Quelle wird mit voller topK abgefragt,
+    die Treffer werden wie bei /api/search zur globalen Top-K zusammengeführt. Generative Antworten
+    laufen mit Priorität bulk, höchstens concurrency gleichzeitig.
+    """
+    requests = batch.requests
+    vector_queries = [req.query for req in requests if req.searchType != SearchType.keyword]
+    vectors = await rag.encode_queries(vector_queries) if vector_queries else {}
+
+    searcher = BatchSearch(rag, chunk_size=chunk_size, concurrency=concurrency)
+    units = [
+        searcher.plan(
+            (i, src), src, req.searchType.name, req.query, vectors.get(req.query), req.topK or 10,
+            vector_mode=req.vectorMode, hybrid_mode=req.hybridMode, num_candidates=req.numCandidates,
+            window_size=req.rrfWindowSize, rank_constant=req.rrfRankConstant, passages=req.passageSearch,
+            passages_per_parent=req.passagesPerDocument, include_content=req.includeContent
+        )
+        for i, req in enumerate(requests)
+        for src in dict.fromkeys(req.sources)
+    ]
+
+    results: List[Dict[str, List[dict]]] = [{} for _ in requests]
+    failed: List[List[str]] = [[] for _ in requests]
+    pending = [len(set(req.sources)) for req in requests]
+    lines: asyncio.Queue = asyncio.Queue()
+    generation_slots = asyncio.Semaphore(concurrency)
+
+    async def finish(i: int) -> None:
+        req = requests[i]
+        hits = merge_top_k(
+            {src: normalize_scores(results[i][src]) for src in dict.fromkeys(req.sources) if src in results[i]},
+            req.topK or 10
+        )
+        failed_sources = [src for src in dict.fromkeys(req.sources) if src in failed[i]]
+        answer, context_tokens, cache_tier, error = None, None, None, None
+        if req.enableGenerative:
+            try:
+                async with generation_slots:
+                    prompt, context_tokens = await generative_prompt(req, hits)
+                    answer, cache_tier = await rag.cached_answer(
+                        prompt, generative_doc_refs(req, hits), req.query, LLMPriority.bulk, llm_options(req)[1],
+                        generative_instructions(req)
+                    )
+            except LLMOverloadedError as e:
+                error = {"detail": str(e), "status": e.status_code, "retryAfter": e.retry_after}
+            except Exception as e:
+                error = {"detail": f"LLM-Fehler: {str(e)}"}
+        response = SearchResponse(
+            results=to_search_results(hits), answer=answer, failedSources=failed_sources,
+            contextTokens=context_tokens, answerCache=cache_tier
+        )
+        lines.put_nowait((i, batch_line(i, response, error)))
+
+    async def search_all() -> None:
+        generations = []
+        for i in [i for i, count in enumerate(pending) if count == 0]:
+            generations.append(asyncio.create_task(finish(i)))
+        async for (i, src), result in searcher.run(units):
+            if isinstance(result, BaseException):
+                print(f"Fehler bei Quelle {src} (Batch-Anfrage {i}): {result}")
+                failed[i].append(src)
+            else:
+                results[i][src] = result
+            pending[i] -= 1
+            if pending[i] == 0:
+                generations.append(asyncio.create_task(finish(i)))
+        await asyncio.gather(*generations)
+
+    producer = asyncio.create_task(search_all())
+    producer.add_done_callback(lambda _: lines.put_nowait(None))
+    try:
+        while (item := await lines.get()) is not None:
+            yield item
+        producer.result()
+    finally:
+        producer.cancel()
+
+
+@app.post("/api/search/batch")
+async def search_batch(batch: BatchSearchRequest):
+    """
+    Viele Suchanfragen in einem Aufruf (Evaluation, Bulk-Jobs), Antwort als NDJSON mit einer Zeile
+    {"index": i, "response": SearchResponse} pro Anfrage, bei abgewiesener generativer Antwort
+    zusätzlich "error". order legt fest, ob die Zeilen in der Reihenfolge der Anfragen oder
+    sobald eine Anfrage fertig ist kommen.
+    """
+    max_requests = int(os.getenv("BATCH_SEARCH_MAX_REQUESTS", "10000"))
+    if len(batch.requests) > max_requests:
+        raise HTTPException(status_code=413, detail=f"Höchstens {max_requests} Anfragen pro Batch")
+    if any(req.paginate or req.cursor for req in batch.requests):
+        raise HTTPException(status_code=400, detail="paginate/cursor werden im Batch nicht unterstützt")
+    concurrency = batch.concurrency or int(os.getenv("BATCH_SEARCH_CONCURRENCY", "4"))
+    chunk_size = batch.chunkSize or int(os.getenv("BATCH_SEARCH_CHUNK_SIZE", "100"))
 
-    return SearchResponse(results=results, answer=answer)
+    async def ndjson():
+        buffered: Dict[int, str] = {}
+        next_index = 0
+        async for i, line in run_search_batch(batch, concurrency, chunk_size):
+            if batch.order == BatchOrder.completion:
+                yield line
+                continue
+            # Reihenfolge der Anfragen: vorzeitig fertige Zeilen puffern
+            buffered[i] = line
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
 
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
@@ -0,0 +1,53 @@
+import argparse
+import json
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from services.encoder_backend import ENCODER_BACKENDS, PARITY_SENTENCES, load_sentence_transformer, parity_check
+from services.rag_service import DEFAULT_EMBEDDING_MODEL
+
+load_dotenv()
+
+
+def encode_latency_ms(model, sentences, repeats: int) -> float:
+    """
+    Mittlere Latenz für das Encoding einer einzelnen Query (wie im Suchpfad), in Millisekunden.
+    """
+    model.encode(sentences[:1], convert_to_numpy=True)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        for sentence in sentences:
+            model.encode([sentence], convert_to_numpy=True)
+    return (time.perf_counter() - started) / (repeats * len(sentences)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Vergleicht ein Encoder-Backend mit der PyTorch-Referenz (Kosinus-Übereinstimmung und Latenz)."
+    )
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--backend", choices=[b for b in ENCODER_BACKENDS if b != "torch"], default="onnx-int8")
+    parser.add_argument("--threshold", type=float, default=0.99,
+                        help="Minimale Kosinus-Übereinstimmung pro Satz, damit der Check besteht")
+    parser.add_argument("--repeats", type=int, default=5, help="Wiederholungen für die Latenzmessung (0 = keine)")
+    args = parser.parse_args()
+
+    reference = load_sentence_transformer(args.model, "torch")
+    candidate = load_sentence_transformer(args.model, args.backend)
+    result = parity_check(args.model, args.backend, threshold=args.threshold,
+                          reference=reference, candidate=candidate)
+
+    if args.repeats > 0 and "error" not in result:
+        result["latency_ms"] = {
+            "torch": encode_latency_ms(reference, PARITY_SENTENCES, args.repeats),
+            args.backend: encode_latency_ms(candidate, PARITY_SENTENCES, args.repeats),
+        }
+
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import os
+
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch
+
+from services.file_ingestion import FileIngestionPipeline, IngestManifest
+
+load_dotenv()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Indiziert die PDFs eines Verzeichnisses (z.B. Netzlaufwerk) seitenweise in den Dateien-Index."
+    )
+    parser.add_argument("root", nargs="?", default=os.getenv("FILES_ROOT"), help="Zu crawlendes Verzeichnis")
+    parser.add_argument("--host", default=os.getenv("ELASTICSEARCH_URI", "http://localhost:9200"))
+    parser.add_argument("--user", default=os.getenv("ELASTIC_USERNAME", "elastic"))
+    parser.add_argument("--password", default=os.getenv("ELASTIC_PASSWORD", "password"))
+    parser.add_argument("--index", default=os.getenv("FILES_INDEX", "content-network-drive"))
+    parser.add_argument("--manifest", default=os.getenv("FILES_MANIFEST", "files_manifest.json"),
+                        help="JSON-Datei mit mtime/Größe/Hash der bereits indizierten Dateien")
+    parser.add_argument("--workers", type=int, default=0, help="Prozesse für die Extraktion (Standard: Anzahl Kerne)")
+    parser.add_argument("--max-pending", type=int, default=0,
+                        help="Dateien gleichzeitig in Extraktion (Standard: 2 x workers)")
+    parser.add_argument("--chunk-size", type=int, default=200, help="Dokumente pro Bulk-Request")
+    parser.add_argument("--prune", action="store_true",
+                        help="Seiten von Dateien löschen, die es unter root nicht mehr gibt")
+    args = parser.parse_args()
+    if not args.root:
+        parser.error("Verzeichnis angeben (Argument root oder FILES_ROOT)")
+
+    es = Elasticsearch(args.host, basic_auth=(args.user, args.password), request_timeout=60)
+    pipeline = FileIngestionPipeline(
+        es, args.index, IngestManifest(args.manifest),
+        workers=args.workers, max_pending=args.max_pending, chunk_size=args.chunk_size,
+    )
+    stats = pipeline.run(args.root, prune=args.prune)
+    print(
+        f"Fertig in {stats['seconds']:.0f}s: {stats['seen']} Dateien, {stats['indexed']} indiziert, "
+        f"{stats['unchanged']} unverändert, {stats['failed']} fehlgeschlagen; "
+        f"{stats['pages']} Seiten geschrieben, {stats['deleted_pages']} gelöscht."
+    )
+
+
+if __name__ == "__main__":
+    main()
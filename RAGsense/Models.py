@@ -1,9 +1,9 @@
 from datetime import date
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field
-from services.rag_service import SourceType
+from services.rag_service import HybridMode, SourceType, VectorSearchMode
 
 # ──────────────────────────────────────────────────────────────────────────────
 #  Models
@@ -14,6 +14,11 @@ class SearchType(str, Enum):
     hybrid = "Hybrid"
 
 
+class Priority(str, Enum):
+    interactive = "interactive"
+    bulk = "bulk"
+
+
 class SearchRequest(BaseModel):
     query: str = Field(..., example="Suchbegriff")
     sources: List[str] = Field(..., example=["wiki", "jira"])
@@ -21,7 +26,7 @@ class SearchRequest(BaseModel):
         ..., description="Art der Suche"
     )
     topK: Optional[int] = Field(
-        10, description="Anzahl Top-K (bei embedding oder hybrid)"
+        10, description="Anzahl Top-K über alle Quellen (globale Top-K); bei paginate die Seitengröße pro Quelle"
     )
     enableGenerative: bool = Field(
         False, description="Generative Antwort (RAG) ein-/ausschalten"
@@ -33,6 +38,48 @@ class SearchRequest(BaseModel):
     generativeDocs: Optional[int] = Field(
         1, description="Anzahl der Genutzten Ergebnisse für generative Antworten"
     )
+    vectorMode: VectorSearchMode = Field(
+        VectorSearchMode.knn,
+        description="kNN (HNSW, approximativ) oder Exact (script_score über alle Dokumente) bei Embedding-Suche"
+    )
+    numCandidates: Optional[int] = Field(
+        None, ge=1, le=10000, description="Kandidaten pro Shard bei kNN-Suche (Standard: 10 x topK, mind. 100, höchstens 10000)"
+    )
+    hybridMode: HybridMode = Field(
+        HybridMode.weighted,
+        description="Weighted (script_score über alle Dokumente, wie bisher) oder RRF (begrenzte BM25- und kNN-Abfrage mit Rank Fusion)"
+    )
+    rrfWindowSize: int = Field(
+        50, description="Anzahl Treffer pro Teilabfrage (BM25 und kNN) bei RRF"
+    )
+    rrfRankConstant: int = Field(
+        60, description="Rangkonstante k in 1 / (k + rank) bei RRF"
+    )
+    includeContent: bool = Field(
+        True, description="content mitliefern; bei False kann er per /api/document/{index}/{docId} nachgeladen werden"
+    )
+    passageSearch: bool = Field(
+        False,
+        description="Vektor-Teil (embedding, hybrid RRF) über den Passagen-Index; liefert die besten Passagen je Dokument"
+    )
+    passagesPerDocument: int = Field(
+        3, description="Anzahl der besten Passagen pro Dokument bei passageSearch"
+    )
+    priority: Priority = Field(
+        Priority.interactive, description="Priorität der LLM-Anfrage: interaktive Anfragen werden vor bulk-Jobs bedient"
+    )
+    deadlineMs: Optional[int] = Field(
+        None, description="Maximale Wartezeit auf einen freien LLM-Slot in ms (Standard: LLM_QUEUE_TIMEOUT), danach 503"
+    )
+    includeTimings: bool = Field(
+        False, description="Dauer der Verarbeitungsschritte und LLM-Token-Zahlen als timings mitliefern"
+    )
+    paginate: bool = Field(
+        False, description="Cursor-Pagination: topK ist die Seitengröße pro Quelle, die Antwort enthält nextCursor"
+    )
+    cursor: Optional[str] = Field(
+        None, description="nextCursor der vorherigen Seite (mit sonst unveränderter Anfrage) für die nächste Seite"
+    )
 
 
 class SearchResult(BaseModel):
@@ -43,15 +90,62 @@ class SearchResult(BaseModel):
     summary: Optional[str]
     created: Optional[date]
     creator: Optional[str]
-    score: float
+    score: float = Field(..., description="Score normalisiert je Quelle (0..1), über alle Quellen vergleichbar")
+    rawScore: Optional[float] = Field(None, description="Ursprünglicher Score der Quelle (BM25, Cosine + 1, RRF, ...)")
     content: object
+    docId: Optional[str] = None
+    passages: Optional[List[str]] = None
+
+
+class Timings(BaseModel):
+    stages: Dict[str, float] = Field(
+        default_factory=dict, description="Dauer je Schritt in ms, z.B. 'encode', 'es.jira', 'prepare.wiki', 'llm'"
+    )
+    llmPromptTokens: Optional[int] = None
+    llmCompletionTokens: Optional[int] = None
+    llmTokensPerSecond: Optional[float] = None
 
 
 class SearchResponse(BaseModel):
     results: List[SearchResult]
     answer: Optional[str] = None
+    failedSources: List[str] = Field(
+        default_factory=list, description="Quellen, die nicht rechtzeitig geantwortet haben (Ergebnis ist unvollständig)"
+    )
+    contextTokens: Optional[int] = Field(
+        None, description="Anzahl der Tokens im Prompt der generativen Antwort (nach Kürzung auf das Token-Budget)"
+    )
+    answerCache: Optional[str] = Field(
+        None, description="Generative Antwort aus dem Cache: 'exact' oder 'semantic'; None bei neu generierter Antwort"
+    )
+    timings: Optional[Timings] = Field(
+        None, description="Nur bei includeTimings: Dauer der Verarbeitungsschritte bis zur Serialisierung"
+    )
+    nextCursor: Optional[str] = Field(
+        None, description="Nur bei paginate bzw. cursor: Cursor für die nächste Seite; None, wenn alle Quellen erschöpft sind"
+    )
 
 
+class BatchOrder(str, Enum):
+    request = "request"
+    completion = "completion"
+
+
+class BatchSearchRequest(BaseModel):
+    requests: List[SearchRequest] = Field(
+        ..., description="Suchanfragen (ohne paginate/cursor); jede wird wie bei /api/search beantwortet"
+    )
+    order: BatchOrder = Field(
+        BatchOrder.request,
+        description="Reihenfolge der NDJSON-Zeilen: wie in requests oder sobald eine Anfrage fertig ist"
+    )
+    chunkSize: Optional[int] = Field(
+        None, description="Teilabfragen pro _msearch-Anfrage (Standard: BATCH_SEARCH_CHUNK_SIZE)"
+    )
+    concurrency: Optional[int] = Field(
+        None, description="Gleichzeitige _msearch- bzw. LLM-Anfragen (Standard: BATCH_SEARCH_CONCURRENCY)"
+    )
+
 class SourceInfo(BaseModel):
     name: str = Field(
         ...,
@@ -90,11 +184,23 @@ class LLMQuery(BaseModel):
         example="Was ist die Hauptstadt von Frankreich?",
         description="Der vollständige Prompt, der an das Sprachmodell gesendet werden soll."
     )
+    priority: Priority = Field(
+        Priority.interactive, description="Priorität der LLM-Anfrage: interaktive Anfragen werden vor bulk-Jobs bedient"
+    )
+    deadlineMs: Optional[int] = Field(
+        None, description="Maximale Wartezeit auf einen freien LLM-Slot in ms (Standard: LLM_QUEUE_TIMEOUT), danach 503"
+    )
 
 
 # Antwort-Modell (optional, aber sauber)
 class LLMResponse(BaseModel):
     response: str
+    contextTokens: Optional[int] = Field(
+        None, description="Anzahl der Tokens im Prompt (nach Kürzung auf das Token-Budget)"
+    )
+    answerCache: Optional[str] = Field(
+        None, description="Antwort aus dem Cache: 'exact' oder 'semantic'; None bei neu generierter Antwort"
+    )
 
 
 # Anfrage-Datenmodell
@@ -103,5 +209,11 @@ class DocumentQueryRequest(BaseModel):
     doc_id: str = Field(..., example="JIRA-123", description="Eindeutige Dokument-ID im angegebenen Index.")
     user_query: str = Field(..., example="Worum geht es in diesem Dokument?",
                             description="Benutzerfrage oder Zusammenfassungsanfrage zum Dokument.")
+    priority: Priority = Field(
+        Priority.interactive, description="Priorität der LLM-Anfrage: interaktive Anfragen werden vor bulk-Jobs bedient"
+    )
+    deadlineMs: Optional[int] = Field(
+        None, description="Maximale Wartezeit auf einen freien LLM-Slot in ms (Standard: LLM_QUEUE_TIMEOUT), danach 503"
+    )
 
 # ──────────────────────────────────────────────────────────────────────────────
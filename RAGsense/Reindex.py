@@ -1,60 +1,262 @@
+import argparse
+import json
+import os
+import threading
+import time
 
-from elasticsearch import Elasticsearch, helpers
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch, NotFoundError, helpers
 
-ES_HOST = "http://localhost:9200"  
-SOURCE_INDEX = "connector-jira_v2"
-TARGET_INDEX = "jira"
-SCROLL = "2m"
-BATCH_SIZE = 100
-
-es = Elasticsearch(ES_HOST, basic_auth=("elastic", "password"), request_timeout=60)
+load_dotenv()
 
-if not es.indices.exists(index=TARGET_INDEX):
-    es.indices.create(index=TARGET_INDEX)
+SCROLL = "2m"
 
-query = {
-    "query": {
-        "bool": {
-            "must_not": {
-                "term": {
-                    "Type.keyword": "Attachment"
-                }
+# Attachments werden nicht mit übertragen
+QUERY = {
+    "bool": {
+        "must_not": {
+            "term": {
+                "Type.keyword": "Attachment"
             }
         }
     }
 }
 
-resp = es.search(
-    index=SOURCE_INDEX,
-    scroll=SCROLL,
-    size=BATCH_SIZE,
-    body=query
-)
 
-scroll_id = resp["_scroll_id"]
-hits = resp["hits"]["hits"]
-total = 0
+class Throttle:
+    """
+    Einfacher Token-Bucket: begrenzt die Anzahl übertragener Dokumente pro Sekunde über alle Worker.
+    """
+
+    def __init__(self, docs_per_second: float):
+        self._rate = docs_per_second
+        self._next_free = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, docs: int) -> None:
+        if self._rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_free)
+            self._next_free = start + docs / self._rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class Checkpoint:
+    """
+    Fortschritt des Reindex als JSON-Datei, damit ein Neustart dort weitermacht.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self.data = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
 
-while hits:
-    actions = []
+    def update(self, **values) -> None:
+        with self._lock:
+            self.data.update(values)
+            if not self._path:
+                return
+            tmp_path = self._path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+            os.replace(tmp_path, self._path)
 
-    for doc in hits:
-        source = doc["_source"]
+    def remove(self) -> None:
+        if self._path and os.path.exists(self._path):
+            os.remove(self._path)
 
-        actions.append({
-            "_op_type": "index",
-            "_index": TARGET_INDEX,
-            "_id": doc["_id"],
-            "_source": source
+
+def prepare_target(es: Elasticsearch, target: str, checkpoint: Checkpoint) -> None:
+    """
+    Legt den Zielindex an und schaltet Refresh und Replicas für die Dauer der Kopie ab.
+    Die ursprünglichen Werte landen im Checkpoint, damit sie auch nach einem Abbruch wiederhergestellt werden.
+    """
+    if not es.indices.exists(index=target):
+        es.indices.create(index=target)
+
+    if "original_settings" not in checkpoint.data:
+        settings = es.indices.get_settings(index=target, include_defaults=True)
+        index_settings = next(iter(settings.values()))
+        def setting(name, default):
+            return (index_settings.get("settings", {}).get("index", {}).get(name)
+                    or index_settings.get("defaults", {}).get("index", {}).get(name)
+                    or default)
+        checkpoint.update(original_settings={
+            "refresh_interval": setting("refresh_interval", "1s"),
+            "number_of_replicas": setting("number_of_replicas", "1"),
         })
 
-    helpers.bulk(es, actions)
-    total += len(hits)
-    print(f"{total} Dokumente uebertragen...")
+    es.indices.put_settings(index=target, settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+
+
+def restore_target(es: Elasticsearch, target: str, checkpoint: Checkpoint) -> None:
+    original = checkpoint.data.get("original_settings", {"refresh_interval": "1s", "number_of_replicas": "1"})
+    es.indices.put_settings(index=target, settings={"index": original})
+    es.indices.refresh(index=target)
+    print(f"Einstellungen von '{target}' wiederhergestellt: {original}")
+
+
+def reindex_server(es: Elasticsearch, source: str, target: str, batch_size: int, requests_per_second: float,
+                   checkpoint: Checkpoint, poll_interval: float) -> int:
+    """
+    Serverseitiges _reindex mit slices=auto; der Task wird gepollt und im Checkpoint vermerkt.
+    """
+    task_id = checkpoint.data.get("task_id")
+    if task_id:
+        try:
+            es.tasks.get(task_id=task_id)
+            print(f"Setze Überwachung von Task {task_id} fort.")
+        except NotFoundError:
+            task_id = None
+
+    if not task_id:
+        task = es.reindex(
+            source={"index": source, "query": QUERY, "size": batch_size},
+            dest={"index": target, "op_type": "index"},
+            slices="auto",
+            requests_per_second=requests_per_second if requests_per_second > 0 else -1,
+            wait_for_completion=False,
+        )
+        task_id = task["task"]
+        checkpoint.update(task_id=task_id)
+        print(f"Reindex-Task {task_id} gestartet.")
+
+    while True:
+        status = es.tasks.get(task_id=task_id)
+        progress = status.get("task", {}).get("status", {})
+        done = progress.get("created", 0) + progress.get("updated", 0)
+        print(f"{done}/{progress.get('total', '?')} Dokumente uebertragen...")
+        if status.get("completed"):
+            response = status.get("response", {})
+            if response.get("failures"):
+                raise RuntimeError(f"Reindex mit Fehlern beendet: {response['failures'][:5]}")
+            return response.get("created", 0) + response.get("updated", 0)
+        time.sleep(poll_interval)
+
+
+def reindex_client(es: Elasticsearch, source: str, target: str, slices: int, batch_size: int,
+                   requests_per_second: float, checkpoint: Checkpoint) -> int:
+    """
+    Clientseitige Kopie per Sliced Scroll: ein Worker-Thread pro Slice, gemeinsam gedrosselt.
+    Abgeschlossene Slices werden im Checkpoint vermerkt und beim Neustart übersprungen.
+    """
+    throttle = Throttle(requests_per_second)
+    completed = set(checkpoint.data.get("completed_slices", []))
+    counts = dict(checkpoint.data.get("slice_counts", {}))
+    errors = []
+
+    def copy_slice(slice_id: int) -> None:
+        body = {"query": QUERY}
+        if slices > 1:
+            body["slice"] = {"id": slice_id, "max": slices}
+        resp = es.search(index=source, scroll=SCROLL, size=batch_size, body=body)
+        scroll_id = resp["_scroll_id"]
+        hits = resp["hits"]["hits"]
+        total = 0
+        try:
+            while hits and not errors:
+                throttle.wait(len(hits))
+                actions = [
+                    {"_op_type": "index", "_index": target, "_id": doc["_id"], "_source": doc["_source"]}
+                    for doc in hits
+                ]
+                helpers.bulk(es, actions)
+                total += len(hits)
+                resp = es.scroll(scroll_id=scroll_id, scroll=SCROLL)
+                scroll_id = resp["_scroll_id"]
+                hits = resp["hits"]["hits"]
+        finally:
+            es.clear_scroll(scroll_id=scroll_id)
+
+        if errors:
+            # Ein anderer Worker ist fehlgeschlagen; dieser Slice ist unvollständig und läuft beim Neustart erneut
+            return
+        counts[str(slice_id)] = total
+        completed.add(slice_id)
+        checkpoint.update(completed_slices=sorted(completed), slice_counts=counts)
+        print(f"Slice {slice_id + 1}/{slices} abgeschlossen: {total} Dokumente uebertragen.")
+
+    def worker(slice_id: int) -> None:
+        try:
+            copy_slice(slice_id)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=worker, args=(slice_id,), name=f"reindex-slice-{slice_id}")
+        for slice_id in range(slices) if slice_id not in completed
+    ]
+    if len(threads) < slices:
+        print(f"{slices - len(threads)} Slices bereits laut Checkpoint erledigt.")
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return sum(counts.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Kopiert einen Index (ohne Attachments) in einen Zielindex.",
+        epilog="Während der Kopie sind Refresh und Replicas des Zielindex abgeschaltet. Die ursprünglichen Werte "
+               "werden nach Abschluss, aber auch nach einem Fehler oder Abbruch (Strg+C) wiederhergestellt. "
+               "Der Checkpoint bleibt dann erhalten: ein erneuter Start setzt die Kopie fort. Im server-Modus "
+               "läuft der Reindex-Task nach einem Abbruch in Elasticsearch weiter.",
+    )
+    parser.add_argument("--host", default=os.getenv("ELASTICSEARCH_URI", "http://localhost:9200"))
+    parser.add_argument("--user", default=os.getenv("ELASTIC_USERNAME", "elastic"))
+    parser.add_argument("--password", default=os.getenv("ELASTIC_PASSWORD", "password"))
+    parser.add_argument("--source", default=os.getenv("REINDEX_SOURCE_INDEX", "connector-jira_v2"))
+    parser.add_argument("--target", default=os.getenv("REINDEX_TARGET_INDEX", os.getenv("JIRA_INDEX", "jira")))
+    parser.add_argument("--mode", choices=["server", "client"], default="server",
+                        help="server: _reindex mit slices=auto; client: Sliced Scroll mit parallelen Workern")
+    parser.add_argument("--slices", type=int, default=0,
+                        help="Anzahl Slices/Worker im client-Modus (Standard: Anzahl Primär-Shards)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--requests-per-second", type=float, default=-1,
+                        help="Drosselung in Dokumenten pro Sekunde (-1 = ungedrosselt)")
+    parser.add_argument("--checkpoint", default="reindex_checkpoint.json")
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    es = Elasticsearch(args.host, basic_auth=(args.user, args.password), request_timeout=60)
+    checkpoint = Checkpoint(args.checkpoint)
+
+    prepare_target(es, args.target, checkpoint)
+    started = time.time()
+
+    try:
+        if args.mode == "server":
+            total = reindex_server(es, args.source, args.target, args.batch_size, args.requests_per_second, checkpoint, args.poll_interval)
+        else:
+            slices = args.slices
+            if slices <= 0:
+                settings = es.indices.get_settings(index=args.source)
+                slices = int(next(iter(settings.values()))["settings"]["index"]["number_of_shards"])
+            total = reindex_client(es, args.source, args.target, slices, args.batch_size,
+                                   args.requests_per_second, checkpoint)
+    except BaseException:
+        # Fehler oder Strg+C: Zielindex nicht ohne Replicas und Refresh zurücklassen; der Checkpoint bleibt
+        try:
+            restore_target(es, args.target, checkpoint)
+        except Exception as e:
+            print(f"Einstellungen von '{args.target}' konnten nicht wiederhergestellt werden: {e}")
+        print(f"Reindex abgebrochen, ein erneuter Start mit '{args.checkpoint}' setzt die Kopie fort.")
+        raise
+
+    restore_target(es, args.target, checkpoint)
+    checkpoint.remove()
+    print(f"Reindexing abgeschlossen. Insgesamt uebertragen: {total} Dokumente in {time.time() - started:.0f}s.")
 
-    resp = es.scroll(scroll_id=scroll_id, scroll=SCROLL)
-    scroll_id = resp["_scroll_id"]
-    hits = resp["hits"]["hits"]
 
-es.clear_scroll(scroll_id=scroll_id)
-print(f"Reindexing abgeschlossen. Insgesamt uebertragen: {total} Dokumente.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Offline-Benchmark für Such- und Generierungspfad (ohne Netzwerk, ohne Modelle).
+
+    python -m benchmarks run [--docs 5000] [--requests 200] [--concurrency 8] ...
+    python -m benchmarks compare results/alt.json results/neu.json
+
+Elasticsearch, LLM-Server und Embedding-Modell werden durch lokale Fakes ersetzt (siehe fake_*.py).
+Die Ergebnisse landen als JSON unter benchmarks/results/<commit>.json und lassen sich zwischen
+Commits vergleichen. Aus dem Verzeichnis RAGsense starten.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.corpus import SyntheticCorpus
+from benchmarks.fake_elasticsearch import FakeElasticsearch, FakeElasticsearchServer
+from benchmarks.fake_encoder import FakeEncoder
+from benchmarks.fake_llm import FakeLLMServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+SEARCH_TYPES = {"keyword": "Keyword", "embedding": "Embedding", "hybrid": "Hybrid"}
+# Kennzahlen, die compare gegenüberstellt; bei Durchsatz ist größer besser
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "throughput_rps", "docs_per_second", "us_per_hit_p50")
+HIGHER_IS_BETTER = ("throughput_rps", "docs_per_second")
+
+
+def git_revision() -> dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True).strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = "unknown", False
+    return {"commit": commit, "dirty": dirty}
+
+
+def configure_environment(llm_url: str) -> None:
+    # Muss vor dem ersten Import von services/API_RAGsense passieren (Konfiguration wird beim Import gelesen)
+    os.environ.update({
+        "JIRA_INDEX": "jira",
+        "WIKI_INDEX": "wiki",
+        "LLM_URL": llm_url,
+        "LLM_MODEL": "benchmark",
+        "ANSWER_CACHE": "off",
+        "SEARCH_CACHE": "off",
+        "CONTEXT_TOKENIZER": "heuristic",
+        "EMBEDDING_BACKEND": "torch",
+        "EMBEDDING_WARMUP": "false",
+    })
+
+
+def run(args: argparse.Namespace) -> None:
+    llm = FakeLLMServer(args.llm_tokens, args.llm_first_token_ms, args.llm_token_ms).start()
+    configure_environment(llm.url)
+    from benchmarks import scenarios
+
+    revision = git_revision()
+    corpus = SyntheticCorpus(args.docs, args.seed)
+    encoder = FakeEncoder(dims=args.dims, batch_ms=args.encoder_batch_ms, text_ms=args.encoder_text_ms)
+    scenarios.register_encoder(encoder)
+    results = {
+        **revision,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k != "func"},
+    }
+
+    if "prepare" in args.only:
+        print("prepare_search_results ...")
+        results["prepare_search_results"] = scenarios.bench_prepare_search_results(corpus)
+
+    if "embedding-index" in args.only:
+        print(f"compute_embeddings_for_elasticsearch_index ({args.docs} Dokumente) ...")
+        results["embedding_index"] = scenarios.bench_embedding_index(corpus, args.batch_size, args.write_threads)
+
+    search_scenarios = [name for name in ("keyword", "embedding", "hybrid", "generative") if name in args.only]
+    if search_scenarios:
+        es = FakeElasticsearch(latency_ms=args.es_latency_ms)
+        started = time.perf_counter()
+        scenarios.load_search_corpus(es, corpus, encoder)
+        print(f"Korpus geladen ({args.docs} Dokumente, {time.perf_counter() - started:.1f}s).")
+        server = FakeElasticsearchServer(es).start()
+        queries = corpus.queries(args.requests + 5)
+        results["search"] = {}
+        try:
+            for name in search_scenarios:
+                generative = name == "generative"
+                search_type = "Hybrid" if generative else SEARCH_TYPES[name]
+                requests = queries[: max(args.generative_requests, 0) + 5] if generative else queries
+                print(f"/api/search {name} ...")
+                results["search"][name] = asyncio.run(scenarios.bench_search(
+                    server.url, search_type, requests, args.concurrency, args.top_k, generative
+                ))
+        finally:
+            server.stop()
+    llm.stop()
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{revision['commit']}{'-dirty' if revision['dirty'] else ''}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({k: v for k, v in results.items() if k not in ("config", "platform")}, indent=2))
+    print(f"Ergebnis gespeichert: {output}")
+
+
+def flatten(data: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif key in COMPARED_METRICS:
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(args: argparse.Namespace) -> None:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+    print(f"{baseline.get('commit')} -> {candidate.get('commit')}")
+    old, new = flatten(baseline), flatten(candidate)
+    regressions = 0
+    for metric in sorted(old.keys() & new.keys()):
+        before, after = old[metric], new[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        worse = change < -args.tolerance if metric.endswith(HIGHER_IS_BETTER) else change > args.tolerance
+        regressions += worse
+        print(f"{metric:50s} {before:12.2f} {after:12.2f} {change:+8.1f}%{'  <-- schlechter' if worse else ''}")
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Benchmarks ausführen und Ergebnis als JSON speichern")
+    run_parser.add_argument("--only", nargs="+",
+                            choices=["keyword", "embedding", "hybrid", "generative", "embedding-index", "prepare"],
+                            default=["keyword", "embedding", "hybrid", "generative", "embedding-index", "prepare"])
+    run_parser.add_argument("--docs", type=int, default=5000, help="Größe des synthetischen Korpus (Jira + Wiki)")
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--requests", type=int, default=200, help="Suchanfragen pro Suchtyp")
+    run_parser.add_argument("--generative-requests", type=int, default=40, help="Anfragen mit generativer Antwort")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--top-k", type=int, default=10)
+    run_parser.add_argument("--dims", type=int, default=512, help="Dimension der Fake-Embeddings")
+    run_parser.add_argument("--encoder-batch-ms", type=float, default=2.0, help="Simulierte Encoder-Zeit pro Batch")
+    run_parser.add_argument("--encoder-text-ms", type=float, default=0.5, help="Simulierte Encoder-Zeit pro Text")
+    run_parser.add_argument("--es-latency-ms", type=float, default=0.0, help="Simulierte Serverzeit pro ES-Request")
+    run_parser.add_argument("--llm-tokens", type=int, default=64, help="Länge der Fake-LLM-Antwort in Tokens")
+    run_parser.add_argument("--llm-first-token-ms", type=float, default=50.0)
+    run_parser.add_argument("--llm-token-ms", type=float, default=10.0)
+    run_parser.add_argument("--batch-size", type=int, default=128, help="Batch-Größe für compute_embeddings")
+    run_parser.add_argument("--write-threads", type=int, default=2)
+    run_parser.add_argument("--output", help="Ergebnisdatei (Standard: benchmarks/results/<commit>.json)")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = sub.add_parser("compare", help="Zwei Ergebnisdateien vergleichen")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--tolerance", type=float, default=10.0, help="Erlaubte Verschlechterung in Prozent")
+    compare_parser.add_argument("--fail-on-regression", action="store_true")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import random
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+# Wortschatz im Stil der Jira-Tickets und Wiki-Seiten (Deutsch/Englisch gemischt)
+VOCABULARY = (
+    "VPN Zugang Mitarbeiter Drucker Rechnung Export DATEV Login Passwort Fehler Timeout Upload PDF Backup "
+    "Server Datenbank Migration Release Version Update Kunde Vertrag Lizenz Schnittstelle API Token "
+    "Zertifikat Firewall Netzwerk Laufwerk Freigabe Berechtigung Gruppe Benutzer Konto Mail Kalender "
+    "Termin Besprechung Onboarding Checkliste Hardware Laptop Monitor Schulung Handbuch Anleitung "
+    "Konfiguration Installation Deployment Pipeline Build Test Staging Produktion Monitoring Alarm "
+    "Performance Latenz Speicher CPU Index Suche Elasticsearch Wiki Jira Ticket Sprint Board Epic "
+    "report issue error crash slow fails nightly job cron schedule retry queue worker cache proxy "
+    "invoice customer contract license renewal import mapping field schema tenant cluster node shard"
+).split()
+
+PEOPLE = ["Max Mustermann", "Erika Musterfrau", "Jan Schmidt", "Lea Wagner", "Tom Becker", "Sara Hoffmann"]
+PROJECTS = ["IT-Service", "Buchhaltung", "Vertrieb", "Plattform", "Support"]
+
+
+class SyntheticCorpus:
+    """
+    Reproduzierbarer Korpus aus Jira-Tickets und Wiki-Seiten (gleicher seed -> gleiche Dokumente)
+    samt passenden Suchanfragen.
+    """
+
+    def __init__(self, size: int = 10000, seed: int = 42, wiki_share: float = 0.3):
+        self.size = size
+        self.seed = seed
+        self.wiki_size = int(size * wiki_share)
+        self.jira_size = size - self.wiki_size
+
+    def _words(self, rng: random.Random, low: int, high: int) -> str:
+        return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(low, high)))
+
+    def _created(self, rng: random.Random) -> str:
+        return (date(2020, 1, 1) + timedelta(days=rng.randint(0, 2000))).isoformat() + "T09:30:00.000+0000"
+
+    def jira_documents(self) -> Iterator[Tuple[str, dict]]:
+        rng = random.Random(f"{self.seed}-jira")
+        for n in range(self.jira_size):
+            key = f"BENCH-{n + 1}"
+            yield key, {
+                "Key": key,
+                "Type": "Ticket",
+                "Issue": {
+                    "summary": self._words(rng, 4, 10).capitalize(),
+                    "description": ". ".join(self._words(rng, 8, 20) for _ in range(rng.randint(2, 12))),
+                    "creator": {"displayName": rng.choice(PEOPLE)},
+                    "assignee": {"displayName": rng.choice(PEOPLE)},
+                    "created": self._created(rng),
+                    "project": {"name": rng.choice(PROJECTS)},
+                },
+            }
+
+    def wiki_documents(self) -> Iterator[Tuple[str, dict]]:
+        rng = random.Random(f"{self.seed}-wiki")
+        for n in range(self.wiki_size):
+            page_id = str(100000 + n)
+            yield page_id, {
+                "title": self._words(rng, 2, 6).title(),
+                "body": "\n".join(self._words(rng, 10, 30) + "." for _ in range(rng.randint(3, 25))),
+                "url": f"http://wiki/pages/viewpage.action?pageId={page_id}",
+                "author": {"displayName": rng.choice(PEOPLE)},
+                "createdDate": self._created(rng),
+            }
+
+    def queries(self, count: int) -> List[str]:
+        """
+        Suchanfragen mit 2 bis 5 Wörtern; jede Anfrage ist eindeutig, damit der Query-Cache nicht alles abfängt.
+        """
+        rng = random.Random(f"{self.seed}-queries")
+        return [f"{self._words(rng, 2, 5)} {n}" for n in range(count)]
+
+    def indices(self) -> Dict[str, Iterator[Tuple[str, dict]]]:
+        return {"jira": self.jira_documents(), "wiki": self.wiki_documents()}
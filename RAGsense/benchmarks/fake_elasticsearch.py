@@ -0,0 +1,613 @@
+import json
+import math
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+")
+_NO_TEXT_FIELDS = {"embedding", "embedding_text_hash", "embedding_model", "embedding_chunks"}
+
+
+class FakeIndex:
+    """
+    Dokumente eines Index im Speicher. Vektor-Matrix und invertierter Index für die Suche
+    werden nach Änderungen beim nächsten Suchzugriff neu aufgebaut.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.docs: Dict[str, dict] = {}
+        self.versions: Dict[str, int] = {}
+        self.index_total = 0
+        self.delete_total = 0
+        self.mappings: dict = {"properties": {}}
+        self._dirty = True
+        self.ids: List[str] = []
+        self.vectors: Optional[np.ndarray] = None
+        self.has_vector = np.zeros(0, dtype=bool)
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths = np.zeros(0)
+
+    def put(self, doc_id: str, source: dict) -> str:
+        result = "updated" if doc_id in self.docs else "created"
+        self.docs[doc_id] = source
+        self.versions[doc_id] = self.versions.get(doc_id, 0) + 1
+        self.index_total += 1
+        self._dirty = True
+        return result
+
+    def delete(self, doc_id: str) -> bool:
+        if self.docs.pop(doc_id, None) is None:
+            return False
+        self.versions.pop(doc_id, None)
+        self.delete_total += 1
+        self._dirty = True
+        return True
+
+    def prepare(self) -> None:
+        if not self._dirty:
+            return
+        self.ids = list(self.docs)
+        self.postings, lengths = {}, []
+        dims = None
+        for pos, doc_id in enumerate(self.ids):
+            source = self.docs[doc_id]
+            counts = Counter(_WORD_RE.findall(_text_of(source).lower()))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, {})[pos] = tf
+            if dims is None and source.get("embedding") is not None:
+                dims = len(source["embedding"])
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.vectors, self.has_vector = None, np.zeros(len(self.ids), dtype=bool)
+        if dims:
+            self.vectors = np.zeros((len(self.ids), dims), dtype=np.float32)
+            for pos, doc_id in enumerate(self.ids):
+                vector = self.docs[doc_id].get("embedding")
+                if vector is not None:
+                    self.vectors[pos] = vector
+                    self.has_vector[pos] = True
+            norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+            self.vectors /= np.maximum(norms, 1e-12)
+        self._dirty = False
+
+
+def _text_of(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, dict):
+        return " ".join(_text_of(v) for k, v in value.items() if k not in _NO_TEXT_FIELDS)
+    if isinstance(value, list) and value and not isinstance(value[0], (int, float)):
+        return " ".join(_text_of(v) for v in value)
+    return ""
+
+
+def _get_path(source: dict, path: str):
+    for key in path.split("."):
+        if not isinstance(source, dict):
+            return None
+        source = source.get(key)
+    return source
+
+
+def filter_source(source: dict, includes: Optional[List[str]], excludes: Optional[List[str]]) -> dict:
+    """
+    Vereinfachter _source-Filter: includes/excludes als (gepunktete) Feldpfade ohne Wildcards.
+    """
+    if includes:
+        result: dict = {}
+        for path in includes:
+            value = _get_path(source, path)
+            if value is None:
+                continue
+            target = result
+            keys = path.split(".")
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+        source = result
+    if excludes:
+        source = {k: v for k, v in source.items() if k not in excludes}
+    return source
+
+
+class ElasticsearchError(Exception):
+    def __init__(self, status: int, error_type: str, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.body = {"error": {"type": error_type, "reason": reason, "root_cause": [{"type": error_type, "reason": reason}]},
+                     "status": status}
+
+
+class FakeElasticsearch:
+    """
+    Stand-in für einen Elasticsearch-Knoten: hält die Indizes im Speicher und beantwortet die
+    Abfragen, die der RAG-Service stellt (query_string/BM25, knn, script_score mit cosineSimilarity,
+    bool mit must_not, PIT + search_after auch für bewertete Abfragen, mget, msearch, bulk, _stats). latency_ms simuliert die Serverzeit.
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.indices: Dict[str, FakeIndex] = {}
+        self._pits: Dict[str, List[Tuple[str, str]]] = {}
+        self._lock = threading.RLock()
+        self.requests = 0
+
+    def index(self, name: str) -> FakeIndex:
+        with self._lock:
+            if name not in self.indices:
+                self.indices[name] = FakeIndex(name)
+            return self.indices[name]
+
+    def load(self, name: str, documents) -> int:
+        """
+        Lädt Dokumente (Iterator aus (id, source)) direkt in den Index, ohne HTTP.
+        """
+        index = self.index(name)
+        count = 0
+        with self._lock:
+            for doc_id, source in documents:
+                index.put(doc_id, source)
+                count += 1
+        return count
+
+    def _existing(self, expression: str) -> List[FakeIndex]:
+        names = list(self.indices) if expression in ("_all", "*", "") else expression.split(",")
+        missing = [n for n in names if n not in self.indices]
+        if missing:
+            raise ElasticsearchError(404, "index_not_found_exception", f"no such index [{missing[0]}]")
+        return [self.indices[n] for n in names]
+
+    # ── Suche ────────────────────────────────────────────────────────────────
+    def search(self, expression: Optional[str], body: dict, params: dict) -> dict:
+        started = time.perf_counter()
+        body = dict(body or {})
+        for key in ("size", "from"):
+            if key in params:
+                body[key] = int(params[key])
+        source_spec = body.get("_source", True)
+        includes = params.get("_source_includes", "").split(",") if params.get("_source_includes") else None
+        excludes = params.get("_source_excludes", "").split(",") if params.get("_source_excludes") else None
+        if isinstance(source_spec, dict):
+            includes = source_spec.get("includes", includes)
+            excludes = source_spec.get("excludes", excludes)
+        if "collapse" in body:
+            raise ElasticsearchError(400, "illegal_argument_exception", "collapse wird vom Fake nicht unterstützt")
+
+        with self._lock:
+            if "pit" in body:
+                return self._pit_search(body, source_spec, includes, excludes, started)
+
+            scored: List[Tuple[float, FakeIndex, int]] = []
+            for index in self._existing(expression or "_all"):
+                index.prepare()
+                scores, mask = self._scores(index, body)
+                positions = np.nonzero(mask)[0]
+                scored += [(float(scores[p]), index, int(p)) for p in positions]
+
+        scored.sort(key=lambda item: -item[0])
+        offset, size = int(body.get("from", 0)), int(body.get("size", 10))
+        hits = [
+            self._hit(index, index.ids[pos], score, source_spec, includes, excludes)
+            for score, index, pos in scored[offset:offset + size]
+        ]
+        return self._response(hits, len(scored), started)
+
+    def _pit_search(self, body, source_spec, includes, excludes, started) -> dict:
+        pit_id = body["pit"]["id"]
+        if pit_id not in self._pits:
+            raise ElasticsearchError(404, "search_context_missing_exception", f"No search context found for id [{pit_id}]")
+        snapshot = self._pits[pit_id]
+        if "query" in body or "knn" in body:
+            return self._scored_pit_search(pit_id, snapshot, body, source_spec, includes, excludes, started)
+        start = int(body["search_after"][0]) + 1 if body.get("search_after") else 0
+        size = int(body.get("size", 10))
+        hits = []
+        for pos in range(start, min(start + size, len(snapshot))):
+            name, doc_id = snapshot[pos]
+            index = self.indices.get(name)
+            if index is None or doc_id not in index.docs:
+                continue
+            hit = self._hit(index, doc_id, 1.0, source_spec, includes, excludes)
+            hit["sort"] = [pos]
+            hits.append(hit)
+        response = self._response(hits if size else [], len(snapshot), started)
+        response["pit_id"] = pit_id
+        return response
+
+    def _scored_pit_search(self, pit_id, snapshot, body, source_spec, includes, excludes, started) -> dict:
+        # Abfrage auf dem Stand des PIT: nur Dokumente aus dem Snapshot, sortiert nach Score und Snapshot-Position
+        positions = {entry: pos for pos, entry in enumerate(snapshot)}
+        scored: List[Tuple[float, int, FakeIndex, str]] = []
+        for name in dict.fromkeys(name for name, _ in snapshot):
+            index = self.indices.get(name)
+            if index is None:
+                continue
+            index.prepare()
+            scores, mask = self._scores(index, body)
+            for p in np.nonzero(mask)[0]:
+                pos = positions.get((name, index.ids[p]))
+                if pos is not None:
+                    scored.append((float(scores[p]), pos, index, index.ids[p]))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        if body.get("search_after"):
+            after_score, after_pos = body["search_after"]
+            scored = [item for item in scored if (-item[0], item[1]) > (-after_score, after_pos)]
+        offset, size = int(body.get("from", 0)), int(body.get("size", 10))
+        hits = []
+        for score, pos, index, doc_id in scored[offset:offset + size]:
+            hit = self._hit(index, doc_id, score, source_spec, includes, excludes)
+            if "sort" in body:
+                hit["sort"] = [score, pos]
+            hits.append(hit)
+        response = self._response(hits, len(scored), started)
+        response["pit_id"] = pit_id
+        return response
+
+    def _hit(self, index: FakeIndex, doc_id: str, score: float, source_spec, includes, excludes) -> dict:
+        hit = {"_index": index.name, "_id": doc_id, "_score": score}
+        if source_spec is not False:
+            hit["_source"] = filter_source(index.docs[doc_id], includes, excludes)
+        return hit
+
+    @staticmethod
+    def _response(hits: List[dict], total: int, started: float) -> dict:
+        return {
+            "took": int((time.perf_counter() - started) * 1000),
+            "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {
+                "total": {"value": total, "relation": "eq"},
+                "max_score": hits[0]["_score"] if hits else None,
+                "hits": hits,
+            },
+        }
+
+    def _scores(self, index: FakeIndex, body: dict) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(index.ids)
+        if "query" in body:
+            scores, mask = self._query(index, body["query"])
+        elif "knn" in body:
+            scores, mask = np.zeros(n, dtype=np.float32), np.zeros(n, dtype=bool)
+        else:
+            scores, mask = np.ones(n, dtype=np.float32), np.ones(n, dtype=bool)
+
+        knn_sections = body.get("knn")
+        if knn_sections:
+            for knn in knn_sections if isinstance(knn_sections, list) else [knn_sections]:
+                allowed = self._query(index, knn["filter"])[1] if knn.get("filter") else np.ones(n, dtype=bool)
+                similarity = (self._cosine(index, knn["query_vector"]) + 1) / 2
+                allowed &= index.has_vector
+                candidates = np.nonzero(allowed)[0]
+                k = int(knn.get("k", 10))
+                if len(candidates) > k:
+                    candidates = candidates[np.argpartition(-similarity[candidates], k - 1)[:k]]
+                scores[candidates] += similarity[candidates]
+                mask[candidates] = True
+        return scores, mask
+
+    @staticmethod
+    def _cosine(index: FakeIndex, query_vector: List[float]) -> np.ndarray:
+        if index.vectors is None:
+            raise ElasticsearchError(400, "illegal_argument_exception", "field [embedding] is not a dense_vector")
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        return index.vectors @ vector
+
+    def _query(self, index: FakeIndex, query: dict) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(index.ids)
+        (kind, spec), = query.items()
+        if kind == "match_all":
+            return np.ones(n, dtype=np.float32), np.ones(n, dtype=bool)
+        if kind in ("query_string", "match", "multi_match"):
+            text = spec.get("query") if isinstance(spec, dict) and "query" in spec else next(iter(spec.values()))
+            if isinstance(text, dict):
+                text = text.get("query", "")
+            scores = self._bm25(index, str(text))
+            return scores, scores > 0
+        if kind == "term":
+            (field, value), = spec.items()
+            value = value.get("value") if isinstance(value, dict) else value
+            mask = np.array([_get_path(index.docs[i], field) == value for i in index.ids], dtype=bool)
+            return mask.astype(np.float32), mask
+        if kind == "terms":
+            (field, values), = spec.items()
+            mask = np.array([_get_path(index.docs[i], field) in values for i in index.ids], dtype=bool)
+            return mask.astype(np.float32), mask
+        if kind == "exists":
+            mask = np.array([_get_path(index.docs[i], spec["field"]) is not None for i in index.ids], dtype=bool)
+            return mask.astype(np.float32), mask
+        if kind == "ids":
+            wanted = set(spec.get("values", []))
+            mask = np.array([i in wanted for i in index.ids], dtype=bool)
+            return mask.astype(np.float32), mask
+        if kind == "bool":
+            return self._bool(index, spec)
+        if kind == "script_score":
+            base, mask = self._query(index, spec.get("query", {"match_all": {}}))
+            params = spec["script"].get("params", {})
+            cosine = self._cosine(index, params["query_vector"]) + 1.0
+            mask = mask & index.has_vector
+            if "bm25_weight" in params:
+                scores = params["bm25_weight"] * base + params["embedding_weight"] * cosine
+            else:
+                scores = cosine
+            return scores.astype(np.float32), mask
+        raise ElasticsearchError(400, "parsing_exception", f"unknown query [{kind}]")
+
+    def _bool(self, index: FakeIndex, spec: dict) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(index.ids)
+        scores, mask = np.zeros(n, dtype=np.float32), np.ones(n, dtype=bool)
+
+        def clauses(name):
+            value = spec.get(name, [])
+            return value if isinstance(value, list) else [value]
+
+        for clause in clauses("must"):
+            s, m = self._query(index, clause)
+            scores += s
+            mask &= m
+        for clause in clauses("filter"):
+            mask &= self._query(index, clause)[1]
+        for clause in clauses("must_not"):
+            mask &= ~self._query(index, clause)[1]
+        should = clauses("should")
+        if should:
+            any_should = np.zeros(n, dtype=bool)
+            for clause in should:
+                s, m = self._query(index, clause)
+                scores += np.where(m, s, 0)
+                any_should |= m
+            if not clauses("must") and not clauses("filter"):
+                mask &= any_should
+        return scores, mask
+
+    @staticmethod
+    def _bm25(index: FakeIndex, text: str, k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+        n = len(index.ids)
+        scores = np.zeros(n, dtype=np.float32)
+        if n == 0:
+            return scores
+        avg_len = float(index.lengths.mean()) or 1.0
+        for term in set(_WORD_RE.findall(text.lower())):
+            postings = index.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            positions = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            norm = k1 * (1 - b + b * index.lengths[positions] / avg_len)
+            scores[positions] += idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def count(self, expression: Optional[str], query: Optional[dict] = None) -> dict:
+        with self._lock:
+            indices = self._existing(expression or "_all")
+            if query is None:
+                return {"count": sum(len(index.docs) for index in indices)}
+            for index in indices:
+                index.prepare()
+            return {"count": int(sum(self._query(index, query)[1].sum() for index in indices))}
+
+    # ── Dokument-APIs ────────────────────────────────────────────────────────
+    def open_pit(self, expression: str) -> dict:
+        with self._lock:
+            snapshot = [(index.name, doc_id) for index in self._existing(expression) for doc_id in index.docs]
+            pit_id = uuid.uuid4().hex
+            self._pits[pit_id] = snapshot
+        return {"id": pit_id}
+
+    def close_pit(self, pit_id: str) -> dict:
+        with self._lock:
+            found = self._pits.pop(pit_id, None) is not None
+        return {"succeeded": found, "num_freed": int(found)}
+
+    def get(self, name: str, doc_id: str, params: dict) -> dict:
+        with self._lock:
+            index = self._existing(name)[0]
+            if doc_id not in index.docs:
+                raise ElasticsearchError(404, "not_found", f"[{doc_id}] not found")
+            return self._doc(index, doc_id, params.get("_source") != "false", params)
+
+    def _doc(self, index: FakeIndex, doc_id: str, with_source, params: dict) -> dict:
+        if doc_id not in index.docs:
+            return {"_index": index.name, "_id": doc_id, "found": False}
+        doc = {"_index": index.name, "_id": doc_id, "_version": index.versions[doc_id], "found": True}
+        if with_source is not False:
+            includes = params.get("_source_includes")
+            excludes = params.get("_source_excludes")
+            if isinstance(with_source, dict):
+                includes, excludes = with_source.get("includes", includes), with_source.get("excludes", excludes)
+            if isinstance(includes, str):
+                includes = includes.split(",")
+            if isinstance(excludes, str):
+                excludes = excludes.split(",")
+            doc["_source"] = filter_source(index.docs[doc_id], includes, excludes)
+        return doc
+
+    def mget(self, name: Optional[str], body: dict, params: dict) -> dict:
+        with_source = params.get("_source") != "false"
+        docs = body.get("docs") or [{"_id": doc_id} for doc_id in body.get("ids", [])]
+        result = []
+        with self._lock:
+            for spec in docs:
+                index_name = spec.get("_index", name)
+                index = self.indices.get(index_name)
+                if index is None:
+                    result.append({"_index": index_name, "_id": spec["_id"], "found": False})
+                    continue
+                result.append(self._doc(index, spec["_id"], spec.get("_source", with_source), params))
+        return {"docs": result}
+
+    def bulk(self, default_index: Optional[str], lines: List[dict]) -> dict:
+        started = time.perf_counter()
+        items, errors = [], False
+        with self._lock:
+            i = 0
+            while i < len(lines):
+                (op, meta), = lines[i].items()
+                i += 1
+                index = self.index(meta.get("_index", default_index))
+                doc_id = meta.get("_id") or uuid.uuid4().hex
+                item = {"_index": index.name, "_id": doc_id}
+                if op == "delete":
+                    item["status"] = 200 if index.delete(doc_id) else 404
+                    item["result"] = "deleted" if item["status"] == 200 else "not_found"
+                else:
+                    source = lines[i]
+                    i += 1
+                    if op == "update":
+                        if doc_id not in index.docs:
+                            item.update(status=404, error={"type": "document_missing_exception", "reason": "document missing"})
+                            errors = True
+                            items.append({op: item})
+                            continue
+                        index.put(doc_id, {**index.docs[doc_id], **source.get("doc", {})})
+                        item.update(status=200, result="updated")
+                    else:
+                        result = index.put(doc_id, source)
+                        item.update(status=201 if result == "created" else 200, result=result)
+                    item["_version"] = index.versions[doc_id]
+                items.append({op: item})
+        return {"took": int((time.perf_counter() - started) * 1000), "errors": errors, "items": items}
+
+    def stats(self, expression: Optional[str]) -> dict:
+        # Nur die Indexing- und Refresh-Zähler; Schreibzugriffe sind sofort suchbar (ein Refresh je Schreibzugriff)
+        indices = self._existing(expression or "_all")
+        index_total = sum(i.index_total for i in indices)
+        delete_total = sum(i.delete_total for i in indices)
+        primaries = {
+            "indexing": {"index_total": index_total, "delete_total": delete_total},
+            "refresh": {"total": index_total + delete_total, "external_total": index_total + delete_total},
+        }
+        return {"_all": {"primaries": primaries, "total": primaries}}
+
+    def msearch(self, default_index: Optional[str], lines: List[dict]) -> dict:
+        responses = []
+        for header, body in zip(lines[0::2], lines[1::2]):
+            try:
+                index = header.get("index", default_index)
+                index = ",".join(index) if isinstance(index, list) else index
+                responses.append({**self.search(index, body, {}), "status": 200})
+            except ElasticsearchError as e:
+                responses.append(e.body)
+        return {"took": 0, "responses": responses}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeElasticsearchServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Optional[dict]) -> None:
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/vnd.elasticsearch+json;compatible-with=9")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self) -> None:
+        es = self.server.es
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        raw = self._body()
+        es.requests += 1
+        if es.latency_ms > 0:
+            time.sleep(es.latency_ms / 1000)
+
+        def body() -> dict:
+            return json.loads(raw) if raw.strip() else {}
+
+        def ndjson() -> List[dict]:
+            return [json.loads(line) for line in raw.splitlines() if line.strip()]
+
+        method = self.command
+        try:
+            if not parts:
+                return self._send(200, {"name": "fake", "cluster_name": "benchmark",
+                                        "version": {"number": "9.0.2"}, "tagline": "You Know, for Search"})
+            endpoint, name = parts[-1], (parts[0] if not parts[0].startswith("_") else None)
+            if endpoint == "_search":
+                return self._send(200, es.search(name, body(), params))
+            if endpoint == "_msearch":
+                return self._send(200, es.msearch(name, ndjson()))
+            if endpoint == "_bulk":
+                return self._send(200, es.bulk(name, ndjson()))
+            if endpoint == "_mget":
+                return self._send(200, es.mget(name, body(), params))
+            if endpoint == "_pit" and method == "POST":
+                return self._send(200, es.open_pit(name))
+            if endpoint == "_pit" and method == "DELETE":
+                return self._send(200, es.close_pit(body().get("id")))
+            if "_stats" in parts:
+                return self._send(200, es.stats(name))
+            if endpoint == "_refresh":
+                return self._send(200, {"_shards": {"total": 1, "successful": 1, "failed": 0}})
+            if endpoint == "_delete_by_query":
+                return self._send(200, {"deleted": 0, "failures": []})
+            if endpoint == "_count":
+                return self._send(200, es.count(name, body().get("query")))
+            if endpoint == "_mapping":
+                if method == "GET":
+                    return self._send(200, {i.name: {"mappings": i.mappings} for i in es._existing(name)})
+                es.index(name).mappings.setdefault("properties", {}).update(body().get("properties", {}))
+                return self._send(200, {"acknowledged": True})
+            if len(parts) == 3 and parts[1] == "_doc" and method == "GET":
+                return self._send(200, es.get(name, parts[2], params))
+            if len(parts) == 1:
+                if method == "HEAD":
+                    return self._send(200 if name in es.indices else 404, None)
+                if method == "PUT":
+                    if name in es.indices:
+                        raise ElasticsearchError(400, "resource_already_exists_exception", f"index [{name}] already exists")
+                    es.index(name).mappings = body().get("mappings", {"properties": {}})
+                    return self._send(200, {"acknowledged": True, "index": name})
+            raise ElasticsearchError(400, "illegal_argument_exception", f"{method} {url.path} wird vom Fake nicht unterstützt")
+        except ElasticsearchError as e:
+            return self._send(e.status, e.body if method != "HEAD" else None)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _dispatch
+
+
+class FakeElasticsearchServer(ThreadingHTTPServer):
+    """
+    HTTP-Server auf 127.0.0.1 (freier Port) vor einem FakeElasticsearch, damit die echten
+    Elasticsearch-Clients inklusive Serialisierung und Verbindungs-Pool gemessen werden.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, es: FakeElasticsearch):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.es = es
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self) -> "FakeElasticsearchServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-elasticsearch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,59 @@
+import re
+import threading
+import time
+import zlib
+from typing import Dict, List
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class FakeEncoder:
+    """
+    Ersatz für ein SentenceTransformer-Modell ohne Modelldateien.
+
+    Ein Text wird als normierte Summe deterministischer Zufallsvektoren seiner Wörter abgebildet,
+    sodass ähnliche Texte ähnliche Vektoren haben. Die Rechenzeit wird mit batch_ms pro Aufruf
+    plus text_ms pro Text simuliert (per sleep, wie bei torch/ONNX ohne GIL).
+    """
+
+    def __init__(self, dims: int = 512, batch_ms: float = 2.0, text_ms: float = 0.5, max_seq_length: int = 128):
+        self.dims = dims
+        self.batch_ms = batch_ms
+        self.text_ms = text_ms
+        self.max_seq_length = max_seq_length
+        self._word_vectors: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dims
+
+    def parameters(self):
+        return []
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+            vector = rng.standard_normal(self.dims).astype(np.float32)
+            with self._lock:
+                self._word_vectors[word] = vector
+        return vector
+
+    def embed(self, text: str) -> np.ndarray:
+        words = _WORD_RE.findall(text.lower())[: self.max_seq_length]
+        if not words:
+            return np.zeros(self.dims, dtype=np.float32)
+        vector = np.sum([self._word_vector(w) for w in words], axis=0)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def encode(self, sentences: List[str], batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        delay = (self.batch_ms * -(-len(texts) // max(batch_size, 1)) + self.text_ms * len(texts)) / 1000
+        if delay > 0:
+            time.sleep(delay)
+        embeddings = np.stack([self.embed(t) for t in texts]) if texts else np.zeros((0, self.dims), dtype=np.float32)
+        return embeddings[0] if single else embeddings
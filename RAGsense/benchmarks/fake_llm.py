@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+_WORDS = ("Die", "Antwort", "basiert", "auf", "den", "bereitgestellten", "Dokumenten", "und", "dem", "Ticket")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeLLMServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status: int, body: dict) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _chunk(self, data: str) -> None:
+        payload = data.encode("utf-8")
+        self.wfile.write(f"{len(payload):X}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self._json(200, {"object": "list", "data": [{"id": "benchmark", "object": "model", "owned_by": "fake"}]})
+        self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": "not found"}})
+
+        server = self.server
+        prompt_chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+        tokens = min(server.answer_tokens, request.get("max_tokens") or server.answer_tokens)
+        # Prefill: Zeit bis zum ersten Token wächst mit der Prompt-Länge (ca. 4 Zeichen pro Token)
+        first_token = (server.first_token_ms + server.prefill_ms_per_1k_tokens * prompt_chars / 4000) / 1000
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        words = [_WORDS[i % len(_WORDS)] + " " for i in range(tokens)]
+
+        if not request.get("stream"):
+            time.sleep(first_token + tokens * server.token_ms / 1000)
+            return self._json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(words)}}],
+                "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": tokens,
+                          "total_tokens": prompt_chars // 4 + tokens},
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(first_token)
+        for n, word in enumerate(words):
+            if n:
+                time.sleep(server.token_ms / 1000)
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": request.get("model"),
+                     "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+            self._chunk(f"data: {json.dumps(chunk)}\n\n")
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """
+    OpenAI-kompatibler Server (/v1/models, /v1/chat/completions mit und ohne stream) auf 127.0.0.1.
+    Die Antwortzeit folgt first_token_ms + prefill pro 1000 Prompt-Tokens + token_ms pro Antwort-Token.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, answer_tokens: int = 64, first_token_ms: float = 50.0, token_ms: float = 10.0,
+                 prefill_ms_per_1k_tokens: float = 20.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.answer_tokens = answer_tokens
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.prefill_ms_per_1k_tokens = prefill_ms_per_1k_tokens
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
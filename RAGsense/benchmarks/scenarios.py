@@ -0,0 +1,152 @@
+import asyncio
+import statistics
+import time
+from typing import Dict, List, Sequence
+
+import httpx
+import numpy as np
+
+import API_RAGsense as api
+from benchmarks.corpus import SyntheticCorpus
+from benchmarks.fake_elasticsearch import FakeElasticsearch, FakeElasticsearchServer
+from benchmarks.fake_encoder import FakeEncoder
+from services.async_rag_service import AsyncRAGService
+from services.rag_service import DEFAULT_EMBEDDING_MODEL, RAGService, extract_text, model_registry, prepare_search_results
+
+
+def latency_summary(latencies: Sequence[float], wall_seconds: float) -> Dict[str, float]:
+    """
+    p50/p95/p99/Mittelwert/Maximum in Millisekunden und Durchsatz in Anfragen pro Sekunde.
+    """
+    if not latencies:
+        return {"requests": 0}
+    ms = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "max_ms": float(ms.max()),
+        "throughput_rps": len(latencies) / wall_seconds if wall_seconds > 0 else 0.0,
+    }
+
+
+def register_encoder(encoder: FakeEncoder, model_name: str = DEFAULT_EMBEDDING_MODEL) -> None:
+    model_registry.register(model_name, encoder)
+
+
+def load_search_corpus(es: FakeElasticsearch, corpus: SyntheticCorpus, encoder: FakeEncoder) -> Dict[str, int]:
+    """
+    Lädt den Korpus samt Embeddings (wie von compute_embeddings berechnet) direkt in den Fake-Index.
+    """
+    counts = {}
+    for index_name, documents in corpus.indices().items():
+        counts[index_name] = es.load(index_name, (
+            (doc_id, {**source, "embedding": encoder.embed(extract_text(source, index_name)).tolist()})
+            for doc_id, source in documents
+        ))
+    return counts
+
+
+async def bench_search(
+    es_url: str,
+    search_type: str,
+    queries: List[str],
+    concurrency: int,
+    top_k: int = 10,
+    generative: bool = False,
+    warmup: int = 5,
+) -> Dict[str, float]:
+    """
+    Misst POST /api/search in-process (ASGI, ohne Netzwerk) mit concurrency gleichzeitigen Anfragen.
+    """
+    api.rag = AsyncRAGService(es_url, None, "elastic", "password")
+    transport = httpx.ASGITransport(app=api.app)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+        async def one(query: str, record: bool) -> None:
+            nonlocal errors
+            payload = {
+                "query": query,
+                "sources": ["jira", "wiki"],
+                "searchType": search_type,
+                "topK": top_k,
+                "enableGenerative": generative,
+                "generativeDocs": 3,
+                "includeContent": False,
+            }
+            async with semaphore:
+                started = time.perf_counter()
+                resp = await client.post("/api/search", json=payload)
+                elapsed = time.perf_counter() - started
+            if resp.status_code != 200 or resp.json().get("failedSources"):
+                errors += 1
+            elif record:
+                latencies.append(elapsed)
+
+        await asyncio.gather(*(one(q, False) for q in queries[:warmup]))
+        started = time.perf_counter()
+        await asyncio.gather(*(one(q, True) for q in queries[warmup:]))
+        wall = time.perf_counter() - started
+
+    await api.rag.close()
+    return {**latency_summary(latencies, wall), "errors": errors, "concurrency": concurrency}
+
+
+def bench_embedding_index(corpus: SyntheticCorpus, batch_size: int, write_threads: int) -> Dict[str, float]:
+    """
+    Misst compute_embeddings_for_elasticsearch_index (Dokumente/s) gegen einen eigenen Fake-Knoten
+    mit dem Korpus ohne Embeddings.
+    """
+    es = FakeElasticsearch()
+    for index_name, documents in corpus.indices().items():
+        es.load(index_name, documents)
+    server = FakeElasticsearchServer(es).start()
+    try:
+        rag = RAGService(server.url, None, "elastic", "password")
+        result = {}
+        total_docs, total_seconds = 0, 0.0
+        for index_name in ("jira", "wiki"):
+            started = time.perf_counter()
+            processed = rag.compute_embeddings_for_elasticsearch_index(
+                index_name, DEFAULT_EMBEDDING_MODEL, batch_size=batch_size,
+                show_progress=False, write_threads=write_threads,
+            )
+            seconds = time.perf_counter() - started
+            result[index_name] = {"docs": processed, "seconds": seconds,
+                                  "docs_per_second": processed / seconds if seconds > 0 else 0.0}
+            total_docs += processed
+            total_seconds += seconds
+        result["docs_per_second"] = total_docs / total_seconds if total_seconds > 0 else 0.0
+        return result
+    finally:
+        server.stop()
+
+
+def bench_prepare_search_results(corpus: SyntheticCorpus, hits_per_response: int = 50, repeats: int = 200) -> Dict[str, float]:
+    """
+    Kosten von prepare_search_results pro Treffer in Mikrosekunden (Median über repeats Durchläufe).
+    """
+    result = {}
+    for index_name, documents in corpus.indices().items():
+        hits = []
+        for doc_id, source in documents:
+            hits.append({"_index": index_name, "_id": doc_id, "_score": 1.0, "_source": source})
+            if len(hits) == hits_per_response:
+                break
+        response = {"hits": {"hits": hits}}
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            prepare_search_results(response, index_name, include_content=False)
+            timings.append((time.perf_counter() - started) / len(hits))
+        result[index_name] = {
+            "hits_per_response": len(hits),
+            "us_per_hit_p50": statistics.median(timings) * 1e6,
+            "us_per_hit_min": min(timings) * 1e6,
+        }
+    return result
@@ -0,0 +1,349 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from dotenv import load_dotenv
+from elasticsearch import BadRequestError, Elasticsearch, NotFoundError
+
+load_dotenv()
+
+
+def answer_key(model: str, prompt: str, doc_refs: List[str], instructions: str = "") -> str:
+    """
+    Schlüssel der exakten Stufe: Hash aus Modell, Prompt, Anweisungen und den (sortierten) Dokument-Referenzen.
+    """
+    payload = json.dumps([model, instructions, prompt, sorted(doc_refs)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def doc_set_key(model: str, doc_refs: List[str], instructions: str = "") -> str:
+    """
+    Schlüssel der semantischen Stufe: Antworten werden nur über dieselben Dokumente und mit denselben
+    Anweisungen wiederverwendet. instructions sind die Teile des Prompts ohne Frage und Kontext
+    (System-Prompt, Vorlage, promptExtension).
+    """
+    payload = json.dumps([model, instructions, sorted(set(doc_refs))], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerStore(ABC):
+    """
+    Ablage der Cache-Einträge. Ein Eintrag ist ein dict mit key, doc_set, model, answer,
+    versions (Referenz -> Dokumentversion), query_vector (Liste oder None) und created.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def put(self, entry: dict) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def candidates(self, doc_set: str) -> List[dict]:
+        """
+        Alle (nicht abgelaufenen) Einträge über denselben Dokumenten, für die semantische Stufe.
+        """
+
+
+class MemoryAnswerStore(AnswerStore):
+    """
+    LRU im Prozess, begrenzt auf max_entries Einträge mit TTL.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400):
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._by_doc_set: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["created"] + self._ttl < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, entry: dict) -> None:
+        with self._lock:
+            if entry["key"] in self._entries:
+                self._remove(entry["key"])
+            self._entries[entry["key"]] = entry
+            self._by_doc_set.setdefault(entry["doc_set"], set()).add(entry["key"])
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def candidates(self, doc_set: str) -> List[dict]:
+        now = time.time()
+        with self._lock:
+            keys = self._by_doc_set.get(doc_set, ())
+            return [self._entries[k] for k in keys if self._entries[k]["created"] + self._ttl >= now]
+
+    def _remove(self, key: str) -> None:
+        # Muss unter self._lock aufgerufen werden
+        entry = self._entries.pop(key)
+        keys = self._by_doc_set.get(entry["doc_set"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_doc_set[entry["doc_set"]]
+
+
+class SQLiteAnswerStore(AnswerStore):
+    """
+    Lokale SQLite-Datei; überlebt Neustarts und wird von allen Workern eines Hosts geteilt.
+    """
+
+    def __init__(self, path: str = "answer_cache.sqlite", ttl_seconds: float = 86400):
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " key TEXT PRIMARY KEY, doc_set TEXT NOT NULL, created REAL NOT NULL, entry TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_doc_set ON answers (doc_set)")
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entry FROM answers WHERE key = ? AND created >= ?", (key, time.time() - self._ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, entry: dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, doc_set, created, entry) VALUES (?, ?, ?, ?)",
+                (entry["key"], entry["doc_set"], entry["created"], json.dumps(entry, ensure_ascii=False)),
+            )
+            # Abgelaufene Einträge beim Schreiben aufräumen
+            self._conn.execute("DELETE FROM answers WHERE created < ?", (time.time() - self._ttl,))
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+
+    def candidates(self, doc_set: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry FROM answers WHERE doc_set = ? AND created >= ?", (doc_set, time.time() - self._ttl)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+class ElasticsearchAnswerStore(AnswerStore):
+    """
+    Elasticsearch-Index als gemeinsamer Cache für mehrere API-Instanzen.
+    Der Index wird beim ersten Schreiben angelegt; die Einträge selbst werden nicht indiziert.
+    """
+
+    def __init__(self, client: Elasticsearch, index_name: str = "rag-answer-cache", ttl_seconds: float = 86400):
+        self._client = client
+        self._index = index_name
+        self._ttl = ttl_seconds
+        self._index_ready = False
+
+    def _ensure_index(self) -> None:
+        if self._index_ready:
+            return
+        try:
+            self._client.indices.create(index=self._index, mappings={
+                "dynamic": False,
+                "properties": {
+                    "doc_set": {"type": "keyword"},
+                    "created": {"type": "double"},
+                    "entry": {"type": "object", "enabled": False},
+                },
+            })
+        except BadRequestError as e:
+            if e.error != "resource_already_exists_exception":
+                raise
+        self._index_ready = True
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            doc = self._client.get(index=self._index, id=key)
+        except NotFoundError:
+            return None
+        if doc["_source"]["created"] + self._ttl < time.time():
+            return None
+        return doc["_source"]["entry"]
+
+    def put(self, entry: dict) -> None:
+        self._ensure_index()
+        self._client.index(
+            index=self._index,
+            id=entry["key"],
+            document={"doc_set": entry["doc_set"], "created": entry["created"], "entry": entry},
+        )
+
+    def delete(self, key: str) -> None:
+        try:
+            self._client.delete(index=self._index, id=key)
+        except NotFoundError:
+            pass
+
+    def candidates(self, doc_set: str) -> List[dict]:
+        try:
+            resp = self._client.search(index=self._index, size=100, query={"bool": {"filter": [
+                {"term": {"doc_set": doc_set}},
+                {"range": {"created": {"gte": time.time() - self._ttl}}},
+            ]}})
+        except NotFoundError:
+            return []
+        return [hit["_source"]["entry"] for hit in resp["hits"]["hits"]]
+
+
+class AnswerCache:
+    """
+    Cache für LLM-Antworten mit zwei Stufen:
+
+    - exakt: gleicher Hash aus Modell, Prompt und Dokument-Referenzen ("index/id")
+    - semantisch (optional): gleiche Dokumente, gleiche Anweisungen und Query-Embedding mit
+      Kosinus-Ähnlichkeit >= threshold
+
+    Zu jedem Eintrag werden die Versionen der Quelldokumente gespeichert. Der Aufrufer prüft sie
+    bei einem Treffer gegen die aktuellen Versionen (siehe is_current) und verwirft veraltete Einträge.
+    """
+
+    def __init__(self, store: AnswerStore, semantic: bool = False, threshold: float = 0.95):
+        self.store = store
+        self.semantic = semantic
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(
+        self,
+        model: str,
+        prompt: str,
+        doc_refs: List[str],
+        query_vector: Optional[List[float]] = None,
+        instructions: str = "",
+    ) -> Optional[dict]:
+        """
+        Sucht einen Kandidaten (exakt, dann semantisch). Das Ergebnis enthält zusätzlich 'tier';
+        der Aufrufer bestätigt es per is_current und hit bzw. invalidate.
+        """
+        entry = self.store.get(answer_key(model, prompt, doc_refs, instructions))
+        if entry is not None:
+            return {**entry, "tier": "exact"}
+
+        if self.semantic and query_vector is not None:
+            query = np.asarray(query_vector, dtype=np.float32)
+            best, best_sim = None, self.threshold
+            for candidate in self.store.candidates(doc_set_key(model, doc_refs, instructions)):
+                if candidate.get("query_vector") is None:
+                    continue
+                vector = np.asarray(candidate["query_vector"], dtype=np.float32)
+                sim = float(np.dot(query, vector) / max(np.linalg.norm(query) * np.linalg.norm(vector), 1e-12))
+                if sim >= best_sim:
+                    best, best_sim = candidate, sim
+            if best is not None:
+                return {**best, "tier": "semantic", "similarity": best_sim}
+
+        self._count("misses")
+        return None
+
+    @staticmethod
+    def is_current(entry: dict, versions: Dict[str, Optional[int]]) -> bool:
+        return all(versions.get(ref) == version for ref, version in entry.get("versions", {}).items())
+
+    def hit(self, entry: dict) -> None:
+        self._count("exact_hits" if entry["tier"] == "exact" else "semantic_hits")
+
+    def invalidate(self, entry: dict) -> None:
+        self.store.delete(entry["key"])
+        self._count("invalidations")
+        self._count("misses")
+
+    def put(
+        self,
+        model: str,
+        prompt: str,
+        doc_refs: List[str],
+        answer: str,
+        versions: Dict[str, Optional[int]],
+        query_vector: Optional[List[float]] = None,
+        instructions: str = "",
+    ) -> None:
+        self.store.put({
+            "key": answer_key(model, prompt, doc_refs, instructions),
+            "doc_set": doc_set_key(model, doc_refs, instructions),
+            "model": model,
+            "answer": answer,
+            "versions": versions,
+            "query_vector": [float(x) for x in query_vector] if self.semantic and query_vector is not None else None,
+            "created": time.time(),
+        })
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "store": type(self.store).__name__,
+                "semantic": self.semantic,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_ratio": hits / total if total else 0.0,
+            }
+
+
+def create_answer_cache() -> Optional[AnswerCache]:
+    """
+    Antwort-Cache laut ANSWER_CACHE: memory, sqlite, elasticsearch oder off.
+    """
+    kind = os.getenv("ANSWER_CACHE", "memory")
+    ttl = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+    if kind == "off":
+        return None
+    if kind == "sqlite":
+        store = SQLiteAnswerStore(os.getenv("ANSWER_CACHE_SQLITE_PATH", "answer_cache.sqlite"), ttl)
+    elif kind == "elasticsearch":
+        client = Elasticsearch(
+            os.getenv("ELASTICSEARCH_URI"),
+            basic_auth=(os.getenv("ELASTIC_USERNAME"), os.getenv("ELASTIC_PASSWORD")),
+        )
+        store = ElasticsearchAnswerStore(client, os.getenv("ANSWER_CACHE_INDEX", "rag-answer-cache"), ttl)
+    else:
+        store = MemoryAnswerStore(int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")), ttl)
+    return AnswerCache(
+        store,
+        semantic=os.getenv("ANSWER_CACHE_SEMANTIC", "false").lower() == "true",
+        threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+    )
@@ -0,0 +1,943 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from elasticsearch import AsyncElasticsearch, BadRequestError, NotFoundError
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from services.answer_cache import create_answer_cache
+from services.instrumentation import observe, record_llm_usage, stage
+from services.llm_scheduler import LLMOverloadedError, LLMPriority, llm_scheduler
+from services.result_merge import SourceDepthEstimator, merge_top_k, normalize_scores
+from services.search_cache import create_search_cache
+from services.search_cursor import CursorExpiredError, PitRegistry
+from services.rag_service import (
+    DEFAULT_EMBEDDING_MODEL,
+    KNN_MAX_CANDIDATES,
+    LLM_MODEL,
+    HybridMode,
+    VectorSearchMode,
+    fit_document_prompt,
+    chat_messages,
+    chunk_index_name,
+    chunk_search_body,
+    collapse_passages,
+    document_prompt_instructions,
+    document_search_body,
+    encode_queries,
+    fuse_rrf_responses,
+    model_registry,
+    note_knn_error,
+    parent_mget_params,
+    passage_parent_hits,
+    prepare_search_results,
+    query_embedding_cache,
+    query_encoder,
+    rrf_searches,
+    score_page_body,
+    source_filter,
+    with_pit,
+)
+
+load_dotenv()
+
+
+class AsyncRAGService:
+    """
+    Asynchrone Variante von RAGService für die FastAPI-Endpunkte.
+
+    - Elasticsearch und LLM laufen über AsyncElasticsearch bzw. AsyncOpenAI mit gepoolten Verbindungen,
+      sodass langsame LLM-Anfragen keine Worker-Threads blockieren.
+    - Query-Embeddings laufen über den gemeinsamen MicroBatchEncoder (eigener Thread), das Laden
+      der Modelle in einem eigenen Executor, damit beides den Event-Loop nicht blockiert.
+
+    Die Abfragen selbst (Query-Bodies über document_search_body/rrf_searches, RRF-Fusion, Mapping der
+    Treffer) teilt sich die Klasse mit RAGService und BatchSearch; hier steht nur der asynchrone Ablauf.
+    """
+
+    def __init__(self, elasticsearch_uri: str, groq_api_key: str, username: str, password: str):
+        self._openAI_client = AsyncOpenAI(
+            base_url=os.getenv("LLM_URL"),
+            api_key="not-needed",
+            timeout=httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "300")), connect=5.0),
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                    max_keepalive_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                ),
+            ),
+        )
+
+        self._elastic_client = AsyncElasticsearch(
+            elasticsearch_uri,
+            basic_auth=(username, password),
+            node_class="httpxasync",
+            connections_per_node=int(os.getenv("ES_CONNECTIONS_PER_NODE", "25")),
+        )
+        # Indizes, deren 'embedding'-Feld keinen HNSW-Index hat (kNN fällt dort auf exakte Suche zurück)
+        self._knn_unsupported = set()
+        # Eigener Executor für das Laden der Modelle, getrennt vom Threadpool von FastAPI
+        self._inference_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("EMBEDDING_INFERENCE_THREADS", "2")),
+            thread_name_prefix="embedding-inference"
+        )
+        # Cache für LLM-Antworten (exakt und optional semantisch), None bei ANSWER_CACHE=off
+        self.answer_cache = create_answer_cache()
+        # Cache für Suchergebnisse, invalidiert über die Generation der Indizes; None bei SEARCH_CACHE=off
+        self.search_cache = create_search_cache(self._elastic_client)
+        # Point-in-Times der Cursor-Pagination (search_page); abgelaufene gibt Elasticsearch selbst frei
+        self._pits = PitRegistry(self._elastic_client, int(os.getenv("SEARCH_PIT_KEEP_ALIVE", "120")))
+        # Gelernte Abfragetiefe je Quelle für die globale Top-K (search_sources_top_k)
+        self.source_depths = SourceDepthEstimator(
+            min_depth=int(os.getenv("MERGE_MIN_DEPTH", "3")),
+            headroom=float(os.getenv("MERGE_DEPTH_HEADROOM", "1.5")),
+        )
+        # Warm-Zustand der Abhängigkeiten für den Readiness-Endpunkt
+        self.readiness: Dict[str, dict] = {
+            name: {"status": "pending"} for name in ("elasticsearch", "llm", "embedding_model")
+        }
+
+    async def warm_up(
+        self,
+        model_names: Iterable[str] = (DEFAULT_EMBEDDING_MODEL,),
+        retries: Optional[int] = None,
+        retry_interval: Optional[float] = None,
+    ) -> None:
+        """
+        Wärmt Elasticsearch, LLM und Embedding-Modell nebenläufig im Hintergrund auf.
+        Nicht erreichbare Abhängigkeiten werden bis zu retries-mal erneut versucht;
+        der Zustand steht jederzeit in self.readiness.
+        """
+        if retries is None:
+            retries = int(os.getenv("WARMUP_RETRIES", "12"))
+        if retry_interval is None:
+            retry_interval = float(os.getenv("WARMUP_RETRY_INTERVAL", "5"))
+
+        async def _elasticsearch():
+            if not await self._elastic_client.ping():
+                raise ConnectionError("Elasticsearch nicht erreichbar")
+
+        async def _llm():
+            await self._openAI_client.models.list()
+            # Eine kurze Completion lädt das Modell im LLM-Server
+            await self._openAI_client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=chat_messages("What is the capital of france?"),
+                max_tokens=1
+            )
+
+        async def _embedding_model():
+            loop = asyncio.get_running_loop()
+            for name in model_names:
+                await loop.run_in_executor(self._inference_executor, model_registry.get, name)
+
+        await asyncio.gather(
+            self._warm("elasticsearch", _elasticsearch, retries, retry_interval),
+            self._warm("llm", _llm, retries, retry_interval),
+            self._warm("embedding_model", _embedding_model, 1, retry_interval),
+        )
+
+    async def _warm(self, name: str, check: Callable[[], Awaitable[None]], retries: int, retry_interval: float) -> None:
+        started = time.perf_counter()
+        for attempt in range(1, retries + 1):
+            self.readiness[name] = {"status": "warming", "attempt": attempt}
+            try:
+                await check()
+                self.readiness[name] = {
+                    "status": "ready",
+                    "duration_ms": round((time.perf_counter() - started) * 1000),
+                }
+                print(f"Warm-up '{name}' abgeschlossen.")
+                return
+            except Exception as e:
+                self.readiness[name] = {"status": "failed", "attempt": attempt, "error": str(e)}
+                if attempt < retries:
+                    await asyncio.sleep(retry_interval)
+        print(f"Warm-up '{name}' fehlgeschlagen: {self.readiness[name].get('error')}")
+
+    def is_ready(self) -> bool:
+        return all(state["status"] == "ready" for state in self.readiness.values())
+
+    def pit_stats(self) -> dict:
+        return self._pits.stats()
+
+    async def close(self) -> None:
+        """
+        Schließt die gepoolten Verbindungen zu Elasticsearch und dem LLM.
+        """
+        if self.search_cache is not None:
+            await self.search_cache.close()
+        await self._pits.close()
+        await self._elastic_client.close()
+        await self._openAI_client.close()
+        self._inference_executor.shutdown(wait=False)
+
+    async def encode_query(self, query: str, model_name: str = DEFAULT_EMBEDDING_MODEL) -> List[float]:
+        """
+        Berechnet das Query-Embedding: Treffer kommen aus dem Query-Cache, sonst wird über den
+        MicroBatchEncoder mit gleichzeitigen Anfragen gebündelt encodiert, ohne einen Thread zu blockieren.
+        """
+        with stage("encode"):
+            vector = query_embedding_cache.get(model_name, query)
+            if vector is None:
+                vector = await asyncio.wrap_future(query_encoder.submit(query, model_name))
+        return vector.tolist()
+
+    async def encode_queries(self, queries: List[str], model_name: str = DEFAULT_EMBEDDING_MODEL) -> Dict[str, List[float]]:
+        """
+        Embeddings vieler Queries (z.B. für /api/search/batch): Treffer aus dem Query-Cache, alle übrigen
+        in einem einzigen model.encode im Inferenz-Executor statt einzeln über den MicroBatchEncoder.
+        """
+        unique = list(dict.fromkeys(queries))
+        loop = asyncio.get_running_loop()
+        with stage("encode"):
+            vectors = await loop.run_in_executor(self._inference_executor, encode_queries, unique, model_name)
+        return {query: vector.tolist() for query, vector in zip(unique, vectors)}
+
+    async def msearch(self, searches: List[dict]) -> dict:
+        """
+        Mehrere Suchen in einer _msearch-Anfrage (abwechselnd Header und Body).
+        """
+        with stage("es", "msearch"):
+            return await self._elastic_client.msearch(searches=searches)
+
+    def knn_supported(self, index_name: str) -> bool:
+        return index_name not in self._knn_unsupported
+
+    async def search_sources_top_k(
+        self,
+        sources: List[str],
+        search_fn: Callable[[str, int], Awaitable[List[dict]]],
+        top_k: int,
+        search_type: str,
+        timeout: Optional[float] = None,
+        adaptive: bool = True,
+        best_scores: Optional[Dict[str, float]] = None,
+    ) -> Tuple[List[dict], List[str]]:
+        """
+        Führt die Suche für alle Quellen nebenläufig aus und liefert die globale Top-K: die Scores werden
+        je Quelle normalisiert (normalize_scores), Duplikate entfernt und per Heap die besten top_k ausgewählt.
+        Quellen, die nicht innerhalb von timeout Sekunden antworten oder fehlschlagen, werden übersprungen;
+        ein abgelaufener Cursor (CursorExpiredError) betrifft die ganze Anfrage und wird weitergereicht.
+
+        search_fn(src, depth) fragt eine Quelle mit der Tiefe aus source_depths ab, statt jede Quelle
+        top_k Treffer liefern zu lassen. Hat eine Quelle mit geringerer Tiefe nur Treffer in der
+        Top-K gelandet, könnten weitere fehlen: sie wird einmal mit voller Tiefe nachgeladen.
+        Mit adaptive=False wird nur zusammengeführt (z.B. für Seiten der Cursor-Pagination).
+        best_scores gibt je Quelle den Score vor, auf den normalisiert wird (sonst der beste Treffer);
+        es wird erst nach den Suchen gelesen und darf von search_fn befüllt werden.
+        """
+        depths = {
+            src: self.source_depths.depth(src, search_type, top_k) if adaptive else top_k for src in sources
+        }
+        results, failed = await self._gather_sources(sources, lambda src: search_fn(src, depths[src]), timeout)
+        best_scores = best_scores or {}
+        results = {src: normalize_scores(hits, best_scores.get(src)) for src, hits in results.items()}
+        merged = merge_top_k(results, top_k)
+        if not adaptive:
+            return merged, failed
+        fetched = sum(len(hits) for hits in results.values())
+
+        selected = {id(hit) for hit in merged}
+        refetch = [
+            src for src, hits in results.items()
+            if depths[src] < top_k and len(hits) == depths[src] and all(id(hit) in selected for hit in hits)
+        ]
+        if refetch:
+            more, _ = await self._gather_sources(refetch, lambda src: search_fn(src, top_k), timeout)
+            for src, hits in more.items():
+                results[src] = normalize_scores(hits)
+                fetched += len(hits)
+            merged = merge_top_k(results, top_k)
+            selected = {id(hit) for hit in merged}
+
+        shares = {
+            src: sum(id(hit) in selected for hit in hits) / max(len(merged), 1) for src, hits in results.items()
+        }
+        self.source_depths.update(search_type, shares, fetched, len(merged), len(refetch))
+        return merged, failed
+
+    async def _gather_sources(
+        self,
+        sources: List[str],
+        search_fn: Callable[[str], Awaitable[List[dict]]],
+        timeout: Optional[float] = None,
+    ) -> Tuple[Dict[str, List[dict]], List[str]]:
+        # Treffer je Quelle und ausgefallene Quellen, siehe search_sources_top_k
+        if timeout is None:
+            timeout = float(os.getenv("SEARCH_SOURCE_TIMEOUT", "10"))
+
+        results = await asyncio.gather(
+            *(asyncio.wait_for(search_fn(src), timeout) for src in sources),
+            return_exceptions=True
+        )
+
+        hits, failed = {}, []
+        for src, result in zip(sources, results):
+            if isinstance(result, CursorExpiredError):
+                raise result
+            elif isinstance(result, asyncio.TimeoutError):
+                print(f"Suche in Quelle '{src}' nach {timeout}s abgebrochen.")
+                failed.append(src)
+            elif isinstance(result, BaseException):
+                print(f"Suche in Quelle '{src}' fehlgeschlagen: {result}")
+                failed.append(src)
+            else:
+                hits[src] = result
+        return hits, failed
+
+    async def search_elasticsearch(self, query: str, index: str = "_all", max_results: int = 100, include_content: bool = True) -> List[dict]:
+        """
+        Keyword-Suche (query_string), siehe RAGService.search_elasticsearch.
+        """
+        async def _search():
+            body = document_search_body("keyword", index, max_results, query, include_content=include_content)
+            with stage("es", index):
+                response = await self._elastic_client.search(index=index, body=body)
+            return prepare_search_results(response, index, include_content)
+
+        return await self._cached_search(
+            index, "keyword", query, _search, max_results=max_results, include_content=include_content
+        )
+
+    async def vector_search_elasticsearch(
+        self,
+        index_name: str,
+        query: str,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        top_k: int = 30,
+        mode: VectorSearchMode = VectorSearchMode.knn,
+        num_candidates: Optional[int] = None,
+        query_vector: Optional[List[float]] = None,
+        include_content: bool = True,
+    ) -> List[dict]:
+        """
+        Vektor-Suche (kNN mit Fallback auf exakte Suche), siehe RAGService.vector_search_elasticsearch.
+        """
+        async def _search():
+            query_emb = query_vector if query_vector is not None else await self.encode_query(query, model_name)
+
+            if mode == VectorSearchMode.knn and index_name not in self._knn_unsupported:
+                try:
+                    with stage("es", index_name):
+                        resp = await self._elastic_client.search(index=index_name, body=document_search_body(
+                            "knn", index_name, top_k, query_vector=query_emb, num_candidates=num_candidates,
+                            include_content=include_content
+                        ))
+                    return prepare_search_results(resp, index_name, include_content)
+                except BadRequestError as e:
+                    note_knn_error(self._knn_unsupported, index_name, e)
+
+            with stage("es", index_name):
+                resp = await self._elastic_client.search(index=index_name, body=document_search_body(
+                    "exact", index_name, top_k, query_vector=query_emb, include_content=include_content
+                ))
+            return prepare_search_results(resp, index_name, include_content)
+
+        return await self._cached_search(
+            index_name, "embedding", query, _search, model_name=model_name, top_k=top_k, mode=mode.value,
+            num_candidates=num_candidates, include_content=include_content
+        )
+
+    async def passage_search_elasticsearch(
+        self,
+        index_name: str,
+        query: str,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        top_k: int = 30,
+        num_candidates: Optional[int] = None,
+        passages_per_parent: int = 3,
+        query_vector: Optional[List[float]] = None,
+        include_content: bool = True,
+    ) -> List[dict]:
+        """
+        Vektor-Suche über den Passagen-Index, siehe RAGService.passage_search_elasticsearch.
+        """
+        async def _search():
+            query_emb = query_vector if query_vector is not None else await self.encode_query(query, model_name)
+
+            try:
+                with stage("es", index_name):
+                    resp = await self._elastic_client.search(
+                        index=chunk_index_name(index_name),
+                        body=chunk_search_body(query_emb, top_k, num_candidates, passages_per_parent)
+                    )
+            except NotFoundError:
+                print(f"Kein Passagen-Index für '{index_name}', nutze Vektor-Suche auf Dokumentebene.")
+                return await self.vector_search_elasticsearch(
+                    index_name, query, model_name, top_k, num_candidates=num_candidates,
+                    query_vector=query_emb, include_content=include_content
+                )
+
+            hits = await self._passage_parent_hits(index_name, resp, include_content)
+            return prepare_search_results({"hits": {"hits": hits}}, index_name, include_content)
+
+        return await self._cached_search(
+            index_name, "passage", query, _search, (chunk_index_name(index_name),), model_name=model_name,
+            top_k=top_k, num_candidates=num_candidates, passages_per_parent=passages_per_parent,
+            include_content=include_content
+        )
+
+    async def _passage_parent_hits(self, index_name: str, chunk_response, include_content: bool) -> List[dict]:
+        collapsed = collapse_passages(chunk_response)
+        if not collapsed:
+            return []
+        with stage("es", index_name):
+            resp = await self._elastic_client.mget(**parent_mget_params(index_name, collapsed, include_content))
+        return passage_parent_hits(collapsed, resp["docs"])
+
+    async def hybrid_search_elasticsearch(
+        self,
+        index_name: str,
+        query: str,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        top_k: int = 30,
+        bm25_weight: float = 1.0,
+        embedding_weight: float = 35.0,
+        mode: HybridMode = HybridMode.weighted,
+        window_size: int = 50,
+        rank_constant: int = 60,
+        num_candidates: Optional[int] = None,
+        query_vector: Optional[List[float]] = None,
+        include_content: bool = True,
+        passages: bool = False,
+        passages_per_parent: int = 3,
+    ) -> List[dict]:
+        """
+        Hybride Suche (Weighted oder RRF), siehe RAGService.hybrid_search_elasticsearch.
+        """
+        async def _search():
+            if mode == HybridMode.rrf:
+                return await self.rrf_search_elasticsearch(
+                    index_name, query, model_name, top_k, window_size, rank_constant, num_candidates, query_vector,
+                    include_content, passages, passages_per_parent
+                )
+
+            query_emb = query_vector if query_vector is not None else await self.encode_query(query, model_name)
+            body = document_search_body(
+                "weighted", index_name, top_k, query, query_emb, bm25_weight=bm25_weight,
+                embedding_weight=embedding_weight, include_content=include_content
+            )
+            with stage("es", index_name):
+                response = await self._elastic_client.search(index=index_name, body=body)
+            return prepare_search_results(response, index_name, include_content)
+
+        if mode == HybridMode.rrf:
+            params = dict(window_size=window_size, rank_constant=rank_constant, num_candidates=num_candidates,
+                          passages=passages, passages_per_parent=passages_per_parent if passages else None)
+        else:
+            params = dict(bm25_weight=bm25_weight, embedding_weight=embedding_weight)
+        extra_indices = (chunk_index_name(index_name),) if mode == HybridMode.rrf and passages else ()
+        return await self._cached_search(
+            index_name, "hybrid", query, _search, extra_indices, model_name=model_name, top_k=top_k, mode=mode.value,
+            include_content=include_content, **params
+        )
+
+    async def rrf_search_elasticsearch(
+        self,
+        index_name: str,
+        query: str,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        top_k: int = 30,
+        window_size: int = 50,
+        rank_constant: int = 60,
+        num_candidates: Optional[int] = None,
+        query_vector: Optional[List[float]] = None,
+        include_content: bool = True,
+        passages: bool = False,
+        passages_per_parent: int = 3,
+    ) -> List[dict]:
+        """
+        Hybride Suche per Reciprocal Rank Fusion, siehe RAGService.rrf_search_elasticsearch.
+        """
+        window_size = max(window_size, top_k)
+        query_emb = query_vector if query_vector is not None else await self.encode_query(query, model_name)
+
+        def _vector_body(exact: bool):
+            return document_search_body(
+                "exact" if exact else "knn", index_name, window_size, query_vector=query_emb,
+                num_candidates=num_candidates, include_content=include_content
+            )
+
+        with stage("es", index_name):
+            resp = await self._elastic_client.msearch(searches=rrf_searches(
+                index_name, query, query_emb, window_size, index_name in self._knn_unsupported, num_candidates,
+                include_content, passages, passages_per_parent
+            ))
+        keyword_resp, vector_resp = resp["responses"]
+
+        if passages and "error" in vector_resp:
+            print(f"Passagen-Suche für '{index_name}' nicht möglich, nutze Dokumentebene: {vector_resp['error']}")
+            passages = False
+            with stage("es", index_name):
+                vector_resp = await self._elastic_client.search(
+                    index=index_name, body=_vector_body(index_name in self._knn_unsupported)
+                )
+        elif "error" in vector_resp and index_name not in self._knn_unsupported:
+            note_knn_error(self._knn_unsupported, index_name, vector_resp["error"])
+            with stage("es", index_name):
+                vector_resp = await self._elastic_client.search(index=index_name, body=_vector_body(True))
+
+        if passages:
+            vector_resp = {"hits": {"hits": await self._passage_parent_hits(index_name, vector_resp, include_content)}}
+
+        fused = fuse_rrf_responses(index_name, (keyword_resp, vector_resp), rank_constant, top_k)
+        return prepare_search_results({"hits": {"hits": fused}}, index_name, include_content)
+
+    async def search_page(
+        self,
+        index_name: str,
+        search_type: str,
+        query: str,
+        page_size: int,
+        state: Optional[dict] = None,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        query_vector: Optional[List[float]] = None,
+        vector_mode: VectorSearchMode = VectorSearchMode.knn,
+        hybrid_mode: HybridMode = HybridMode.weighted,
+        num_candidates: Optional[int] = None,
+        window_size: int = 50,
+        rank_constant: int = 60,
+        passages: bool = False,
+        passages_per_parent: int = 3,
+        include_content: bool = True,
+        bm25_weight: float = 1.0,
+        embedding_weight: float = 35.0,
+    ) -> Tuple[List[dict], dict]:
+        """
+        Eine Seite der Suche (search_type: keyword, embedding oder hybrid) für die Cursor-Pagination.
+
+        Die erste Seite (state=None) öffnet einen Point-in-Time pro Index, alle weiteren Seiten lesen
+        denselben Stand. Nach Score sortierbare Abfragen (query_string, exakte Vektorsuche, Weighted)
+        blättern per search_after, sodass jede Seite nur page_size Treffer kostet. kNN, Passagen-Suche
+        und RRF haben keine Sortierung, über die sich search_after fortsetzen ließe: dort wird das
+        Fenster bis offset + page_size berechnet und die Seite ab offset ausgeschnitten.
+
+        Returns:
+            Tuple[List[dict], dict]: Treffer der Seite und der Zustand für die nächste Seite
+            (pits, plan, after bzw. offset, done und best, der beste Score der ersten Seite). Abgeschlossene Quellen geben ihre PITs sofort frei.
+        """
+        if state is None:
+            if search_type == "keyword":
+                plan = "sorted"
+            elif search_type == "embedding":
+                plan = "passage" if passages else "knn" if vector_mode == VectorSearchMode.knn else "sorted"
+            else:
+                plan = "rrf" if hybrid_mode == HybridMode.rrf else "sorted"
+            state = {"plan": plan, "pits": {}, "after": None, "offset": 0, "done": False}
+        state = {**state, "pits": dict(state["pits"])}
+        if state["done"]:
+            return [], state
+
+        if search_type != "keyword" and query_vector is None:
+            query_vector = await self.encode_query(query, model_name)
+
+        if state["plan"] == "passage":
+            try:
+                await self._page_pit(state, chunk_index_name(index_name))
+            except NotFoundError:
+                print(f"Kein Passagen-Index für '{index_name}', nutze Vektor-Suche auf Dokumentebene.")
+                state["plan"] = "knn"
+        if state["plan"] == "knn" and index_name in self._knn_unsupported:
+            await self._knn_to_sorted(state, index_name)
+
+        if state["plan"] == "sorted":
+            kind = "keyword" if search_type == "keyword" else "exact" if search_type == "embedding" else "weighted"
+            body = document_search_body(
+                kind, index_name, page_size, query, query_vector, bm25_weight=bm25_weight,
+                embedding_weight=embedding_weight, include_content=include_content
+            )
+            pit_id = await self._page_pit(state, index_name)
+            resp = await self._pit_search(state, index_name, score_page_body(
+                body, pit_id, self._pits.keep_alive, state["after"]
+            ))
+            hits = resp["hits"]["hits"]
+            fetched = len(hits)
+            if hits:
+                state["after"] = hits[-1]["sort"]
+            results = prepare_search_results(resp, index_name, include_content)
+        else:
+            window = state["offset"] + page_size
+            if state["plan"] == "rrf":
+                fused = await self._rrf_window(
+                    state, index_name, query, query_vector, window, max(window_size, window), rank_constant,
+                    num_candidates, passages, passages_per_parent, include_content
+                )
+                hits = fused[state["offset"]:]
+                fetched = len(hits)
+            elif state["plan"] == "passage":
+                pit_id = await self._page_pit(state, chunk_index_name(index_name))
+                body = chunk_search_body(query_vector, window, num_candidates, passages_per_parent)
+                resp = await self._pit_search(state, chunk_index_name(index_name), with_pit(
+                    {**body, "from": state["offset"], "size": page_size}, pit_id, self._pits.keep_alive
+                ))
+                # Erschöpft ist die Quelle erst, wenn der Passagen-Index weniger Treffer liefert; gelöschte
+                # Dokumente entfallen beim mget und dürfen das Blättern nicht beenden
+                fetched = len(resp["hits"]["hits"])
+                hits = await self._passage_parent_hits(index_name, resp, include_content)
+            else:
+                pit_id = await self._page_pit(state, index_name)
+                body = document_search_body(
+                    "knn", index_name, window, query_vector=query_vector, num_candidates=num_candidates,
+                    include_content=include_content
+                )
+                # kNN liefert höchstens KNN_MAX_CANDIDATES Treffer: die letzte Seite endet dort
+                size = min(page_size, KNN_MAX_CANDIDATES - state["offset"])
+                try:
+                    resp = await self._pit_search(state, index_name, with_pit(
+                        {**body, "from": state["offset"], "size": max(size, 0)}, pit_id, self._pits.keep_alive
+                    ))
+                except BadRequestError as e:
+                    note_knn_error(self._knn_unsupported, index_name, e)
+                    await self._knn_to_sorted(state, index_name)
+                    return await self.search_page(
+                        index_name, search_type, query, page_size, state, model_name,
+                        query_vector, vector_mode=vector_mode, hybrid_mode=hybrid_mode, num_candidates=num_candidates,
+                        window_size=window_size, rank_constant=rank_constant, passages=passages,
+                        passages_per_parent=passages_per_parent, include_content=include_content,
+                        bm25_weight=bm25_weight, embedding_weight=embedding_weight
+                    )
+                hits = resp["hits"]["hits"]
+                fetched = len(hits)
+            state["offset"] = window
+            results = prepare_search_results({"hits": {"hits": hits}}, index_name, include_content)
+
+        # Bester Score der ersten Seite: Bezugsgröße für normalize_scores auf allen Seiten
+        if state.get("best") is None and results:
+            state["best"] = max(r.get("score") or 0.0 for r in results)
+        if fetched < page_size:
+            state["done"] = True
+            for pit_id in state["pits"].values():
+                await self._pits.close_pit(pit_id)
+            state["pits"] = {}
+        return results, state
+
+    async def _knn_to_sorted(self, state: dict, index_name: str) -> None:
+        # Die exakte Suche blättert per search_after: nach kNN-Seiten gibt es dafür keine Position,
+        # der Cursor kann nur neu beginnen (sonst kämen bereits gelieferte Treffer erneut)
+        if state["offset"]:
+            for pit_id in state["pits"].values():
+                await self._pits.close_pit(pit_id)
+            state["pits"] = {}
+            raise CursorExpiredError(f"kNN-Suche auf '{index_name}' ist nicht mehr möglich")
+        state["plan"] = "sorted"
+
+    async def _page_pit(self, state: dict, index_name: str) -> str:
+        # PIT des Index aus dem Cursor-Zustand, auf der ersten Seite neu geöffnet
+        if index_name not in state["pits"]:
+            state["pits"][index_name] = await self._pits.open(index_name)
+        return state["pits"][index_name]
+
+    async def _pit_search(self, state: dict, index_name: str, body: dict) -> dict:
+        # Suche auf dem PIT des Index; übernimmt die ggf. neue PIT-ID in den Cursor-Zustand
+        try:
+            with stage("es", index_name):
+                resp = await self._elastic_client.search(body=body)
+        except NotFoundError:
+            raise CursorExpiredError(f"Point-in-Time für '{index_name}' ist abgelaufen")
+        self._update_pit(state, index_name, resp.get("pit_id"))
+        return resp
+
+    def _update_pit(self, state: dict, index_name: str, pit_id: Optional[str]) -> None:
+        previous = state["pits"][index_name]
+        pit_id = pit_id or previous
+        state["pits"][index_name] = pit_id
+        self._pits.touch(pit_id, previous)
+
+    async def _rrf_window(
+        self,
+        state: dict,
+        index_name: str,
+        query: str,
+        query_vector: List[float],
+        top_k: int,
+        window_size: int,
+        rank_constant: int,
+        num_candidates: Optional[int],
+        passages: bool,
+        passages_per_parent: int,
+        include_content: bool,
+    ) -> List[dict]:
+        """
+        Die besten top_k fusionierten Treffer (RRF) auf dem PIT des Cursors, siehe rrf_search_elasticsearch.
+        """
+        keep_alive = self._pits.keep_alive
+        pit_id = await self._page_pit(state, index_name)
+
+        def _searches(passages: bool) -> List[dict]:
+            return rrf_searches(
+                index_name, query, query_vector, window_size, index_name in self._knn_unsupported, num_candidates,
+                include_content, passages, passages_per_parent
+            )
+
+        vector_index, vector_pit = index_name, pit_id
+        if passages:
+            try:
+                vector_pit = await self._page_pit(state, chunk_index_name(index_name))
+                vector_index = chunk_index_name(index_name)
+            except NotFoundError:
+                print(f"Kein Passagen-Index für '{index_name}', nutze Vektor-Suche auf Dokumentebene.")
+                passages = False
+
+        # Der Index ergibt sich aus dem PIT, die Header bleiben leer
+        _, keyword_body, _, vector_body = _searches(passages)
+        with stage("es", index_name):
+            resp = await self._elastic_client.msearch(searches=[
+                {}, with_pit(keyword_body, pit_id, keep_alive), {}, with_pit(vector_body, vector_pit, keep_alive)
+            ])
+        keyword_resp, vector_resp = resp["responses"]
+
+        for part_index, part in ((index_name, keyword_resp), (vector_index, vector_resp)):
+            if part.get("status") == 404:
+                raise CursorExpiredError(f"Point-in-Time für '{part_index}' ist abgelaufen")
+            if "error" not in part:
+                self._update_pit(state, part_index, part.get("pit_id"))
+
+        if "error" in vector_resp and not passages and index_name not in self._knn_unsupported:
+            note_knn_error(self._knn_unsupported, index_name, vector_resp["error"])
+            vector_resp = await self._pit_search(state, index_name, with_pit(document_search_body(
+                "exact", index_name, window_size, query_vector=query_vector, include_content=include_content
+            ), pit_id, keep_alive))
+        if passages and "error" not in vector_resp:
+            vector_resp = {"hits": {"hits": await self._passage_parent_hits(index_name, vector_resp, include_content)}}
+
+        return fuse_rrf_responses(index_name, (keyword_resp, vector_resp), rank_constant, top_k)
+
+    async def _cached_search(
+        self,
+        index_name: str,
+        search_type: str,
+        query: str,
+        fetch: Callable[[], Awaitable[List[dict]]],
+        extra_indices: Tuple[str, ...] = (),
+        **params,
+    ) -> List[dict]:
+        # Suchergebnis über den Such-Cache; params sind alle Parameter, die das Ergebnis beeinflussen
+        if self.search_cache is None:
+            return await fetch()
+        return await self.search_cache.run(index_name, search_type, query, fetch, extra_indices, **params)
+
+    async def get_document(self, index: str, doc_id: str) -> Optional[dict]:
+        """
+        Lädt ein einzelnes Dokument inkl. content nach (für Ergebnisse, die mit includeContent=False gesucht wurden).
+        """
+        try:
+            projection = source_filter(index, include_content=True)
+            doc = await self._elastic_client.get(
+                index=index,
+                id=doc_id,
+                source_includes=projection.get("includes"),
+                source_excludes=projection.get("excludes"),
+            )
+        except NotFoundError:
+            return None
+        results = prepare_search_results({"hits": {"hits": [doc]}}, index, include_content=True)
+        return results[0]
+
+    async def query_languageModel(
+        self,
+        prompt: str,
+        priority: LLMPriority = LLMPriority.interactive,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """
+        Führt eine LLM-Anfrage beim OpenAI-kompatiblen Webserver durch und gibt das Ergebnis als String zurück.
+        Die Anfrage läuft über den llm_scheduler; deadline ist die maximale Wartezeit auf einen Slot in Sekunden.
+
+        Raises:
+            LLMOverloadedError: Warteschlange voll oder kein Slot innerhalb der Deadline.
+        """
+        async with llm_scheduler.slot(priority, deadline):
+            with stage("llm") as llm_stage:
+                completion = await self._openAI_client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=chat_messages(prompt)
+                )
+        usage = completion.usage
+        record_llm_usage(
+            usage.prompt_tokens if usage else None, usage.completion_tokens if usage else None, llm_stage.seconds
+        )
+        return completion.choices[0].message.content
+
+    async def stream_languageModel(
+        self,
+        prompt: str,
+        priority: LLMPriority = LLMPriority.interactive,
+        deadline: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streamt die Antwort des LLM tokenweise (stream=True), statt auf die vollständige Antwort zu warten.
+        Der Slot im llm_scheduler wird bis zum Ende des Streams gehalten.
+        Jeder Chunk mit Inhalt zählt als ein Token (llama.cpp sendet einen Chunk pro Token).
+        """
+        async with llm_scheduler.slot(priority, deadline):
+            started = time.perf_counter()
+            tokens = 0
+            try:
+                stream = await self._openAI_client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=chat_messages(prompt),
+                    stream=True
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if tokens == 0:
+                            observe("llm_first_token", time.perf_counter() - started)
+                        tokens += 1
+                        yield chunk.choices[0].delta.content
+            finally:
+                seconds = time.perf_counter() - started
+                observe("llm", seconds)
+                record_llm_usage(None, tokens, seconds)
+
+    async def document_versions(self, doc_refs: List[str]) -> Dict[str, Optional[int]]:
+        """
+        Aktuelle Versionen der Dokumente ("index/id") per mget ohne _source; None für gelöschte Dokumente.
+        """
+        if not doc_refs:
+            return {}
+        resp = await self._elastic_client.mget(
+            docs=[{"_index": ref.split("/", 1)[0], "_id": ref.split("/", 1)[1]} for ref in doc_refs],
+            source=False,
+        )
+        return {
+            ref: doc.get("_version") if doc.get("found") else None
+            for ref, doc in zip(doc_refs, resp["docs"])
+        }
+
+    async def _cache_lookup(
+        self, prompt: str, doc_refs: List[str], query_vector: Optional[List[float]], instructions: str
+    ) -> Optional[dict]:
+        # Kandidat aus dem Antwort-Cache holen und gegen die aktuellen Dokumentversionen prüfen
+        entry = await asyncio.to_thread(
+            self.answer_cache.lookup, LLM_MODEL, prompt, doc_refs, query_vector, instructions
+        )
+        if entry is None:
+            return None
+        if not self.answer_cache.is_current(entry, await self.document_versions(list(entry.get("versions", {})))):
+            await asyncio.to_thread(self.answer_cache.invalidate, entry)
+            return None
+        self.answer_cache.hit(entry)
+        return entry
+
+    async def _cache_store(
+        self, prompt: str, doc_refs: List[str], answer: str, query_vector: Optional[List[float]], instructions: str
+    ) -> None:
+        try:
+            versions = await self.document_versions(doc_refs)
+            await asyncio.to_thread(
+                self.answer_cache.put, LLM_MODEL, prompt, doc_refs, answer, versions, query_vector, instructions
+            )
+        except Exception as e:
+            print(f"Antwort konnte nicht im Cache abgelegt werden: {e}")
+
+    async def cached_answer(
+        self,
+        prompt: str,
+        doc_refs: List[str],
+        query: Optional[str] = None,
+        priority: LLMPriority = LLMPriority.interactive,
+        deadline: Optional[float] = None,
+        instructions: str = "",
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Wie query_languageModel, aber über den Antwort-Cache. doc_refs ("index/id") sind die Dokumente,
+        aus denen der Prompt gebaut wurde; query wird für die semantische Stufe encodiert. instructions
+        sind die Prompt-Teile ohne Frage und Kontext: die semantische Stufe verwendet Antworten nur
+        bei gleichen Anweisungen wieder. Cache-Treffer belegen keinen Slot im llm_scheduler.
+
+        Returns:
+            Tuple[str, Optional[str]]: Antwort und Cache-Stufe ("exact", "semantic") bzw. None bei einer neuen Antwort.
+        """
+        if self.answer_cache is None:
+            return await self.query_languageModel(prompt, priority, deadline), None
+
+        query_vector = await self.encode_query(query) if self.answer_cache.semantic and query else None
+        entry = await self._cache_lookup(prompt, doc_refs, query_vector, instructions)
+        if entry is not None:
+            return entry["answer"], entry["tier"]
+
+        answer = await self.query_languageModel(prompt, priority, deadline)
+        await self._cache_store(prompt, doc_refs, answer, query_vector, instructions)
+        return answer, None
+
+    async def stream_cached_answer(
+        self,
+        prompt: str,
+        doc_refs: List[str],
+        query: Optional[str] = None,
+        priority: LLMPriority = LLMPriority.interactive,
+        deadline: Optional[float] = None,
+        instructions: str = "",
+    ) -> AsyncIterator[str]:
+        """
+        Wie stream_languageModel, aber über den Antwort-Cache (siehe cached_answer): ein Treffer wird in einem Stück geliefert,
+        eine neue Antwort nach vollständigem Streaming abgelegt.
+        """
+        if self.answer_cache is None:
+            async for token in self.stream_languageModel(prompt, priority, deadline):
+                yield token
+            return
+
+        query_vector = await self.encode_query(query) if self.answer_cache.semantic and query else None
+        entry = await self._cache_lookup(prompt, doc_refs, query_vector, instructions)
+        if entry is not None:
+            yield entry["answer"]
+            return
+
+        tokens = []
+        async for token in self.stream_languageModel(prompt, priority, deadline):
+            tokens.append(token)
+            yield token
+        await self._cache_store(prompt, doc_refs, "".join(tokens), query_vector, instructions)
+
+    async def document_prompt(self, index: str, doc_id: str, user_query: str) -> Tuple[str, int]:
+        """
+        Holt das Dokument über Index + ID und setzt den Prompt für die Frage zum Dokument zusammen,
+        gekürzt auf das Token-Budget (siehe fit_document_prompt).
+
+        Returns:
+            Tuple[str, int]: Prompt und Anzahl seiner Tokens.
+        """
+        try:
+            doc = await self._elastic_client.get(index=index, id=doc_id)
+            document_text = doc["_source"].get("content", "")
+        except Exception as e:
+            raise ValueError(f"Fehler beim Abrufen des Dokuments {index}/{doc_id}: {str(e)}")
+
+        if not document_text.strip():
+            raise ValueError("Dokument ist leer oder enthält kein 'content'-Feld")
+
+        # Tokenisierung (ggf. per HTTP am LLM-Server) und Satzauswahl laufen außerhalb des Event-Loops
+        return await asyncio.to_thread(fit_document_prompt, user_query, document_text)
+
+    async def combined_query(
+        self,
+        index: str,
+        doc_id: str,
+        user_query: str,
+        priority: LLMPriority = LLMPriority.interactive,
+        deadline: Optional[float] = None,
+    ) -> Tuple[str, int, Optional[str]]:
+        """
+        Kombinierte Anfrage zu einem einzelnen Dokument, siehe RAGService.combined_query.
+        Wiederholte Fragen zum selben Dokument kommen aus dem Antwort-Cache.
+
+        Returns:
+            Tuple[str, int, Optional[str]]: Antwort des LLM, Anzahl der Tokens im Prompt und Cache-Stufe (oder None).
+        """
+        prompt, prompt_tokens = await self.document_prompt(index, doc_id, user_query)
+
+        try:
+            answer, cache_tier = await self.cached_answer(
+                prompt, [f"{index}/{doc_id}"], user_query, priority, deadline, document_prompt_instructions()
+            )
+            return answer, prompt_tokens, cache_tier
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Fehler bei der Anfrage an das Sprachmodell: {str(e)}")
@@ -0,0 +1,178 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, Union
+
+from services.rag_service import (
+    HybridMode,
+    VectorSearchMode,
+    document_search_body,
+    fuse_rrf_responses,
+    prepare_search_results,
+    rrf_searches,
+)
+
+
+class SearchUnit:
+    """
+    Suche einer Anfrage in einer Quelle als Teilabfragen für _msearch.
+
+    combine setzt aus den Antworten der Teilabfragen die Treffer zusammen. Schlägt eine Teilabfrage
+    fehl (z.B. kNN ohne HNSW-Index) oder lässt sich die Suche nicht per _msearch ausdrücken
+    (Passagen-Suche), übernimmt fallback, also die normale Suchmethode von AsyncRAGService.
+    """
+
+    __slots__ = ("key", "searches", "combine", "fallback")
+
+    def __init__(
+        self,
+        key,
+        searches: List[Tuple[dict, dict]],
+        combine: Optional[Callable[[List[dict]], List[dict]]],
+        fallback: Callable[[], Awaitable[List[dict]]],
+    ):
+        self.key = key
+        self.searches = searches
+        self.combine = combine
+        self.fallback = fallback
+
+
+class BatchSearch:
+    """
+    Führt viele SearchUnits über gebündelte _msearch-Anfragen aus: bis zu chunk_size Teilabfragen
+    pro Anfrage, höchstens concurrency Anfragen gleichzeitig. Die Treffer kommen in der Reihenfolge
+    zurück, in der die Einheiten fertig werden.
+    """
+
+    def __init__(self, rag, chunk_size: int = 100, concurrency: int = 4):
+        self._rag = rag
+        self.chunk_size = max(chunk_size, 2)
+        self.concurrency = max(concurrency, 1)
+
+    def plan(
+        self,
+        key,
+        index_name: str,
+        search_type: str,
+        query: str,
+        query_vector: Optional[List[float]],
+        top_k: int,
+        vector_mode: VectorSearchMode = VectorSearchMode.knn,
+        hybrid_mode: HybridMode = HybridMode.weighted,
+        num_candidates: Optional[int] = None,
+        window_size: int = 50,
+        rank_constant: int = 60,
+        passages: bool = False,
+        passages_per_parent: int = 3,
+        include_content: bool = True,
+    ) -> SearchUnit:
+        """
+        Baut die Teilabfragen wie die Suchmethoden von AsyncRAGService (search_type: keyword,
+        embedding oder hybrid), der Suchvektor ist bereits berechnet.
+        """
+        rag = self._rag
+        header = {"index": index_name}
+
+        def _prepared(responses: List[dict]) -> List[dict]:
+            return prepare_search_results(responses[0], index_name, include_content)
+
+        if search_type == "keyword":
+            body = document_search_body("keyword", index_name, top_k, query, include_content=include_content)
+            return SearchUnit(key, [(header, body)], _prepared, lambda: rag.search_elasticsearch(
+                query, index_name, top_k, include_content
+            ))
+
+        if search_type == "embedding":
+            async def _vector_fallback():
+                if passages:
+                    return await rag.passage_search_elasticsearch(
+                        index_name, query, top_k=top_k, num_candidates=num_candidates,
+                        passages_per_parent=passages_per_parent, query_vector=query_vector, include_content=include_content
+                    )
+                return await rag.vector_search_elasticsearch(
+                    index_name, query, top_k=top_k, mode=vector_mode, num_candidates=num_candidates,
+                    query_vector=query_vector, include_content=include_content
+                )
+            if passages:
+                return SearchUnit(key, [], None, _vector_fallback)
+            kind = "exact" if vector_mode == VectorSearchMode.exact or not rag.knn_supported(index_name) else "knn"
+            body = document_search_body(
+                kind, index_name, top_k, query_vector=query_vector, num_candidates=num_candidates,
+                include_content=include_content
+            )
+            return SearchUnit(key, [(header, body)], _prepared, _vector_fallback)
+
+        async def _hybrid_fallback():
+            return await rag.hybrid_search_elasticsearch(
+                index_name, query, top_k=top_k, mode=hybrid_mode, window_size=window_size,
+                rank_constant=rank_constant, num_candidates=num_candidates, query_vector=query_vector,
+                include_content=include_content, passages=passages, passages_per_parent=passages_per_parent
+            )
+
+        if hybrid_mode == HybridMode.weighted:
+            body = document_search_body("weighted", index_name, top_k, query, query_vector, include_content=include_content)
+            return SearchUnit(key, [(header, body)], _prepared, _hybrid_fallback)
+        if passages:
+            return SearchUnit(key, [], None, _hybrid_fallback)
+
+        def _fused(responses: List[dict]) -> List[dict]:
+            fused = fuse_rrf_responses(index_name, responses, rank_constant, top_k)
+            return prepare_search_results({"hits": {"hits": fused}}, index_name, include_content)
+
+        searches = rrf_searches(
+            index_name, query, query_vector, max(window_size, top_k), not rag.knn_supported(index_name),
+            num_candidates, include_content
+        )
+        return SearchUnit(key, list(zip(searches[0::2], searches[1::2])), _fused, _hybrid_fallback)
+
+    async def run(self, units: List[SearchUnit]) -> AsyncIterator[Tuple[object, Union[List[dict], BaseException]]]:
+        """
+        Liefert (key, Treffer) bzw. (key, Exception) je Einheit, sobald ihr _msearch-Chunk fertig ist.
+        Die Teilabfragen einer Einheit landen immer im selben Chunk.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        done: asyncio.Queue = asyncio.Queue()
+
+        async def _finish(unit: SearchUnit, responses: Optional[List[dict]]) -> None:
+            try:
+                if responses is None or any("error" in part for part in responses):
+                    result = await unit.fallback()
+                else:
+                    result = unit.combine(responses)
+            except Exception as e:
+                result = e
+            done.put_nowait((unit.key, result))
+
+        async def _run_chunk(chunk: List[SearchUnit]) -> None:
+            searches = [line for unit in chunk for search in unit.searches for line in search]
+            try:
+                async with semaphore:
+                    resp = await self._rag.msearch(searches)
+            except Exception as e:
+                for unit in chunk:
+                    done.put_nowait((unit.key, e))
+                return
+            responses = iter(resp["responses"])
+            await asyncio.gather(*(_finish(unit, [next(responses) for _ in unit.searches]) for unit in chunk))
+
+        async def _run_direct(unit: SearchUnit) -> None:
+            async with semaphore:
+                await _finish(unit, None)
+
+        tasks, chunk, size = [], [], 0
+        for unit in units:
+            if not unit.searches:
+                tasks.append(asyncio.create_task(_run_direct(unit)))
+                continue
+            if size + len(unit.searches) > self.chunk_size:
+                tasks.append(asyncio.create_task(_run_chunk(chunk)))
+                chunk, size = [], 0
+            chunk.append(unit)
+            size += len(unit.searches)
+        if chunk:
+            tasks.append(asyncio.create_task(_run_chunk(chunk)))
+
+        try:
+            for _ in range(len(units)):
+                yield await done.get()
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,305 @@
+import math
+import os
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class TokenCounter(ABC):
+    """
+    Zählt Tokens für die Budgetierung des Prompts.
+    count_many darf schätzen; count wird für die Prüfung des fertigen Kontexts genutzt.
+    """
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+    @abstractmethod
+    def count_many(self, texts: List[str]) -> List[int]:
+        ...
+
+
+class HeuristicTokenCounter(TokenCounter):
+    """
+    Schätzung über die Zeichenanzahl (ohne Tokenizer); für deutschen Text mit dem
+    Llama-3-Tokenizer liegen etwa 3 bis 4 Zeichen auf einem Token.
+    """
+
+    def __init__(self, chars_per_token: float = 3.2):
+        self._chars_per_token = chars_per_token
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        return [math.ceil(len(text) / self._chars_per_token) for text in texts]
+
+
+class LocalTokenCounter(TokenCounter):
+    """
+    Exakte Zählung mit einem lokalen Tokenizer (tokenizer.json oder Hugging-Face-Name),
+    z.B. dem Tokenizer des auf dem LLM-Server geladenen Modells. Wird beim ersten Aufruf geladen.
+    """
+
+    def __init__(self, tokenizer_path: str):
+        self._tokenizer_path = tokenizer_path
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _get_tokenizer(self):
+        with self._lock:
+            if self._tokenizer is None:
+                from tokenizers import Tokenizer
+                if os.path.isfile(self._tokenizer_path):
+                    self._tokenizer = Tokenizer.from_file(self._tokenizer_path)
+                else:
+                    self._tokenizer = Tokenizer.from_pretrained(self._tokenizer_path)
+            return self._tokenizer
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        encodings = self._get_tokenizer().encode_batch(texts, add_special_tokens=False)
+        return [len(encoding.ids) for encoding in encodings]
+
+
+class ServerTokenCounter(TokenCounter):
+    """
+    Zählt mit dem Tokenizer des LLM-Servers über dessen /tokenize-Endpunkt (llama.cpp).
+
+    count_many stellt nur eine Anfrage für alle Texte und rechnet das Verhältnis Tokens/Zeichen
+    auf die einzelnen Texte um; count ist exakt. Ist der Server nicht erreichbar, wird für
+    backoff_seconds auf die Heuristik ausgewichen.
+
+    Die Anfragen sind synchron und blockieren den Aufrufer; im async-Pfad laufen
+    ContextBuilder.build und fit_document_prompt deshalb über asyncio.to_thread.
+    """
+
+    def __init__(self, url: str, fallback: TokenCounter, timeout: float = 5.0, backoff_seconds: float = 60.0):
+        self._url = url
+        self._fallback = fallback
+        self._client = httpx.Client(timeout=timeout)
+        self._backoff_seconds = backoff_seconds
+        self._unavailable_until = 0.0
+        self._failing = False
+
+    def _tokenize(self, text: str) -> Optional[int]:
+        if time.monotonic() < self._unavailable_until:
+            return None
+        try:
+            resp = self._client.post(self._url, json={"content": text})
+            resp.raise_for_status()
+            tokens = len(resp.json()["tokens"])
+        except Exception as e:
+            # Nur beim Wechsel auf die Schätzung melden, nicht bei jedem erneuten Versuch
+            if not self._failing:
+                print(f"Tokenisierung über {self._url} fehlgeschlagen, nutze Schätzung: {e}")
+            self._failing = True
+            self._unavailable_until = time.monotonic() + self._backoff_seconds
+            return None
+        if self._failing:
+            print(f"Tokenisierung über {self._url} wieder verfügbar.")
+            self._failing = False
+        return tokens
+
+    def count(self, text: str) -> int:
+        tokens = self._tokenize(text)
+        return tokens if tokens is not None else self._fallback.count(text)
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        joined = "\n".join(texts)
+        total = self._tokenize(joined) if joined else 0
+        if total is None:
+            return self._fallback.count_many(texts)
+        ratio = total / max(len(joined), 1)
+        return [max(1, math.ceil(len(text) * ratio)) if text else 0 for text in texts]
+
+
+def create_token_counter() -> TokenCounter:
+    """
+    Token-Zähler laut CONTEXT_TOKENIZER: heuristic (Standard, CONTEXT_CHARS_PER_TOKEN), local
+    (CONTEXT_TOKENIZER_PATH) oder server (/tokenize des LLM-Servers; kostet pro Prompt mehrere
+    blockierende HTTP-Anfragen und ist daher nur bei fehlendem lokalen Tokenizer sinnvoll;
+    nach einem Fehler wird CONTEXT_TOKENIZE_BACKOFF Sekunden lang geschätzt).
+    """
+    heuristic = HeuristicTokenCounter(float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.2")))
+    kind = os.getenv("CONTEXT_TOKENIZER", "heuristic")
+    if kind == "local" and os.getenv("CONTEXT_TOKENIZER_PATH"):
+        return LocalTokenCounter(os.getenv("CONTEXT_TOKENIZER_PATH"))
+    if kind == "server":
+        # llama.cpp bietet /tokenize neben der OpenAI-kompatiblen API unter /v1 an
+        url = os.getenv("CONTEXT_TOKENIZE_URL") or re.sub(r"/v1/?$", "", os.getenv("LLM_URL", "http://localhost:8080/v1")) + "/tokenize"
+        return ServerTokenCounter(url, heuristic, backoff_seconds=float(os.getenv("CONTEXT_TOKENIZE_BACKOFF", "60")))
+    return heuristic
+
+
+class BuiltContext:
+    """
+    Ergebnis von ContextBuilder.build: der Kontext-Text, die Tokens des gesamten Prompts
+    (reservierter Teil + Kontext) und ob wegen des Budgets Text weggelassen wurde.
+    """
+
+    def __init__(self, text: str, tokens: int, truncated: bool):
+        self.text = text
+        self.tokens = tokens
+        self.truncated = truncated
+
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class ContextBuilder:
+    """
+    Stellt den Kontext für einen Prompt innerhalb eines Token-Budgets zusammen.
+
+    Jede Quelle ist ein dict mit 'label' und entweder 'passages' (bereits nach Relevanz sortiert,
+    z.B. aus der Passagen-Suche) oder 'text', der in Sätze zerlegt wird. Die Einheiten werden per
+    BM25 gegen die Query bewertet, Duplikate und überlappende Passagen entfernt und die besten
+    Einheiten aufgenommen, solange das Budget reicht. Im Kontext stehen sie in Originalreihenfolge.
+    """
+
+    # Einheiten ab dieser Länge werden an Wortgrenzen geteilt (Tabellen, Texte ohne Satzzeichen)
+    MAX_UNIT_CHARS = 1000
+
+    def __init__(self, counter: TokenCounter, budget_tokens: int = 3000):
+        self.counter = counter
+        self.budget_tokens = budget_tokens
+
+    def build(self, query: str, sources: List[dict], reserved: str = "", budget_tokens: Optional[int] = None) -> BuiltContext:
+        """
+        Args:
+            query: Nutzerfrage, gegen die die Einheiten bewertet werden.
+            sources: Quellen in Rangfolge (siehe Klassenbeschreibung).
+            reserved: Restlicher Prompt ohne Kontext; seine Tokens gehen vom Budget ab.
+            budget_tokens: Budget für den gesamten Prompt (Standard: CONTEXT_TOKEN_BUDGET).
+        """
+        budget = budget_tokens or self.budget_tokens
+        reserved_tokens = self.counter.count(reserved) if reserved else 0
+        available = budget - reserved_tokens
+
+        units = self._units(sources)
+        if not units or available <= 0:
+            return BuiltContext("", reserved_tokens, bool(units))
+
+        self._score(query, units)
+        headers = [f"{source.get('label', '')}\n" if source.get("label") else "" for source in sources]
+        # Überschriften und Einheiten in einem Aufruf zählen (beim Server-Tokenizer eine Anfrage)
+        counts = self.counter.count_many(headers + [unit["text"] + "\n" for unit in units])
+        header_tokens = counts[:len(headers)]
+        for unit, tokens in zip(units, counts[len(headers):]):
+            unit["tokens"] = tokens
+
+        selected, used, seen, dropped = [], 0, [], False
+        for unit in sorted(units, key=lambda u: (-u["score"], u["source"], u["position"])):
+            text = self._trim_overlap(unit, selected)
+            if not text or self._is_duplicate(text, seen):
+                continue
+            if text != unit["text"]:
+                # Gekürzte Einheit anteilig schätzen statt neu zu zählen; die Endprüfung ist exakt
+                unit["tokens"] = max(1, math.ceil(unit["tokens"] * (len(text) + 1) / (len(unit["text"]) + 1)))
+                unit["text"] = text
+            cost = unit["tokens"]
+            if not any(s["source"] == unit["source"] for s in selected):
+                cost += header_tokens[unit["source"]]
+            if used + cost > available:
+                dropped = True
+                continue
+            selected.append(unit)
+            seen.append(set(_WORD_RE.findall(text.lower())))
+            used += cost
+
+        text = self._assemble(selected, headers)
+        tokens = self.counter.count(text) if text else 0
+        # Die Einzelzählung kann schätzen (Server-Tokenizer): notfalls die schwächsten Einheiten entfernen
+        for _ in range(5):
+            if tokens <= available or not selected:
+                break
+            selected.remove(min(selected, key=lambda u: u["score"]))
+            dropped = True
+            text = self._assemble(selected, headers)
+            tokens = self.counter.count(text) if text else 0
+
+        return BuiltContext(text, reserved_tokens + tokens, dropped)
+
+    def _units(self, sources: List[dict]) -> List[dict]:
+        units = []
+        for source_no, source in enumerate(sources):
+            passages = source.get("passages")
+            if passages:
+                parts = [(p, 1.0 / (1 + rank)) for rank, p in enumerate(passages)]
+            else:
+                parts = [(sentence, 0.0) for sentence in self._sentences(source.get("text") or "")]
+            for position, (text, prior) in enumerate(parts):
+                text = text.strip()
+                if text:
+                    units.append({"source": source_no, "position": position, "text": text, "prior": prior})
+        return units
+
+    def _sentences(self, text: str) -> List[str]:
+        sentences = []
+        for sentence in _SENTENCE_RE.split(text):
+            while len(sentence) > self.MAX_UNIT_CHARS:
+                cut = sentence.rfind(" ", 0, self.MAX_UNIT_CHARS)
+                cut = cut if cut > 0 else self.MAX_UNIT_CHARS
+                sentences.append(sentence[:cut])
+                sentence = sentence[cut:]
+            sentences.append(sentence)
+        return sentences
+
+    @staticmethod
+    def _score(query: str, units: List[dict], k1: float = 1.2, b: float = 0.75) -> None:
+        # BM25 über die Einheiten; ohne Treffer entscheidet die Reihenfolge (Rang der Quelle, Position)
+        terms = set(_WORD_RE.findall(query.lower()))
+        tokenized = [_WORD_RE.findall(unit["text"].lower()) for unit in units]
+        avg_len = sum(len(t) for t in tokenized) / len(tokenized) or 1.0
+        doc_freq = {term: sum(1 for t in tokenized if term in t) for term in terms}
+        n = len(units)
+        for unit, words in zip(units, tokenized):
+            score = 0.0
+            for term in terms:
+                tf = words.count(term)
+                if tf:
+                    idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                    score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(words) / avg_len))
+            unit["score"] = score + unit["prior"]
+
+    @staticmethod
+    def _trim_overlap(unit: dict, selected: List[dict], probe_chars: int = 40) -> str:
+        # Überlappende Passagen derselben Quelle (Chunk-Overlap) nur einmal aufnehmen
+        text = unit["text"]
+        for other in selected:
+            if other["source"] != unit["source"]:
+                continue
+            previous = other["text"]
+            idx = previous.find(text[:probe_chars])
+            if idx >= 0 and text.startswith(previous[idx:]):
+                text = text[len(previous) - idx:].strip()
+                continue
+            idx = text.find(previous[:probe_chars])
+            if idx >= 0 and previous.startswith(text[idx:]):
+                text = text[:idx].strip()
+        return text
+
+    @staticmethod
+    def _is_duplicate(text: str, seen: List[set], threshold: float = 0.9) -> bool:
+        words = set(_WORD_RE.findall(text.lower()))
+        if not words:
+            return True
+        return any(len(words & other) / len(words | other) >= threshold for other in seen)
+
+    @staticmethod
+    def _assemble(selected: List[dict], headers: List[str]) -> str:
+        parts = []
+        for source_no in sorted({unit["source"] for unit in selected}):
+            units = sorted((u for u in selected if u["source"] == source_no), key=lambda u: u["position"])
+            parts.append(headers[source_no] + "\n".join(u["text"] for u in units))
+        return "\n\n".join(parts)
+
+
+context_builder = ContextBuilder(
+    create_token_counter(),
+    budget_tokens=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+)
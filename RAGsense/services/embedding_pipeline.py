@@ -0,0 +1,372 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from elasticsearch import Elasticsearch, helpers
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+from services.rag_service import (
+    chunk_text,
+    extract_text,
+    is_embedding_current,
+    iter_index_pit,
+    load_checkpoint,
+    pit_alive,
+    save_checkpoint,
+    stale_embedding_query,
+    text_fingerprint,
+)
+
+# Markiert das Ende eines Stroms in den Queues zwischen den Stufen
+_DONE = object()
+
+
+class StageStats:
+    """
+    Durchsatz einer Pipeline-Stufe: Dokumente und Arbeitszeit der Stufe.
+    Fetch, Extraktion und Encode messen ohne Wartezeiten auf andere Stufen,
+    Write misst die Laufzeit von parallel_bulk.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.docs = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, docs: int, seconds: float) -> None:
+        with self._lock:
+            self.docs += docs
+            self.busy_seconds += seconds
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.docs / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.docs} Dokumente, {self.docs_per_second:.1f} Dok/s"
+
+
+class EmbeddingPipeline:
+    """
+    Berechnet Embeddings für einen Index als Pipeline mit begrenzten Queues:
+
+        Fetch (PIT + search_after) -> Extraktion -> Encode -> Bulk-Write (parallel_bulk)
+
+    Jede Stufe läuft in einem eigenen Thread, sodass Elasticsearch-I/O und Encoding sich überlappen.
+    Die begrenzten Queues sorgen für Backpressure: ist eine Stufe langsamer, warten die vorherigen.
+    Optional verteilt ein Multi-Process-Pool von SentenceTransformer das Encoding auf mehrere Prozesse.
+
+    Mit chunk_index wird der Text zusätzlich in überlappende Passagen (chunk_max_tokens, chunk_overlap)
+    zerlegt; jede Passage wird mit parent_id auf das Dokument in den Passagen-Index geschrieben.
+    """
+
+    def __init__(
+        self,
+        elastic_client: Elasticsearch,
+        model: "SentenceTransformer",
+        model_version: str,
+        batch_size: int = 128,
+        keep_alive: str = "10m",
+        incremental: bool = False,
+        checkpoint_path: Optional[str] = None,
+        queue_size: int = 4,
+        write_threads: int = 2,
+        encode_processes: int = 0,
+        show_progress: bool = True,
+        chunk_index: Optional[str] = None,
+        chunk_max_tokens: int = 128,
+        chunk_overlap: int = 32,
+    ):
+        self._elastic_client = elastic_client
+        self._model = model
+        self._model_version = model_version
+        self._batch_size = batch_size
+        self._keep_alive = keep_alive
+        self._incremental = incremental
+        self._checkpoint_path = checkpoint_path
+        self._queue_size = queue_size
+        self._write_threads = write_threads
+        self._encode_processes = encode_processes
+        self._show_progress = show_progress
+        self._chunk_index = chunk_index
+        self._chunk_max_tokens = chunk_max_tokens
+        self._chunk_overlap = chunk_overlap
+
+        self.stats: Dict[str, StageStats] = {
+            name: StageStats(name) for name in ("fetch", "extract", "encode", "write")
+        }
+        self.processed = 0
+        self.skipped = 0
+        self._skip_current = incremental
+        self._errors: List[BaseException] = []
+
+    def run(self, index_name: str) -> int:
+        """
+        Führt die Pipeline für index_name aus.
+
+        Returns:
+            int: Anzahl der neu berechneten Dokumente.
+        """
+        checkpoint = load_checkpoint(self._checkpoint_path, index_name, self._model_version)
+        # Nicht-inkrementell werden alle Dokumente neu berechnet, siehe unten für den Neustart
+        self._skip_current = self._incremental
+        if checkpoint and not pit_alive(self._elastic_client, checkpoint.get("pit_id"), self._keep_alive):
+            # Die Position (search_after) gilt nur im PIT: der Lauf beginnt von vorne, mit frischen Zählern.
+            # Bereits berechnete Dokumente (Modell und Text-Hash aktuell) werden dabei übersprungen,
+            # auch ohne incremental, damit der abgebrochene Teil nicht noch einmal encodiert wird.
+            print("Point-in-Time aus dem Checkpoint ist abgelaufen, beginne von vorne "
+                  "(bereits aktuelle Dokumente werden übersprungen).")
+            checkpoint = {}
+            self._skip_current = True
+        self.processed = checkpoint.get("processed", 0)
+        self.skipped = checkpoint.get("skipped", 0)
+        # Aktuelle Dokumente filtert Elasticsearch heraus; sie zählen (einmal pro Lauf) als übersprungen
+        query = stale_embedding_query(self._model_version, self._chunk_index is not None) if self._skip_current else None
+        if query is not None and not checkpoint:
+            self.skipped += self._elastic_client.count(index=index_name, query={"bool": {"must_not": query}})["count"]
+
+        fetch_q: queue.Queue = queue.Queue(maxsize=self._queue_size)
+        encode_q: queue.Queue = queue.Queue(maxsize=self._queue_size)
+        write_q: queue.Queue = queue.Queue(maxsize=self._queue_size)
+
+        pool = None
+        if self._encode_processes > 1:
+            pool = self._model.start_multi_process_pool(target_devices=["cpu"] * self._encode_processes)
+
+        threads = [
+            threading.Thread(target=self._guard, args=(self._fetch, index_name, checkpoint, query, fetch_q), name="embed-fetch"),
+            threading.Thread(target=self._guard, args=(self._extract, index_name, fetch_q, encode_q), name="embed-extract"),
+            threading.Thread(target=self._guard, args=(self._encode, index_name, encode_q, write_q, pool), name="embed-encode"),
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        try:
+            self._write(index_name, write_q)
+        except BaseException as e:
+            self._errors.append(e)
+        finally:
+            for thread in threads:
+                thread.join()
+            if pool is not None:
+                self._model.stop_multi_process_pool(pool)
+
+        if self._errors:
+            raise self._errors[0]
+
+        # Lauf vollständig -> Checkpoint entfernen
+        if self._checkpoint_path and os.path.exists(self._checkpoint_path):
+            os.remove(self._checkpoint_path)
+
+        wall = time.perf_counter() - started
+        print(f"{self.processed} Embeddings berechnet, {self.skipped} Dokumente unverändert übersprungen "
+              f"({self.processed / wall if wall > 0 else 0.0:.1f} Dok/s gesamt).")
+        for stage in self.stats.values():
+            print(f"  {stage}")
+        return self.processed
+
+    def _guard(self, target, *args) -> None:
+        # Fehler einer Stufe merken; die übrigen Stufen brechen daraufhin ab (siehe _put/_get)
+        try:
+            target(*args)
+        except BaseException as e:
+            self._errors.append(e)
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        # Blockiert bei voller Queue (Backpressure), bricht aber ab, sobald eine andere Stufe fehlgeschlagen ist
+        while not self._errors:
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        # Wartet auf das nächste Element; liefert _DONE, sobald eine andere Stufe fehlgeschlagen ist
+        while not self._errors:
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fetch(self, index_name: str, checkpoint: dict, query: Optional[dict], out_q: queue.Queue) -> None:
+        batches = iter_index_pit(
+            self._elastic_client, index_name, self._batch_size, self._keep_alive, checkpoint, query
+        )
+        while True:
+            started = time.perf_counter()
+            batch = next(batches, None)
+            if batch is None:
+                break
+            self.stats["fetch"].add(len(batch[0]), time.perf_counter() - started)
+            if not self._put(out_q, batch):
+                return
+        self._put(out_q, _DONE)
+
+    def _extract(self, index_name: str, in_q: queue.Queue, out_q: queue.Queue) -> None:
+        while (item := self._get(in_q)) is not _DONE:
+            hits, position = item
+            started = time.perf_counter()
+            ids, texts, hashes, passages, rechunk_ids, skipped = [], [], [], [], [], 0
+            for doc in hits:
+                src = doc["_source"]
+                text = extract_text(src, index_name)
+                text_hash = text_fingerprint(text)
+                chunked = self._chunk_index is None or "embedding_chunks" in src
+                if self._skip_current and chunked and is_embedding_current(src, text_hash, self._model_version):
+                    skipped += 1
+                    continue
+                ids.append(doc["_id"])
+                texts.append(text)
+                hashes.append(text_hash)
+                if self._chunk_index is not None:
+                    # Attachments werden bei der Suche ausgeschlossen und deshalb nicht in Passagen zerlegt
+                    is_attachment = src.get("Type") == "Attachment"
+                    passages.append([] if is_attachment else chunk_text(
+                        text, self._model.tokenizer, self._chunk_max_tokens, self._chunk_overlap
+                    ))
+                    if "embedding_chunks" in src:
+                        # Schon einmal zerlegt: veraltete Passagen müssen beim Schreiben entfernt werden
+                        rechunk_ids.append(doc["_id"])
+            self.stats["extract"].add(len(hits), time.perf_counter() - started)
+            if not self._put(out_q, (ids, texts, hashes, passages, rechunk_ids, skipped, position)):
+                return
+        self._put(out_q, _DONE)
+
+    def _encode(self, index_name: str, in_q: queue.Queue, out_q: queue.Queue, pool) -> None:
+        while (item := self._get(in_q)) is not _DONE:
+            ids, texts, hashes, passages, rechunk_ids, skipped, position = item
+            started = time.perf_counter()
+            embeddings = self._encode_texts(texts, pool)
+            self.stats["encode"].add(len(texts), time.perf_counter() - started)
+
+            # Vektoren bleiben float32-Arrays; der Serializer des ES-Clients wandelt sie erst beim Bulk-Request um
+            actions = [
+                {
+                    "_op_type": "update",
+                    "_index": index_name,
+                    "_id": doc_id,
+                    "doc": {
+                        "embedding": emb,
+                        "embedding_text_hash": text_hash,
+                        "embedding_model": self._model_version,
+                    }
+                }
+                for doc_id, emb, text_hash in zip(ids, embeddings, hashes)
+            ]
+
+            chunk_ids = []
+            if self._chunk_index is not None:
+                started = time.perf_counter()
+                flat = [passage for doc_passages in passages for passage in doc_passages]
+                chunk_embeddings = iter(self._encode_texts(flat, pool))
+                self.stats["encode"].add(len(flat), time.perf_counter() - started)
+                for action, doc_id, doc_passages in zip(list(actions), ids, passages):
+                    action["doc"]["embedding_chunks"] = len(doc_passages)
+                    for chunk_no, passage in enumerate(doc_passages):
+                        chunk_ids.append(f"{doc_id}#{chunk_no}")
+                        actions.append({
+                            "_op_type": "index",
+                            "_index": self._chunk_index,
+                            "_id": chunk_ids[-1],
+                            "_source": {
+                                "parent_id": doc_id,
+                                "chunk_no": chunk_no,
+                                "passage": passage,
+                                "embedding": next(chunk_embeddings),
+                                "embedding_model": self._model_version,
+                            }
+                        })
+
+            if not self._put(out_q, (actions, rechunk_ids, chunk_ids, skipped, position)):
+                return
+        self._put(out_q, _DONE)
+
+    def _encode_texts(self, texts: List[str], pool):
+        if not texts:
+            return []
+        if pool is not None:
+            return self._model.encode_multi_process(texts, pool, batch_size=self._batch_size)
+        return self._model.encode(
+            texts,
+            batch_size=self._batch_size,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+        )
+
+    def _delete_stale_chunks(self, parent_ids: List[str], chunk_ids: List[str]) -> None:
+        # Passagen erneut zerlegter Dokumente entfernen, die es nach der neuen Zerlegung nicht mehr gibt
+        self._elastic_client.delete_by_query(
+            index=self._chunk_index,
+            query={"bool": {
+                "filter": [{"terms": {"parent_id": parent_ids}}],
+                "must_not": [{"ids": {"values": chunk_ids}}],
+            }},
+            conflicts="proceed",
+        )
+
+    def _write(self, index_name: str, in_q: queue.Queue) -> None:
+        # Offene Batches in Eingangsreihenfolge: [verbleibende Actions, übersprungene Dokumente, Position].
+        # parallel_bulk liefert die Ergebnisse in Reihenfolge der Actions, deshalb kann der Checkpoint
+        # genau dann geschrieben werden, wenn alle Actions eines Batches bestätigt sind.
+        pending = deque()
+        lock = threading.Lock()
+
+        def actions():
+            while (item := self._get(in_q)) is not _DONE:
+                batch_actions, rechunk_ids, chunk_ids, skipped, position = item
+                if rechunk_ids:
+                    self._delete_stale_chunks(rechunk_ids, chunk_ids)
+                with lock:
+                    pending.append([len(batch_actions), skipped, position])
+                yield from batch_actions
+
+        def complete_batches():
+            with lock:
+                while pending and pending[0][0] == 0:
+                    _, skipped, position = pending.popleft()
+                    self.skipped += skipped
+                    self._checkpoint(index_name, position)
+
+        started = time.perf_counter()
+        written = 0
+        for ok, info in helpers.parallel_bulk(
+            self._elastic_client,
+            actions(),
+            thread_count=self._write_threads,
+            chunk_size=self._batch_size,
+            queue_size=self._queue_size,
+        ):
+            # Leere Batches vor dem aktuellen zuerst abschließen, das Ergebnis gehört zum ersten offenen Batch
+            complete_batches()
+            with lock:
+                pending[0][0] -= 1
+            # Nur die Dokumente zählen, nicht die Passagen im Passagen-Index
+            if "update" in info:
+                self.processed += 1
+            written += 1
+            complete_batches()
+            if self._show_progress and written % (self._batch_size * 10) == 0:
+                print(f"{self.processed} Embeddings geschrieben...")
+
+        # Batches ohne Actions (alle übersprungen) am Ende abschließen
+        complete_batches()
+        self.stats["write"].add(written, time.perf_counter() - started)
+
+    def _checkpoint(self, index_name: str, position: dict) -> None:
+        save_checkpoint(self._checkpoint_path, {
+            "index": index_name,
+            "model": self._model_version,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            **position,
+        })
@@ -0,0 +1,138 @@
+import os
+import re
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+load_dotenv()
+
+# torch: PyTorch-Referenz, onnx: ONNX Runtime (fp32), onnx-int8: ONNX Runtime mit dynamischer int8-Quantisierung
+ENCODER_BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_ENCODER_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+# Beispielsätze für den Paritätscheck (Deutsch/Englisch wie in Jira und Wiki)
+PARITY_SENTENCES = [
+    "Wie richte ich den VPN-Zugang für neue Mitarbeiter ein?",
+    "Fehler beim Export der Rechnungen nach DATEV",
+    "Bearbeiter: Max Mustermann\nZusammenfassung: Login schlägt nach Passwortänderung fehl",
+    "How do I configure the nightly backup job?",
+    "Kunde meldet Timeout beim Upload großer PDF-Dateien",
+    "Release notes for version 4.2",
+    "Drucker im zweiten Stock druckt nur leere Seiten",
+    "Titel: Onboarding Checkliste\nInhalt: Hardware, Zugänge, Schulungen",
+]
+
+
+def intra_op_threads() -> int:
+    """
+    Anzahl der Threads pro ONNX-Runtime-Session (0 = Standard von ONNX Runtime).
+    """
+    return int(os.getenv("EMBEDDING_INTRA_OP_THREADS", "0"))
+
+
+def _session_options():
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    threads = intra_op_threads()
+    if threads > 0:
+        options.intra_op_num_threads = threads
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+def _export_dir(model_name: str) -> str:
+    # Lokales Verzeichnis für das exportierte (und quantisierte) ONNX-Modell
+    base = os.getenv("EMBEDDING_ONNX_DIR", "onnx_models")
+    return os.path.join(base, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+
+
+def load_sentence_transformer(model_name: str, backend: str = DEFAULT_ENCODER_BACKEND) -> "SentenceTransformer":
+    """
+    Lädt ein SentenceTransformer-Modell mit dem angegebenen Backend.
+
+    Bei onnx/onnx-int8 wird nur das Transformer-Modul in ONNX Runtime ausgeführt; Pooling und die
+    Dense-Schicht bleiben unverändert, die Vektoren behalten also Dimension und Normierung.
+    Das int8-Modell wird beim ersten Laden exportiert und in EMBEDDING_ONNX_DIR abgelegt.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unbekanntes Encoder-Backend '{backend}', erlaubt: {', '.join(ENCODER_BACKENDS)}")
+
+    if backend == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+
+    model_kwargs = {"provider": "CPUExecutionProvider", "session_options": _session_options()}
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    config = os.getenv("EMBEDDING_ONNX_QUANTIZATION", "avx2")
+    export_dir = _export_dir(model_name)
+    file_name = f"model_qint8_{config}.onnx"
+    if not os.path.exists(os.path.join(export_dir, "onnx", file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        print(f"Exportiere '{model_name}' als int8-ONNX-Modell ({config}) nach {export_dir} ...")
+        onnx_model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        onnx_model.save(export_dir)
+        export_dynamic_quantized_onnx_model(onnx_model, config, export_dir)
+
+    model_kwargs["file_name"] = os.path.join("onnx", file_name)
+    return SentenceTransformer(export_dir, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+
+def cosine_agreement(reference: np.ndarray, candidate: np.ndarray) -> np.ndarray:
+    """
+    Kosinus-Ähnlichkeit zeilenweise zwischen zwei Embedding-Matrizen.
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    dot = np.sum(reference * candidate, axis=1)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return dot / np.maximum(norms, 1e-12)
+
+
+def parity_check(
+    model_name: str,
+    backend: str,
+    sentences: Optional[List[str]] = None,
+    threshold: float = 0.99,
+    reference: Optional["SentenceTransformer"] = None,
+    candidate: Optional["SentenceTransformer"] = None,
+) -> dict:
+    """
+    Vergleicht die Embeddings eines Backends mit der PyTorch-Referenz.
+
+    Returns:
+        dict: Minimale und mittlere Kosinus-Übereinstimmung, Dimensionen und ob threshold erreicht wurde.
+    """
+    sentences = sentences or PARITY_SENTENCES
+    reference = reference or load_sentence_transformer(model_name, "torch")
+    candidate = candidate or load_sentence_transformer(model_name, backend)
+
+    ref_emb = reference.encode(sentences, convert_to_numpy=True)
+    cand_emb = candidate.encode(sentences, convert_to_numpy=True)
+    if ref_emb.shape != cand_emb.shape:
+        return {
+            "model": model_name,
+            "backend": backend,
+            "passed": False,
+            "error": f"Dimensionen weichen ab: {ref_emb.shape} vs. {cand_emb.shape}",
+        }
+
+    cosines = cosine_agreement(ref_emb, cand_emb)
+    return {
+        "model": model_name,
+        "backend": backend,
+        "sentences": len(sentences),
+        "dims": int(ref_emb.shape[1]),
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "threshold": threshold,
+        "passed": bool(cosines.min() >= threshold),
+    }
@@ -1,10 +1,30 @@
-from PyPDF2 import PdfReader
+import hashlib
+from typing import Iterator, Tuple
 
 class FileHandler:
     @staticmethod
     def extract_text_from_pdf(file_path):
+        return "".join(text for _, text in FileHandler.iter_pdf_pages(file_path))
+
+    @staticmethod
+    def iter_pdf_pages(file_path) -> Iterator[Tuple[int, str]]:
+        """
+        Liefert die Seiten einer PDF einzeln als (Seitennummer ab 1, Text), ohne das Dokument
+        im Speicher zusammenzusetzen. Seiten ohne extrahierbaren Text ergeben einen leeren String.
+        """
+        from PyPDF2 import PdfReader  # erst hier: Manifest und Hash kommen ohne PyPDF2 aus
+
         reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        return text
+        for page_number, page in enumerate(reader.pages, start=1):
+            yield page_number, page.extract_text() or ""
+
+    @staticmethod
+    def file_hash(file_path, block_size: int = 1 << 20) -> str:
+        """
+        SHA-256 des Dateiinhalts, blockweise gelesen.
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
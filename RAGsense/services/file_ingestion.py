@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from elasticsearch import Elasticsearch, helpers
+
+from services.file_handler import FileHandler
+
+PDF_EXTENSIONS = (".pdf",)
+
+
+class IngestManifest:
+    """
+    Stand der letzten Läufe als JSON-Datei: je Datei mtime, size, hash und die indizierten Seiten.
+    Eine Datei wird erst eingetragen, wenn alle ihre Seiten geschrieben sind.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self._path = path
+        self.files: Dict[str, dict] = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.files = json.load(f)
+
+    def save(self) -> None:
+        if not self._path:
+            return
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.files, f)
+        os.replace(tmp_path, self._path)
+
+
+def iter_files(root: str, extensions: Tuple[str, ...] = PDF_EXTENSIONS) -> Iterator[str]:
+    """
+    Alle Dateien unterhalb von root mit passender Endung, als absolute Pfade in stabiler Reihenfolge.
+    """
+    for dirpath, dirnames, filenames in os.walk(os.path.abspath(root)):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                yield os.path.join(dirpath, filename)
+
+
+def page_doc_id(path: str, page_number: int) -> str:
+    # Stabile ID pro Seite, unabhängig von Sonderzeichen im Pfad
+    return f"{hashlib.sha1(path.encode('utf-8')).hexdigest()}-{page_number}"
+
+
+def extract_pdf(path: str, previous_hash: Optional[str]) -> dict:
+    """
+    Läuft im Worker-Prozess: hasht die Datei und extrahiert bei geändertem Inhalt die Seiten
+    mit Text als [(Seitennummer, Text)]. Fehler werden als 'error' zurückgegeben.
+    """
+    try:
+        stat = os.stat(path)
+        result = {"path": path, "mtime": stat.st_mtime, "size": stat.st_size, "hash": FileHandler.file_hash(path)}
+        if result["hash"] == previous_hash:
+            result["unchanged"] = True
+            return result
+        result["pages"] = [
+            (page_number, text.strip())
+            for page_number, text in FileHandler.iter_pdf_pages(path)
+            if text.strip()
+        ]
+        return result
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+
+
+class FileIngestionPipeline:
+    """
+    Indiziert PDFs eines Verzeichnisses seitenweise in einen Index (z.B. FILES_INDEX):
+
+        Crawl -> Extraktion (Prozess-Pool) -> streaming_bulk
+
+    Dateien mit unveränderter mtime und Größe werden ohne Lesen übersprungen, bei geänderter mtime
+    entscheidet der Hash. Höchstens max_pending Dateien sind gleichzeitig in Extraktion; da
+    streaming_bulk die Aktionen erst bei Bedarf abruft, wartet die Extraktion auf Elasticsearch.
+    Jede Seite wird ein Dokument mit page_number; weggefallene Seiten werden gelöscht.
+    """
+
+    def __init__(
+        self,
+        elastic_client: Elasticsearch,
+        index_name: str,
+        manifest: IngestManifest,
+        workers: int = 0,
+        max_pending: int = 0,
+        chunk_size: int = 200,
+        max_chunk_bytes: int = 20 * 1024 * 1024,
+        save_every: int = 50,
+    ):
+        self._es = elastic_client
+        self._index = index_name
+        self.manifest = manifest
+        self._workers = workers or os.cpu_count() or 1
+        self._max_pending = max_pending or self._workers * 2
+        self._chunk_size = chunk_size
+        self._max_chunk_bytes = max_chunk_bytes
+        self._save_every = save_every
+        # Dateien, deren Aktionen an streaming_bulk übergeben wurden: Pfad -> [offene Aktionen, Manifest-Eintrag, ok]
+        self._in_bulk: Dict[str, list] = {}
+        # Dokument-ID der offenen Aktionen -> Pfad der Datei
+        self._bulk_ids: Dict[str, str] = {}
+        self.stats = {"seen": 0, "unchanged": 0, "indexed": 0, "failed": 0, "pages": 0, "deleted_pages": 0}
+
+    def run(self, root: str, prune: bool = False) -> dict:
+        """
+        Args:
+            root: Verzeichnis, das rekursiv gecrawlt wird.
+            prune: Seiten von Dateien löschen, die im Manifest stehen, unter root aber nicht mehr existieren.
+        """
+        started = time.time()
+        seen: Set[str] = set()
+        try:
+            results = self._extract(self._changed_files(root, seen))
+            for ok, info in helpers.streaming_bulk(
+                self._es,
+                self._actions(results),
+                chunk_size=self._chunk_size,
+                max_chunk_bytes=self._max_chunk_bytes,
+                raise_on_error=False,
+                max_retries=3,
+            ):
+                self._acknowledge(ok, info)
+            if prune:
+                self._prune(root, seen)
+        finally:
+            self.manifest.save()
+        self.stats["seconds"] = time.time() - started
+        return self.stats
+
+    def _changed_files(self, root: str, seen: Set[str]) -> Iterator[Tuple[str, Optional[str]]]:
+        for path in iter_files(root):
+            seen.add(path)
+            self.stats["seen"] += 1
+            entry = self.manifest.files.get(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                self.stats["unchanged"] += 1
+                continue
+            yield path, entry["hash"] if entry else None
+
+    def _extract(self, files: Iterator[Tuple[str, Optional[str]]]) -> Iterator[dict]:
+        # Begrenztes Fenster an Aufträgen im Pool; Ergebnisse in Crawl-Reihenfolge
+        with ProcessPoolExecutor(max_workers=self._workers) as pool:
+            pending = deque()
+            for path, previous_hash in files:
+                pending.append(pool.submit(extract_pdf, path, previous_hash))
+                if len(pending) >= self._max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _actions(self, results: Iterator[dict]) -> Iterator[dict]:
+        for result in results:
+            path = result["path"]
+            if "error" in result:
+                print(f"Fehler beim Lesen von {path}: {result['error']}")
+                self.stats["failed"] += 1
+                continue
+
+            previous = self.manifest.files.get(path)
+            if result.get("unchanged"):
+                # Nur mtime geändert: Eintrag aktualisieren, damit die Datei beim nächsten Lauf nicht erneut gehasht wird
+                self.manifest.files[path] = {**previous, "mtime": result["mtime"], "size": result["size"]}
+                self.stats["unchanged"] += 1
+                continue
+
+            pages = [page_number for page_number, _ in result["pages"]]
+            entry = {"mtime": result["mtime"], "size": result["size"], "hash": result["hash"], "pages": pages}
+            actions = [self._page_action(result, page_number, text) for page_number, text in result["pages"]]
+            stale = set(previous["pages"]) - set(pages) if previous else set()
+            actions += [
+                {"_op_type": "delete", "_index": self._index, "_id": page_doc_id(path, page_number)}
+                for page_number in sorted(stale)
+            ]
+            self.stats["deleted_pages"] += len(stale)
+
+            if not actions:
+                self._file_done(path, entry)
+                continue
+            self._in_bulk[path] = [len(actions), entry, True]
+            for action in actions:
+                self._bulk_ids[action["_id"]] = path
+            yield from actions
+
+    def _page_action(self, result: dict, page_number: int, text: str) -> dict:
+        path = result["path"]
+        doc_id = page_doc_id(path, page_number)
+        return {
+            "_op_type": "index",
+            "_index": self._index,
+            "_id": doc_id,
+            "_source": {
+                "id": doc_id,
+                "title": os.path.basename(path),
+                "body": text,
+                "path": path,
+                "created_at": datetime.fromtimestamp(result["mtime"], tz=timezone.utc).isoformat(),
+                "size": result["size"],
+                "page_number": page_number,
+            },
+        }
+
+    def _acknowledge(self, ok: bool, info: dict) -> None:
+        # Zuordnung über die Dokument-ID: wiederholte Aktionen (z.B. nach 429) kommen erst nach späteren zurück
+        op_type, item = next(iter(info.items()))
+        if op_type == "delete" and item.get("status") == 404:
+            ok = True
+        elif op_type == "index" and ok:
+            self.stats["pages"] += 1
+        if not ok:
+            print(f"Fehler beim Schreiben von {item.get('_id')}: {item.get('error')}")
+
+        path = self._bulk_ids.pop(item.get("_id"), None)
+        if path is None:
+            return
+        current = self._in_bulk[path]
+        current[0] -= 1
+        current[2] = current[2] and ok
+        if current[0] == 0:
+            del self._in_bulk[path]
+            if current[2]:
+                self._file_done(path, current[1])
+            else:
+                self.stats["failed"] += 1
+
+    def _file_done(self, path: str, entry: dict) -> None:
+        self.manifest.files[path] = entry
+        self.stats["indexed"] += 1
+        if self.stats["indexed"] % self._save_every == 0:
+            self.manifest.save()
+            print(f"{self.stats['indexed']} Dateien indiziert, {self.stats['pages']} Seiten...")
+
+    def _prune(self, root: str, seen: Set[str]) -> None:
+        prefix = os.path.join(os.path.abspath(root), "")
+        removed = [path for path in self.manifest.files if path.startswith(prefix) and path not in seen]
+        actions = [
+            {"_op_type": "delete", "_index": self._index, "_id": page_doc_id(path, page_number)}
+            for path in removed
+            for page_number in self.manifest.files[path]["pages"]
+        ]
+        for ok, info in helpers.streaming_bulk(self._es, actions, chunk_size=self._chunk_size, raise_on_error=False):
+            if ok:
+                self.stats["deleted_pages"] += 1
+        for path in removed:
+            del self.manifest.files[path]
+        if removed:
+            print(f"{len(removed)} gelöschte Dateien aus dem Index entfernt.")
@@ -0,0 +1,190 @@
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+except ImportError:  # /metrics ist dann abgeschaltet, Server-Timing und timings funktionieren weiter
+    Histogram = None
+
+METRICS_AVAILABLE = Histogram is not None
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+if METRICS_AVAILABLE:
+    STAGE_SECONDS = Histogram(
+        "rag_stage_seconds", "Dauer einzelner Verarbeitungsschritte",
+        ["stage", "source", "search_type"], buckets=_LATENCY_BUCKETS,
+    )
+    REQUEST_SECONDS = Histogram(
+        "rag_request_seconds", "Dauer der HTTP-Anfragen bis zum Senden der Header",
+        ["endpoint", "method", "status"], buckets=_LATENCY_BUCKETS,
+    )
+    LLM_TOKENS = Counter("rag_llm_tokens_total", "Tokens der LLM-Anfragen", ["kind"])
+    LLM_TOKENS_PER_SECOND = Histogram(
+        "rag_llm_tokens_per_second", "Generierte Tokens pro Sekunde je LLM-Anfrage",
+        buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 250),
+    )
+    SEARCH_CACHE_REQUESTS = Counter("rag_search_cache_requests_total", "Zugriffe auf den Such-Cache", ["result"])
+    SEARCH_CACHE_SAVED_SECONDS = Counter(
+        "rag_search_cache_saved_seconds_total", "Durch Treffer im Such-Cache eingesparte Suchzeit"
+    )
+else:
+    STAGE_SECONDS = REQUEST_SECONDS = LLM_TOKENS = LLM_TOKENS_PER_SECOND = None
+    SEARCH_CACHE_REQUESTS = SEARCH_CACHE_SAVED_SECONDS = None
+
+
+class RequestTimings:
+    """
+    Zeiten der Verarbeitungsschritte einer HTTP-Anfrage (Sekunden, aufsummiert je Schritt und Quelle)
+    sowie die Token-Zahlen der LLM-Anfragen.
+    """
+
+    __slots__ = ("stages", "search_type", "prompt_tokens", "completion_tokens", "llm_seconds")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.search_type = ""
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.llm_seconds = 0.0
+
+    def add(self, key: str, seconds: float) -> None:
+        self.stages[key] = self.stages.get(key, 0.0) + seconds
+
+    def server_timing(self, total_seconds: float) -> str:
+        parts = [f"{key};dur={seconds * 1000:.1f}" for key, seconds in self.stages.items()]
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": {key: round(seconds * 1000, 2) for key, seconds in self.stages.items()},
+            "llmPromptTokens": self.prompt_tokens,
+            "llmCompletionTokens": self.completion_tokens,
+            "llmTokensPerSecond": (
+                self.completion_tokens / self.llm_seconds if self.completion_tokens and self.llm_seconds > 0 else None
+            ),
+        }
+
+
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """
+    Zeiten der laufenden HTTP-Anfrage oder None außerhalb einer Anfrage (z.B. in Skripten).
+    """
+    return _request_timings.get()
+
+
+def set_search_type(search_type: str) -> None:
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.search_type = search_type
+
+
+def observe(name: str, seconds: float, source: str = "") -> None:
+    """
+    Erfasst die Dauer eines Schritts im Histogramm und in den Zeiten der laufenden Anfrage.
+    """
+    timings = _request_timings.get()
+    if STAGE_SECONDS is not None:
+        STAGE_SECONDS.labels(name, source, timings.search_type if timings else "").observe(seconds)
+    if timings is not None:
+        timings.add(f"{name}.{source}" if source else name, seconds)
+
+
+class stage:
+    """
+    Misst einen Schritt per with-Block, z.B. ``with stage("es", index_name): ...``.
+    Nach dem Block steht die Dauer in seconds.
+    """
+
+    __slots__ = ("name", "source", "started", "seconds")
+
+    def __init__(self, name: str, source: str = ""):
+        self.name = name
+        self.source = source
+        self.seconds = 0.0
+
+    def __enter__(self) -> "stage":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.seconds = time.perf_counter() - self.started
+        observe(self.name, self.seconds, self.source)
+        return False
+
+
+def record_llm_usage(prompt_tokens: Optional[int], completion_tokens: Optional[int], seconds: float) -> None:
+    """
+    Token-Zahlen und Generierungsdauer einer LLM-Anfrage (für Tokens/s).
+    """
+    if LLM_TOKENS is not None:
+        if prompt_tokens:
+            LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS.labels("completion").inc(completion_tokens)
+            if seconds > 0:
+                LLM_TOKENS_PER_SECOND.observe(completion_tokens / seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        if prompt_tokens is not None:
+            timings.prompt_tokens = (timings.prompt_tokens or 0) + prompt_tokens
+        if completion_tokens is not None:
+            timings.completion_tokens = (timings.completion_tokens or 0) + completion_tokens
+        timings.llm_seconds += seconds
+
+
+def record_search_cache(result: str, saved_seconds: float = 0.0) -> None:
+    """
+    Zugriff auf den Such-Cache: result ist hit, miss oder invalidated; bei hit die eingesparte Suchzeit.
+    """
+    if SEARCH_CACHE_REQUESTS is not None:
+        SEARCH_CACHE_REQUESTS.labels(result).inc()
+        if saved_seconds:
+            SEARCH_CACHE_SAVED_SECONDS.inc(saved_seconds)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Alle Metriken im Prometheus-Textformat und der zugehörige Content-Type.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI-Middleware: legt pro HTTP-Anfrage ein RequestTimings an, setzt beim Senden der Header
+    den Server-Timing-Header und erfasst die Gesamtdauer je Endpunkt.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - started
+                MutableHeaders(scope=message).append("Server-Timing", timings.server_timing(total))
+                if REQUEST_SECONDS is not None:
+                    route = scope.get("route")
+                    endpoint = getattr(route, "path", None) or "unmatched"
+                    REQUEST_SECONDS.labels(endpoint, scope["method"], str(message["status"])).observe(total)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from services.instrumentation import observe
+
+load_dotenv()
+
+
+class LLMPriority(IntEnum):
+    """
+    Priorität einer LLM-Anfrage; kleinere Werte werden zuerst bedient.
+    """
+    interactive = 0
+    bulk = 1
+
+
+class LLMOverloadedError(Exception):
+    """
+    Die Anfrage wurde abgewiesen: Warteschlange voll (429), verdrängt oder Deadline abgelaufen (503).
+    retry_after ist die geschätzte Wartezeit in Sekunden bis zu einem erneuten Versuch.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future", "enqueued_at")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """
+    Begrenzt die gleichzeitigen Completions am LLM-Server (max_in_flight).
+
+    Weitere Anfragen warten in einer begrenzten Prioritäts-Warteschlange (interaktiv vor bulk,
+    innerhalb einer Priorität in Ankunftsreihenfolge). Ist sie voll, wird die Anfrage sofort mit 429
+    abgewiesen bzw. ein wartender bulk-Auftrag zugunsten einer interaktiven Anfrage verdrängt.
+    Wer bis zu seiner Deadline keinen Slot bekommt, erhält 503. Beides mit geschätztem Retry-After.
+    """
+
+    def __init__(self, max_in_flight: int = 2, max_queue: int = 32, queue_timeout: float = 30.0):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        # Laufzeiten der letzten Completions (Sekunden) für die Retry-After-Schätzung
+        self._durations = deque(maxlen=100)
+        self._waits = deque(maxlen=1000)
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.expired = 0
+
+    @asynccontextmanager
+    async def slot(self, priority: LLMPriority = LLMPriority.interactive, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Hält einen Completion-Slot für die Dauer des with-Blocks.
+
+        Args:
+            priority: interaktiv oder bulk.
+            deadline: Maximale Wartezeit auf den Slot in Sekunden (Standard: queue_timeout).
+        """
+        await self.acquire(priority, deadline)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._durations.append(time.perf_counter() - started)
+            self.release()
+
+    def check_admission(self, priority: LLMPriority = LLMPriority.interactive) -> None:
+        """
+        Weist eine Anfrage vorab ab, wenn sie weder einen Slot noch einen Platz in der Warteschlange bekäme
+        (z.B. vor dem Start einer Streaming-Antwort, die danach keinen Statuscode mehr setzen kann).
+        """
+        if self._in_flight < self.max_in_flight or len(self._queue) < self.max_queue:
+            return
+        if priority == LLMPriority.interactive and any(w.priority > priority for w in self._queue):
+            return
+        self.rejected += 1
+        raise LLMOverloadedError("LLM-Warteschlange ist voll", 429, self.retry_after())
+
+    async def acquire(self, priority: LLMPriority = LLMPriority.interactive, deadline: Optional[float] = None) -> None:
+        if self._in_flight < self.max_in_flight and not self._queue:
+            self._in_flight += 1
+            self.admitted += 1
+            self._waits.append(0.0)
+            observe("llm_queue", 0.0)
+            return
+
+        if len(self._queue) >= self.max_queue:
+            self._shed_for(priority)
+
+        waiter = _Waiter(int(priority), next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        timeout = self.queue_timeout if deadline is None else deadline
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.exception():
+                # Slot wurde genau zum Timeout vergeben: zurückgeben
+                self.release()
+            else:
+                self._remove(waiter)
+            self.expired += 1
+            raise LLMOverloadedError("Kein LLM-Slot innerhalb der Deadline frei", 503, self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and not waiter.future.exception():
+                self.release()
+            else:
+                self._remove(waiter)
+            raise
+        self.admitted += 1
+        self._waits.append(time.perf_counter() - waiter.enqueued_at)
+        observe("llm_queue", self._waits[-1])
+
+    def release(self) -> None:
+        # Slot an den nächsten Wartenden übergeben (der Zähler bleibt dann gleich)
+        while self._queue:
+            waiter = heapq.heappop(self._queue)
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    def _shed_for(self, priority: LLMPriority) -> None:
+        # Warteschlange voll: den jüngsten Auftrag niedrigerer Priorität verdrängen, sonst abweisen
+        victims = [w for w in self._queue if w.priority > priority and not w.future.done()]
+        if not victims:
+            self.rejected += 1
+            raise LLMOverloadedError("LLM-Warteschlange ist voll", 429, self.retry_after())
+        victim = max(victims)
+        self._remove(victim)
+        victim.future.set_exception(
+            LLMOverloadedError("Zugunsten einer interaktiven Anfrage verdrängt", 503, self.retry_after())
+        )
+        self.shed += 1
+
+    def _remove(self, waiter: _Waiter) -> None:
+        if waiter in self._queue:
+            self._queue.remove(waiter)
+            heapq.heapify(self._queue)
+
+    def retry_after(self) -> int:
+        """
+        Geschätzte Sekunden, bis die aktuelle Warteschlange abgearbeitet ist (mindestens 1).
+        """
+        avg = sum(self._durations) / len(self._durations) if self._durations else 5.0
+        return max(1, math.ceil(avg * (len(self._queue) + 1) / max(self.max_in_flight, 1)))
+
+    def stats(self) -> Dict[str, object]:
+        waits = sorted(self._waits)
+        depth = {p.name: sum(1 for w in self._queue if w.priority == p) for p in LLMPriority}
+        return {
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": len(self._queue),
+            "queue_depth_by_priority": depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "expired": self.expired,
+            "avg_wait_ms": sum(waits) / len(waits) * 1000 if waits else 0.0,
+            "p95_wait_ms": waits[int(len(waits) * 0.95) - 1] * 1000 if waits else 0.0,
+            "max_wait_ms": waits[-1] * 1000 if waits else 0.0,
+            "avg_completion_ms": sum(self._durations) / len(self._durations) * 1000 if self._durations else 0.0,
+        }
+
+
+# Gemeinsam für alle Endpunkte eines Prozesses; LLM_MAX_IN_FLIGHT entspricht den parallelen Slots des LLM-Servers
+llm_scheduler = LLMScheduler(
+    max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "2")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "30")),
+)
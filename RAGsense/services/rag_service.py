@@ -1,16 +1,36 @@
+import hashlib
+import json
 import linecache
 import os
+import queue
+import threading
+import time
 import warnings
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date
 from enum import Enum
-from typing import Any
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Optional, Tuple
 from typing import List, Dict
 
+import numpy as np
 from dateutil import parser
 from dotenv import load_dotenv
 from elastic_transport import ObjectApiResponse
-from elasticsearch import Elasticsearch, helpers
+from elasticsearch import BadRequestError, Elasticsearch, NotFoundError
 from openai import OpenAI
-from sentence_transformers import SentenceTransformer
+
+from services.context_builder import context_builder
+from services.encoder_backend import DEFAULT_ENCODER_BACKEND, load_sentence_transformer
+from services.instrumentation import stage
+
+if TYPE_CHECKING:
+    # sentence_transformers (inkl. torch) wird erst beim Laden eines Modells importiert,
+    # damit der Import dieses Moduls den Start der API nicht verzögert
+    from sentence_transformers import SentenceTransformer
+
+load_dotenv()
 
 class SourceType(str, Enum):
     jira = "Jira"
@@ -18,99 +38,1182 @@ class SourceType(str, Enum):
     network_drive = "Network Drive"
     unknown = "Unknown"
 
-def prepare_search_results(response: ObjectApiResponse, index_name: str) -> List[Dict[str, Any]]:
+
+class VectorSearchMode(str, Enum):
+    exact = "Exact"  # Brute-Force: script_score mit cosineSimilarity über alle Dokumente
+    knn = "kNN"      # Approximativ: HNSW-Index über den knn-Abschnitt von Elasticsearch
+
+
+class HybridMode(str, Enum):
+    weighted = "Weighted"  # BM25 + Cosine per script_score über alle Dokumente
+    rrf = "RRF"            # Begrenzte BM25- und kNN-Abfrage, fusioniert per Reciprocal Rank Fusion
+
+
+# Filter, der Anhänge (Type = Attachment) aus allen Suchen ausschließt
+ATTACHMENT_FILTER = {"bool": {"must_not": {"term": {"Type": "Attachment"}}}}
+
+
+def embedding_field_mapping(dims: int, quantize: bool = True, m: int = 16, ef_construction: int = 100) -> dict:
+    """
+    Mapping für das Feld 'embedding' als indizierter dense_vector mit HNSW-Graph.
+
+    :param dims: Dimension der Embeddings (z.B. 512 für distiluse-base-multilingual-cased-v1)
+    :param quantize: int8-Quantisierung des HNSW-Index (ca. 4x weniger Speicher)
+    :param m: Anzahl Nachbarn pro Knoten im HNSW-Graph
+    :param ef_construction: Kandidatenliste beim Aufbau des Graphen
+    """
+    return {
+        "type": "dense_vector",
+        "dims": dims,
+        "index": True,
+        "similarity": "cosine",
+        "index_options": {
+            "type": "int8_hnsw" if quantize else "hnsw",
+            "m": m,
+            "ef_construction": ef_construction,
+        },
+    }
+
+
+def exact_vector_search_body(query_vector: List[float], top_k: int) -> dict:
+    """
+    Exakte Vektorsuche: script_score mit cosineSimilarity über alle Dokumente (außer Attachments).
+    """
+    return {
+        "size": top_k,
+        "query": {
+            "script_score": {
+                # 1) Erst filtern …
+                "query": {
+                    "bool": {
+                        "must":   {"match_all": {}},            # alle Dokumente
+                        "must_not": {"term": {
+                            "Type": "Attachment"
+                            }
+                        }  # … außer type=attachment
+                    }
+                },
+                # 2) … dann mit dem Vektor scorieren
+                "script": {
+                    "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
+                    "params": {"query_vector": query_vector}
+                }
+            }
+        }
+    }
+
+
+# Höchstwert von Elasticsearch für k und num_candidates einer kNN-Abfrage
+KNN_MAX_CANDIDATES = 10000
+
+
+def knn_search_body(query_vector: List[float], top_k: int, num_candidates: Optional[int] = None) -> dict:
+    """
+    Approximative Vektorsuche über den HNSW-Index (knn-Abschnitt).
+    Attachments werden als Pre-Filter ausgeschlossen, damit trotzdem k Treffer zurückkommen.
+    k und num_candidates werden auf KNN_MAX_CANDIDATES begrenzt.
+    """
+    k = min(top_k, KNN_MAX_CANDIDATES)
+    if num_candidates is None:
+        num_candidates = max(k * 10, 100)
+    return {
+        "size": k,
+        "knn": {
+            "field": "embedding",
+            "query_vector": query_vector,
+            "k": k,
+            "num_candidates": min(max(num_candidates, k), KNN_MAX_CANDIDATES),
+            "filter": ATTACHMENT_FILTER,
+        }
+    }
+
+
+# Teile der Fehlermeldungen von Elasticsearch, wenn 'embedding' nicht per HNSW durchsuchbar ist
+KNN_MAPPING_ERRORS = ("dense_vector", "[index] set to [true]", "is not indexed", "does not exist in the mapping")
+
+
+def is_knn_mapping_error(error) -> bool:
+    """
+    Ob eine fehlgeschlagene kNN-Abfrage am Mapping des Index liegt (Feld kein dense_vector oder
+    nicht indiziert). Exception oder 'error' aus einer _msearch-Antwort.
+    """
+    text = str(getattr(error, "body", None) or error).lower()
+    return any(marker.lower() in text for marker in KNN_MAPPING_ERRORS)
+
+
+def note_knn_error(knn_unsupported: set, index_name: str, error) -> None:
+    """
+    Meldet eine fehlgeschlagene kNN-Abfrage, nach der der Aufrufer exakt sucht. Nur bei einem
+    Mapping-Fehler gilt das für alle weiteren Anfragen (bis ensure_knn_mapping); andere Fehler
+    (z.B. ein 400 wegen einzelner Parameter) betreffen nur diese Anfrage.
+    """
+    if is_knn_mapping_error(error):
+        print(f"kNN-Suche auf '{index_name}' nicht möglich, nutze exakte Suche: {error}")
+        knn_unsupported.add(index_name)
+    else:
+        print(f"kNN-Abfrage auf '{index_name}' fehlgeschlagen, nutze für diese Anfrage die exakte Suche: {error}")
+
+
+# Passagen eines Dokuments liegen im Nebenindex "<index>_chunks" mit parent_id auf das Dokument
+CHUNK_INDEX_SUFFIX = os.getenv("CHUNK_INDEX_SUFFIX", "_chunks")
+
+
+def chunk_index_name(index_name: str) -> str:
+    return f"{index_name}{CHUNK_INDEX_SUFFIX}"
+
+
+def chunk_search_body(
+    query_vector: List[float],
+    top_k: int,
+    num_candidates: Optional[int] = None,
+    passages_per_parent: int = 3,
+) -> dict:
+    """
+    kNN-Suche im Passagen-Index, per collapse auf das Dokument (parent_id) zusammengefasst.
+    inner_hits liefert je Dokument die passages_per_parent besten Passagen.
+    """
+    # Mehr Passagen holen als Dokumente gebraucht werden, da mehrere Passagen auf dasselbe Dokument fallen
+    k = min(top_k * max(passages_per_parent, 1), KNN_MAX_CANDIDATES)
+    if num_candidates is None:
+        num_candidates = max(k * 10, 100)
+    return {
+        "size": top_k,
+        "_source": ["parent_id"],
+        "knn": {
+            "field": "embedding",
+            "query_vector": query_vector,
+            "k": k,
+            "num_candidates": min(max(num_candidates, k), KNN_MAX_CANDIDATES),
+        },
+        "collapse": {
+            "field": "parent_id",
+            "inner_hits": {
+                "name": "passages",
+                "size": passages_per_parent,
+                "_source": ["passage", "chunk_no"],
+            },
+        },
+    }
+
+
+def collapse_passages(response: ObjectApiResponse) -> List[Tuple[str, float, List[str]]]:
+    """
+    Liest eine Antwort von chunk_search_body aus.
+
+    Returns:
+        List[Tuple[str, float, List[str]]]: (parent_id, Score der besten Passage, beste Passagen) in Rangfolge.
+    """
+    collapsed = []
+    for hit in response.get("hits", {}).get("hits", []):
+        parent_id = hit.get("_source", {}).get("parent_id")
+        if parent_id is None:
+            continue
+        inner = hit.get("inner_hits", {}).get("passages", {}).get("hits", {}).get("hits", [])
+        passages = [h["_source"]["passage"] for h in inner if h.get("_source", {}).get("passage")]
+        collapsed.append((parent_id, hit.get("_score", 0.0), passages))
+    return collapsed
+
+
+def passage_parent_hits(collapsed: List[Tuple[str, float, List[str]]], docs: List[dict]) -> List[dict]:
+    """
+    Setzt aus den zusammengefassten Passagen und den per mget geladenen Dokumenten rohe Hits zusammen
+    (Score der besten Passage, Passagen unter '_passages'). Nicht mehr vorhandene Dokumente entfallen.
+    """
+    found = {doc["_id"]: doc for doc in docs if doc.get("found")}
+    hits = []
+    for parent_id, score, passages in collapsed:
+        doc = found.get(parent_id)
+        if doc is None:
+            continue
+        hits.append({
+            "_index": doc["_index"],
+            "_id": parent_id,
+            "_score": score,
+            "_source": doc.get("_source", {}),
+            "_passages": passages,
+        })
+    return hits
+
+
+def query_string_search_body(query: str, size: int) -> dict:
+    """
+    Einfache Keyword-Suche (query_string) über alle Dokumente.
+    """
+    return {
+        "query": {
+            "query_string": {
+                "query": query,
+                # optional: lenient=true bei z.B. Zahlen-/Datumsparse-Fehlern
+                # "lenient": True
+            }
+        },
+        "size": size
+    }
+
+
+def weighted_hybrid_search_body(
+    query: str,
+    query_vector: List[float],
+    top_k: int,
+    bm25_weight: float = 1.0,
+    embedding_weight: float = 35.0,
+) -> dict:
+    """
+    Hybride Abfrage: bm25_weight * BM25 + embedding_weight * (Cosine + 1) per script_score.
+    """
+    return {
+        "size": top_k,
+        "query": {
+            "script_score": {
+                # a) Alle Dokumente (außer Attachments) durchsuchen
+                "query": {
+                    "bool": {
+                        "should": [
+                            {"query_string": {"query": query}},  # BM25-Teil
+                            {"match_all": {}}                      # Basis für Embeddings
+                        ],
+                        "must_not": {"term": {"Type": "Attachment"}}
+                    }
+                },
+                # b) Score-Kombination: bm25_weight * BM25 + embedding_weight * (Cosine + Offset)
+                "script": {
+                    "source": (
+                        "double bm25 = _score;"
+                        "double emb = cosineSimilarity(params.query_vector, 'embedding') + 1.0;"
+                        "return params.bm25_weight * bm25 + params.embedding_weight * emb;"
+                    ),
+                    "params": {
+                        "query_vector": query_vector,
+                        "bm25_weight": bm25_weight,
+                        "embedding_weight": embedding_weight
+                    }
+                }
+            }
+        }
+    }
+
+
+def keyword_search_body(query: str, size: int) -> dict:
+    """
+    BM25-Abfrage (query_string) ohne Attachments, z.B. als Keyword-Teil der RRF-Hybridsuche.
+    """
+    return {
+        "size": size,
+        "query": {
+            "bool": {
+                "must": {"query_string": {"query": query}},
+                "must_not": {"term": {"Type": "Attachment"}}
+            }
+        }
+    }
+
+
+def reciprocal_rank_fusion(result_lists: List[List[dict]], rank_constant: int = 60, top_k: int = 10) -> List[dict]:
+    """
+    Fusioniert mehrere Trefferlisten (rohe Elasticsearch-Hits) per Reciprocal Rank Fusion:
+    score(d) = Summe über alle Listen von 1 / (rank_constant + rank(d)).
+
+    Dokumente werden über (_index, _id) dedupliziert; der _score der zurückgegebenen Hits
+    ist der RRF-Score.
+    """
+    fused: Dict[tuple, dict] = {}
+    scores: Dict[tuple, float] = {}
+
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, start=1):
+            key = (hit.get("_index"), hit.get("_id"))
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rank_constant + rank)
+            fused.setdefault(key, hit)
+            if "_passages" in hit and "_passages" not in fused[key]:
+                # Passagen aus der Passagen-Suche übernehmen, auch wenn der BM25-Treffer zuerst kam
+                fused[key] = {**fused[key], "_passages": hit["_passages"]}
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [{**fused[key], "_score": scores[key]} for key in ranked]
+
+
+# Sortierung für die Cursor-Pagination: Score absteigend, _shard_doc als eindeutiger Tiebreak innerhalb des PIT
+SCORE_SORT = [{"_score": "desc"}, {"_shard_doc": "asc"}]
+
+
+def with_pit(body: dict, pit_id: str, keep_alive: str) -> dict:
+    """
+    Führt die Abfrage auf einem Point-in-Time aus (der Index ergibt sich aus dem PIT).
+    """
+    return {**body, "pit": {"id": pit_id, "keep_alive": keep_alive}}
+
+
+def score_page_body(body: dict, pit_id: str, keep_alive: str, search_after: Optional[list] = None) -> dict:
+    """
+    Eine Seite einer nach Score sortierbaren Abfrage (query_string, script_score) per PIT + search_after.
+    """
+    paged = {**with_pit(body, pit_id, keep_alive), "sort": SCORE_SORT}
+    if search_after is not None:
+        paged["search_after"] = search_after
+    return paged
+
+
+# Felder, die je Index-Typ aus _source geladen werden ("content": zusätzlich für das Feld content).
+# None bedeutet: alle Felder außer den ausgeschlossenen.
+SOURCE_PROJECTIONS: Dict[SourceType, Dict[str, Optional[List[str]]]] = {
+    SourceType.jira: {
+        "summary": ["Key", "Issue.summary", "Issue.description", "Issue.creator.displayName", "Issue.created"],
+        "content": ["Issue"],
+    },
+    SourceType.confluence: {
+        "summary": ["title", "body", "url", "author.displayName", "createdDate"],
+        "content": [],
+    },
+    SourceType.network_drive: {
+        "summary": ["id", "title", "body", "path", "created_at", "size", "page_number"],
+        "content": [],
+    },
+    SourceType.unknown: {
+        "summary": None,
+        "content": None,
+    },
+}
+
+# Felder, die nie an den Client gehen (Vektoren und Metadaten der Embedding-Berechnung)
+SOURCE_EXCLUDES = ["embedding", "embedding_text_hash", "embedding_model", "embedding_chunks"]
+
+
+@lru_cache(maxsize=256)
+def resolve_source_type(index_name: str) -> SourceType:
+    """
+    Ordnet einen Index-Namen einmalig dem Index-Typ zu (über JIRA_INDEX, WIKI_INDEX, FILES_INDEX).
+    """
+    for env_name, source_type in (
+        ("JIRA_INDEX", SourceType.jira),
+        ("WIKI_INDEX", SourceType.confluence),
+        ("FILES_INDEX", SourceType.network_drive),
+    ):
+        configured = os.getenv(env_name)
+        if configured and configured in index_name:
+            return source_type
+    return SourceType.unknown
+
+
+def source_filter(index_name: str, include_content: bool = True) -> dict:
+    """
+    _source-Filter für eine Suche: lädt nur die Felder, die für das Ergebnis gebraucht werden,
+    und niemals den Embedding-Vektor.
+    """
+    projection = SOURCE_PROJECTIONS[resolve_source_type(index_name)]
+    if projection["summary"] is None:
+        excludes = SOURCE_EXCLUDES if include_content else SOURCE_EXCLUDES + ["content"]
+        return {"excludes": excludes}
+
+    includes = list(projection["summary"])
+    if include_content:
+        includes += projection["content"]
+    return {"includes": includes, "excludes": SOURCE_EXCLUDES}
+
+
+def with_source_filter(body: dict, index_name: str, include_content: bool = True) -> dict:
+    body["_source"] = source_filter(index_name, include_content)
+    return body
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+#  Gemeinsame Bausteine der Suchmethoden von RAGService und AsyncRAGService
+#  (und der Cursor-Pagination bzw. Batch-Suche), damit Query-Bodies und Fusion
+#  nur an einer Stelle gepflegt werden
+# ──────────────────────────────────────────────────────────────────────────────
+def document_search_body(
+    kind: str,
+    index_name: str,
+    size: int,
+    query: str = "",
+    query_vector: Optional[List[float]] = None,
+    num_candidates: Optional[int] = None,
+    bm25_weight: float = 1.0,
+    embedding_weight: float = 35.0,
+    include_content: bool = True,
+) -> dict:
+    """
+    Body einer Suche auf Dokumentebene samt _source-Filter. kind ist
+    - keyword: query_string über alle Dokumente
+    - bm25: query_string ohne Attachments (Keyword-Teil der RRF-Suche)
+    - knn: approximative Vektorsuche über den HNSW-Index
+    - exact: script_score mit cosineSimilarity über alle Dokumente
+    - weighted: bm25_weight * BM25 + embedding_weight * (Cosine + 1)
+    """
+    if kind == "keyword":
+        body = query_string_search_body(query, size)
+    elif kind == "bm25":
+        body = keyword_search_body(query, size)
+    elif kind == "knn":
+        body = knn_search_body(query_vector, size, num_candidates)
+    elif kind == "exact":
+        body = exact_vector_search_body(query_vector, size)
+    elif kind == "weighted":
+        body = weighted_hybrid_search_body(query, query_vector, size, bm25_weight, embedding_weight)
+    else:
+        raise ValueError(f"Unbekannte Suchart: {kind}")
+    return with_source_filter(body, index_name, include_content)
+
+
+def rrf_searches(
+    index_name: str,
+    query: str,
+    query_vector: List[float],
+    window_size: int,
+    exact: bool = False,
+    num_candidates: Optional[int] = None,
+    include_content: bool = True,
+    passages: bool = False,
+    passages_per_parent: int = 3,
+) -> List[dict]:
+    """
+    _msearch-Zeilen (Header, Body) der RRF-Hybridsuche: BM25-Teil und Vektor-Teil mit je window_size
+    Treffern. Der Vektor-Teil läuft mit passages über den Passagen-Index, sonst per kNN bzw. exakt.
+    """
+    if passages:
+        vector_search = [{"index": chunk_index_name(index_name)},
+                         chunk_search_body(query_vector, window_size, num_candidates, passages_per_parent)]
+    else:
+        vector_search = [{"index": index_name}, document_search_body(
+            "exact" if exact else "knn", index_name, window_size, query_vector=query_vector,
+            num_candidates=num_candidates, include_content=include_content
+        )]
+    return [
+        {"index": index_name},
+        document_search_body("bm25", index_name, window_size, query, include_content=include_content),
+        *vector_search,
+    ]
+
+
+def fuse_rrf_responses(index_name: str, responses: Iterable[dict], rank_constant: int, top_k: int) -> List[dict]:
+    """
+    Fusioniert die Antworten der Teilabfragen per RRF (rohe Hits); fehlgeschlagene Teilabfragen entfallen.
+    """
+    result_lists = []
+    for part in responses:
+        if "error" in part:
+            print(f"Teilabfrage der RRF-Suche auf '{index_name}' fehlgeschlagen: {part['error']}")
+            continue
+        result_lists.append(part.get("hits", {}).get("hits", []))
+    return reciprocal_rank_fusion(result_lists, rank_constant=rank_constant, top_k=top_k)
+
+
+def parent_mget_params(index_name: str, collapsed: List[Tuple[str, float, List[str]]], include_content: bool) -> dict:
+    """
+    Parameter für das mget der Dokumente zu zusammengefassten Passagen (siehe collapse_passages).
+    """
+    projection = source_filter(index_name, include_content)
+    return {
+        "index": index_name,
+        "ids": [parent_id for parent_id, _, _ in collapsed],
+        "source_includes": projection.get("includes"),
+        "source_excludes": projection.get("excludes"),
+    }
+
+
+def parse_date(value: Optional[str]) -> Optional[date]:
+    """
+    Schnelles Parsen des Datumsanteils eines ISO-Zeitstempels; dateutil nur als Fallback.
+    """
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        return parser.isoparse(value).date()
+
+
+def _map_jira_hit(hit: dict, src: dict, score: float, include_content: bool) -> Dict[str, Any]:
+    issue = src.get("Issue", {})
+    return {
+        "source": SourceType.jira,
+        "id": src.get("Key"),
+        "title": issue.get("summary"),
+        "summary": issue.get("description"),
+        "score": score,
+        "url": "http://jira/browse/" + src.get("Key"),
+        "creator": issue.get("creator", {}).get("displayName"),
+        "created": parse_date(issue.get("created")),
+        "content": issue if include_content else None
+    }
+
+
+def _map_wiki_hit(hit: dict, src: dict, score: float, include_content: bool) -> Dict[str, Any]:
+    return {
+        "source": SourceType.confluence,
+        "id": f"{hit.get('_id')}",
+        "title": src.get("title"),
+        "summary": src.get("body"),
+        "score": score,
+        "url": src.get("url"),
+        "creator": (author := src.get("author")) and isinstance(author, dict) and author.get("displayName"),
+        "created": parse_date(src.get("createdDate")),
+        "content": "TODO Wiki Content hier rein" if include_content else None
+    }
+
+
+def _map_files_hit(hit: dict, src: dict, score: float, include_content: bool) -> Dict[str, Any]:
+    item = {
+        "source": SourceType.network_drive,
+        "id": src.get('id'),
+        "title": src.get("title"),
+        "summary": src.get("body"),
+        "score": score,
+        "url": src.get("path"),
+        "created": parse_date(src.get("created_at")),
+        "size_bytes": src.get("size"),
+    }
+    if "page_number" in src:
+        item["page_number"] = src["page_number"]
+    return item
+
+
+def _map_unknown_hit(hit: dict, src: dict, score: float, include_content: bool) -> Dict[str, Any]:
+    # Fallback für alle anderen Indizes
+    item = {
+        "source": SourceType.unknown,
+        "content": src.get("content"),
+        "score": score,
+    }
+    if "id" in src:
+        item["id"] = src["id"]
+    else:
+        item["id"] = 0
+    if "url" in src:
+        item["url"] = src["url"]
+    else:
+        item["url"] = "http://example.org"
+
+    if "page_number" in src:
+        item["page_number"] = src["page_number"]
+    return item
+
+
+# Mapper je Index-Typ: (hit, _source, score, include_content) -> einheitliches Ergebnis
+RESULT_MAPPERS: Dict[SourceType, Callable[[dict, dict, float, bool], Dict[str, Any]]] = {
+    SourceType.jira: _map_jira_hit,
+    SourceType.confluence: _map_wiki_hit,
+    SourceType.network_drive: _map_files_hit,
+    SourceType.unknown: _map_unknown_hit,
+}
+
+
+def prepare_search_results(response: ObjectApiResponse, index_name: str, include_content: bool = True) -> List[Dict[str, Any]]:
     """
     Bereitet die Such-Treffer aus Elasticsearch auf und mappt sie
     je nach Index-Typ (Jira, Wiki, Repo, Sonstige) in ein einheitliches Format.
+    Der Index-Typ wird einmal pro Response aufgelöst, nicht pro Treffer.
 
     :param response: Das Elasticsearch-Response-Objekt
     :param index_name: Name des Elasticsearch-Index
+    :param include_content: False lässt das (große) Feld content weg; es kann per get_document nachgeladen werden
     :return: Liste von Dictionarys mit den aufbereiteten Ergebnissen
     """
+    mapper = RESULT_MAPPERS[resolve_source_type(index_name)]
     results = []
 
-    for hit in response.get("hits", {}).get("hits", []):
-        src = hit.get("_source", {})
-        score = hit.get("_score", 0.0)
-
-        if os.getenv("JIRA_INDEX") in index_name:
-            # Jira-Index
-            item = {
-                "source": SourceType.jira,
-                "id": src.get("Key"),
-                "title": src.get("Issue", {}).get("summary"),
-                "summary": src.get("Issue", {}).get("description"),
-                "score": score,
-                "url": "http://jira/browse/" + src.get("Key"),
-                "creator": src.get("Issue", {}).get("creator", {}).get("displayName"),
-                "created": ((created_str := src.get("Issue", {}).get("created")) and parser.isoparse(created_str).date()) or None,
-                "content": src.get("Issue")
-            }
+    with stage("prepare", index_name):
+        for hit in response.get("hits", {}).get("hits", []):
+            item = mapper(hit, hit.get("_source", {}), hit.get("_score", 0.0), include_content)
+            item["doc_id"] = hit.get("_id")
+            item["index"] = hit.get("_index", index_name)
+            if "_passages" in hit:
+                item["passages"] = hit["_passages"]
+            results.append(item)
+
+    return results
+
+
+LLM_MODEL = os.getenv("LLM_MODEL", "/models/Meta-Llama-3.1-8B-Instruct-Q5_K_M.gguf")
+SYSTEM_PROMPT = "Du bist ein hilfreicher Assistent."
+
+# Hardcoded Prompt Extension für Anfragen zu einem einzelnen Dokument
+DOCUMENT_PROMPT_EXTENSION = (
+    "Bitte beantworte die folgende Frage basierend auf dem bereitgestellten Textauszug oder fass das Dokument zusammen, falls es keine sinnvolle Frage gibt "
+    "Nutze ausschließlich Informationen aus dem Text. Wenn keine passende Antwort möglich ist, gib das an."
+)
+
+
+def chat_messages(prompt: str) -> List[dict]:
+    """
+    Baut die Chat-Nachrichten für das OpenAI-kompatible LLM.
+    """
+    return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+
+
+def build_document_prompt(user_query: str, document_text: str) -> str:
+    """
+    Setzt den Prompt für eine Frage zu einem einzelnen Dokument zusammen.
+    """
+    return (
+        f"{DOCUMENT_PROMPT_EXTENSION}\n\n"
+        f"Frage:\n{user_query}\n\n"
+        f"Textauszug:\n{document_text}"
+    )
+
+
+def document_prompt_instructions() -> str:
+    """
+    Die Teile des Dokument-Prompts ohne Frage und Textauszug (für den Schlüssel des Antwort-Caches).
+    """
+    return SYSTEM_PROMPT + "\n" + build_document_prompt("", "")
+
 
-        elif os.getenv("WIKI_INDEX") in index_name:
-            # Wiki-Index
-            item = {
-                "source": SourceType.confluence,
-                "id": f"{hit.get('_id')}",
-                "title": src.get("title"),
-                "summary": src.get("body"),
-                "score": score,
-                "url": src.get("url"),
-                "creator": (author := src.get("author")) and isinstance(author, dict) and author.get("displayName"),
-                "created": ((created_str := src.get("createdDate")) and parser.isoparse(created_str).date()) or None,
-                "content": "TODO Wiki Content hier rein"
+def fit_document_prompt(user_query: str, document_text: str) -> Tuple[str, int]:
+    """
+    Wie build_document_prompt, kürzt das Dokument aber auf das Token-Budget (CONTEXT_TOKEN_BUDGET):
+    übernommen werden die zur Frage passendsten Sätze in Originalreihenfolge.
+
+    Returns:
+        Tuple[str, int]: Prompt und Anzahl seiner Tokens.
+    """
+    context = context_builder.build(
+        user_query,
+        [{"text": document_text}],
+        reserved=SYSTEM_PROMPT + "\n" + build_document_prompt(user_query, ""),
+    )
+    return build_document_prompt(user_query, context.text), context.tokens
+
+
+DEFAULT_EMBEDDING_MODEL = os.getenv("MODEL_EMBEDDINGS", "distiluse-base-multilingual-cased-v1")
+
+
+class EmbeddingModelRegistry:
+    """
+    Prozessweite Registry für SentenceTransformer-Modelle.
+
+    Jedes Modell wird pro Backend (torch, onnx, onnx-int8; siehe encoder_backend) genau einmal
+    geladen und anschließend von allen Requests gemeinsam genutzt. Überschreitet die Summe der geladenen Modelle das
+    Speicherbudget, werden die am längsten nicht genutzten Modelle (LRU) entladen.
+    """
+
+    def __init__(self, max_memory_mb: int = 2048):
+        self._max_memory_bytes = max_memory_mb * 1024 * 1024
+        self._models: "OrderedDict[Tuple[str, str], SentenceTransformer]" = OrderedDict()
+        self._sizes: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        # Ein Lock pro (Modell, Backend), damit parallele Requests ein Modell nicht doppelt laden
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+    def get(self, model_name: str = DEFAULT_EMBEDDING_MODEL, backend: Optional[str] = None) -> "SentenceTransformer":
+        """
+        Liefert das Modell aus der Registry und lädt es beim ersten Zugriff.
+        Ohne backend gilt EMBEDDING_BACKEND.
+        """
+        key = (model_name, backend or DEFAULT_ENCODER_BACKEND)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                return model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            # Ein anderer Thread kann das Modell inzwischen geladen haben
+            with self._lock:
+                model = self._models.get(key)
+                if model is not None:
+                    self._models.move_to_end(key)
+                    return model
+
+            print(f"Lade Embedding-Modell '{model_name}' (Backend: {key[1]}) ...")
+            with stage("model_load", model_name):
+                model = load_sentence_transformer(*key)
+            size = self._estimate_size(model)
+
+            with self._lock:
+                self._models[key] = model
+                self._sizes[key] = size
+                self._evict(keep=key)
+            return model
+
+    def register(self, model_name: str, model: "SentenceTransformer", backend: Optional[str] = None) -> None:
+        """
+        Legt ein bereits geladenes Modell (oder einen kompatiblen Ersatz, z.B. im Benchmark) in der Registry ab.
+        """
+        key = (model_name, backend or DEFAULT_ENCODER_BACKEND)
+        with self._lock:
+            self._models[key] = model
+            self._sizes[key] = self._estimate_size(model)
+            self._evict(keep=key)
+
+    def warm_up(self, model_names: Iterable[str], background: bool = True) -> Optional[threading.Thread]:
+        """
+        Lädt die angegebenen Modelle vorab, optional in einem Hintergrund-Thread.
+
+        Returns:
+            Optional[threading.Thread]: Der gestartete Thread oder None bei synchronem Laden.
+        """
+        names = list(model_names)
+
+        def _load_all():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Warm-up für Modell '{name}' fehlgeschlagen: {e}")
+
+        if not background:
+            _load_all()
+            return None
+
+        thread = threading.Thread(target=_load_all, name="embedding-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def is_loaded(self, model_name: str, backend: Optional[str] = None) -> bool:
+        with self._lock:
+            return (model_name, backend or DEFAULT_ENCODER_BACKEND) in self._models
+
+    def loaded_models(self) -> Dict[str, int]:
+        """
+        Gibt die geladenen Modelle ("modell:backend") mit ihrem geschätzten Speicherbedarf in Bytes zurück.
+        """
+        with self._lock:
+            return {f"{name}:{backend}": size for (name, backend), size in self._sizes.items()}
+
+    def _evict(self, keep: Tuple[str, str]) -> None:
+        # Muss unter self._lock aufgerufen werden
+        while sum(self._sizes.values()) > self._max_memory_bytes and len(self._models) > 1:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                self._models.move_to_end(oldest)
+                continue
+            del self._models[oldest]
+            self._sizes.pop(oldest, None)
+            print(f"Embedding-Modell '{oldest[0]}' (Backend: {oldest[1]}) aus dem Speicher entfernt (LRU).")
+
+    @staticmethod
+    def _estimate_size(model: "SentenceTransformer") -> int:
+        try:
+            size = sum(p.numel() * p.element_size() for p in model.parameters())
+        except Exception:
+            return 0
+        try:
+            # Beim ONNX-Backend liegt das Transformer-Modul nicht als torch-Parameter vor, dann zählt die Modelldatei
+            model_path = getattr(getattr(model[0], "auto_model", None), "model_path", None)
+            if model_path and os.path.isfile(model_path):
+                size += os.path.getsize(model_path)
+        except Exception:
+            pass
+        return size
+
+
+model_registry = EmbeddingModelRegistry(
+    max_memory_mb=int(os.getenv("EMBEDDING_MODEL_MEMORY_MB", "2048"))
+)
+
+
+class QueryEmbeddingCache:
+    """
+    LRU-Cache mit TTL für Query-Embeddings, Schlüssel ist (Modellname, normalisierte Query).
+
+    Die Vektoren liegen als kompakte float32-Arrays im Speicher; das Speicherbudget begrenzt
+    die Summe ihrer Größen. Treffer, Fehlschläge und Verdrängungen werden gezählt.
+    """
+
+    def __init__(self, max_memory_mb: float = 64, ttl_seconds: float = 3600):
+        self._max_bytes = int(max_memory_mb * 1024 * 1024)
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        # Nur Whitespace normalisieren: das Modell ist case-sensitiv (cased)
+        return " ".join(query.split())
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        key = (model_name, self.normalize(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            vector, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_name: str, query: str, vector: np.ndarray) -> None:
+        key = (model_name, self.normalize(query))
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (vector, time.monotonic() + self._ttl)
+            self._bytes += vector.nbytes
+            while self._bytes > self._max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        # Muss unter self._lock aufgerufen werden
+        vector, _ = self._entries.pop(key)
+        self._bytes -= vector.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
             }
 
-        elif os.getenv("FILES_INDEX") in index_name:
-            # Wiki-Index
-            item = {
-                "source": SourceType.network_drive,
-                "id": src.get('id'),
-                "title": src.get("title"),
-                "summary": src.get("body"),
-                "score": score,
-                "url": src.get("path"),
-                "created": ((created_str := src.get("created_at")) and parser.isoparse(created_str).date()) or None,
-                "size_bytes": src.get("size"),
+
+query_embedding_cache = QueryEmbeddingCache(
+    max_memory_mb=float(os.getenv("EMBEDDING_CACHE_MB", "64")),
+    ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL", "3600")),
+)
+
+
+def _encode_batch(queries: List[str], model_name: str) -> Dict[str, np.ndarray]:
+    # Encodiert die (deduplizierten) Queries in einem Batch und legt sie im Query-Cache ab
+    unique = list(dict.fromkeys(queries))
+    model = model_registry.get(model_name)
+    encoded = model.encode(unique, convert_to_numpy=True)
+    by_query = {}
+    for q, vector in zip(unique, encoded):
+        vector = vector.astype(np.float32, copy=False)
+        query_embedding_cache.put(model_name, q, vector)
+        by_query[q] = vector
+    return by_query
+
+
+def encode_queries(queries: List[str], model_name: str = DEFAULT_EMBEDDING_MODEL) -> List[np.ndarray]:
+    """
+    Liefert die Embeddings mehrerer Suchstrings. Treffer kommen aus dem Cache,
+    nur die fehlenden (deduplizierten) Queries werden in einem Batch encodiert.
+    """
+    vectors: List[Optional[np.ndarray]] = [query_embedding_cache.get(model_name, q) for q in queries]
+
+    missing = [q for q, v in zip(queries, vectors) if v is None]
+    if missing:
+        by_query = _encode_batch(missing, model_name)
+        vectors = [v if v is not None else by_query[q] for q, v in zip(queries, vectors)]
+
+    return vectors
+
+
+class MicroBatchEncoder:
+    """
+    Bündelt gleichzeitige Encode-Anfragen einzelner Queries zu einem Batch.
+
+    Ein Worker-Thread sammelt Anfragen, bis max_batch_size erreicht ist oder max_wait_ms seit der
+    ersten Anfrage vergangen sind, encodiert sie pro Modell in einem Aufruf und beantwortet jede
+    Anfrage über ihr Future. Erfasst werden die Verteilung der Batch-Größen und die Wartezeit in der Queue.
+    """
+
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 5):
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Tuple[str, str, Future, float]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batch_sizes: Dict[int, int] = {}
+        self.requests = 0
+        self.queue_delay_total = 0.0
+        self.queue_delay_max = 0.0
+
+    def submit(self, query: str, model_name: str = DEFAULT_EMBEDDING_MODEL) -> Future:
+        """
+        Reiht eine Query ein; das Future liefert ihr Embedding als float32-Array.
+        """
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((model_name, query, future, time.perf_counter()))
+        return future
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self._max_wait
+            while len(batch) < self._max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch: List[Tuple[str, str, Future, float]]) -> None:
+        started = time.perf_counter()
+        delays = [started - enqueued_at for _, _, _, enqueued_at in batch]
+        with self._stats_lock:
+            self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+            self.requests += len(batch)
+            self.queue_delay_total += sum(delays)
+            self.queue_delay_max = max(self.queue_delay_max, max(delays))
+
+        by_model: Dict[str, List[Tuple[str, Future]]] = {}
+        for model_name, query, future, _ in batch:
+            if future.set_running_or_notify_cancel():
+                by_model.setdefault(model_name, []).append((query, future))
+
+        for model_name, requests in by_model.items():
+            try:
+                with stage("encode_batch", model_name):
+                    vectors = _encode_batch([q for q, _ in requests], model_name)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            for q, future in requests:
+                future.set_result(vectors[q])
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                "requests": self.requests,
+                "batches": batches,
+                "avg_batch_size": self.requests / batches if batches else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "avg_queue_delay_ms": self.queue_delay_total / self.requests * 1000 if self.requests else 0.0,
+                "max_queue_delay_ms": self.queue_delay_max * 1000,
             }
 
+
+query_encoder = MicroBatchEncoder(
+    max_batch_size=int(os.getenv("ENCODER_MAX_BATCH_SIZE", "32")),
+    max_wait_ms=float(os.getenv("ENCODER_MAX_WAIT_MS", "5")),
+)
+
+
+def encode_query(query: str, model_name: str = DEFAULT_EMBEDDING_MODEL) -> List[float]:
+    """
+    Berechnet das Embedding eines Suchstrings. Treffer kommen aus dem Query-Cache,
+    sonst wird die Query über den MicroBatchEncoder mit gleichzeitigen Anfragen gebündelt.
+    """
+    with stage("encode"):
+        vector = query_embedding_cache.get(model_name, query)
+        if vector is None:
+            vector = query_encoder.submit(query, model_name).result()
+    return vector.tolist()
+
+
+def embedding_model_version(model_name: str) -> str:
+    """
+    Versionskennung der Embeddings; ändert sie sich, werden im inkrementellen Modus alle Vektoren neu berechnet.
+    """
+    return os.getenv("EMBEDDING_MODEL_VERSION", model_name)
+
+
+def get_nested_value(obj, path):
+    keys = path.split(".")
+    for key in keys:
+        if isinstance(obj, dict):
+            obj = obj.get(key)
         else:
-            # Fallback für alle anderen Indizes
-            item = {
-                "source": SourceType.unknown,
-                "content": src.get("content"),
-                "score": score,
-            }
-            if "id" in src:
-                item["id"] = src["id"]
-            else:
-                item["id"] = 0
-            if "url" in src:
-                item["url"] = src["url"]
-            else:
-                item["url"] = "http://example.org"
-            
-            if "page_number" in src:
-                item["page_number"] = src["page_number"]
-
-        results.append(item)
+            return None
+    return obj
 
-    return results
+
+def extract_text(doc_source, index_name):
+    """
+    Extrahiert den für Embeddings relevanten Text eines Jira- oder Wiki-Dokuments.
+    """
+    if index_name == "jira":
+        fields = [
+            ("Issue.assignee.displayName", "Bearbeiter:"),
+            ("Issue.creator.displayName", "Erstellt von:"),
+            #("Issue.comments.body", "Kommentare:"),
+            ("Issue.summary", "Zusammenfassung:"),
+            ("Issue.description", "Beschreibung:"),
+            ("Issue.project.name", "Projektname:"),
+            ("Issue.project.projectCategory.description", "Projektkategorie:"),
+            ("Issue.resolution.name", "Lösung:"),
+            ("Type", "Typ:"),
+            ("Custom_Fields.Kunde(n)", "Kunde(n):")
+        ]
+    elif index_name == "wiki":
+        fields = [
+            ("title", "Titel:"),
+            ("body", "Inhalt:"),
+            ("url", "URL:")
+        ]
+    else:
+        return ""
+
+    lines = []
+    for path, label in fields:
+        value = get_nested_value(doc_source, path)
+        if value:
+            if isinstance(value, list):
+                value = "\n".join(str(v) for v in value)
+            lines.append(f"{label} {value}")
+    return "\n".join(lines)
+
+
+def chunk_text(text: str, tokenizer, max_tokens: int, overlap: int) -> List[str]:
+    """
+    Teilt text in überlappende Passagen von höchstens max_tokens Tokens (inkl. der Spezialtokens des Modells),
+    aufeinanderfolgende Passagen überlappen um overlap Tokens. Die Passagen sind Ausschnitte
+    des Originaltexts, die Grenzen kommen aus den Offsets des (Fast-)Tokenizers.
+    """
+    if not text.strip():
+        return []
+    window = max(max_tokens - 2, 1)  # Platz für [CLS] und [SEP]
+    step = max(window - overlap, 1)
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)["offset_mapping"]
+    if len(offsets) <= window:
+        return [text.strip()]
+
+    passages = []
+    for start in range(0, len(offsets), step):
+        end = min(start + window, len(offsets))
+        passage = text[offsets[start][0]:offsets[end - 1][1]].strip()
+        if passage:
+            passages.append(passage)
+        if end == len(offsets):
+            break
+    return passages
+
+
+def text_fingerprint(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def is_embedding_current(doc_source: dict, text_hash: str, model_version: str) -> bool:
+    """
+    True, wenn das gespeicherte Embedding zum aktuellen Text und zur Modellversion passt.
+    """
+    return (
+        doc_source.get("embedding_model") == model_version
+        and doc_source.get("embedding_text_hash") == text_hash
+    )
+
+
+def stale_embedding_query(model_version: str, chunks: bool = False) -> dict:
+    """
+    Pre-Filter für inkrementelle Läufe: Dokumente ohne Embedding der aktuellen Modellversion bzw.
+    (mit chunks) ohne Passagen. Connectoren, Datei-Ingestion und Reindex schreiben Dokumente komplett
+    neu, ein geänderter Text verliert dabei auch die embedding-Felder. Für die gelieferten Dokumente
+    wird der Text-Hash weiterhin geprüft; Teil-Updates, die die embedding-Felder behalten, erkennt
+    nur ein vollständiger Lauf.
+    """
+    # Dynamisch gemappt ist embedding_model ein text-Feld mit keyword-Unterfeld
+    current_model = [{"term": {"embedding_model": model_version}}, {"term": {"embedding_model.keyword": model_version}}]
+    stale = [{"bool": {"must_not": current_model}}]
+    if chunks:
+        stale.append({"bool": {"must_not": {"exists": {"field": "embedding_chunks"}}}})
+    return {"bool": {"should": stale, "minimum_should_match": 1}}
+
+
+def load_checkpoint(checkpoint_path: Optional[str], index_name: str, model_version: str) -> dict:
+    """
+    Lädt einen Checkpoint, sofern er zum selben Index und zur selben Modellversion gehört.
+    """
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("index") != index_name or checkpoint.get("model") != model_version:
+        print(f"Checkpoint {checkpoint_path} gehört zu einem anderen Lauf und wird ignoriert.")
+        return {}
+    print(f"Setze Lauf fort: {checkpoint.get('processed', 0)} Dokumente bereits berechnet.")
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_path: Optional[str], checkpoint: dict) -> None:
+    if not checkpoint_path:
+        return
+    # Erst in eine temporäre Datei schreiben, damit ein Abbruch keinen halben Checkpoint hinterlässt
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def pit_alive(elastic_client: Elasticsearch, pit_id: Optional[str], keep_alive: str = "10m") -> bool:
+    """
+    True, wenn der Point-in-Time noch existiert (und verlängert ihn dabei um keep_alive).
+    """
+    if not pit_id:
+        return False
+    try:
+        elastic_client.search(pit={"id": pit_id, "keep_alive": keep_alive}, size=0)
+        return True
+    except NotFoundError:
+        return False
+
+
+def iter_index_pit(
+    elastic_client: Elasticsearch,
+    index_name: str,
+    batch_size: int = 128,
+    keep_alive: str = "10m",
+    checkpoint: Optional[dict] = None,
+    query: Optional[dict] = None,
+):
+    """
+    Iteriert per Point-in-Time + search_after über alle Dokumente eines Index (ohne 'embedding' im _source),
+    mit query nur über die passenden (z.B. stale_embedding_query).
+
+    Liefert je Batch die Hits und die Position (pit_id, search_after), ab der ein späterer Lauf
+    fortsetzen kann. Die Position gilt nur, solange der PIT lebt (keep_alive): ist er abgelaufen,
+    beginnt die Iteration von vorne. Aufrufer mit Zählern im Checkpoint prüfen das vorher per pit_alive.
+    """
+    checkpoint = checkpoint or {}
+    pit_id = checkpoint.get("pit_id")
+    search_after = checkpoint.get("search_after")
+
+    if pit_id and not pit_alive(elastic_client, pit_id, keep_alive):
+        print("Point-in-Time aus dem Checkpoint ist abgelaufen, beginne von vorne.")
+        pit_id, search_after = None, None
+    if not pit_id:
+        pit_id = elastic_client.open_point_in_time(index=index_name, keep_alive=keep_alive)["id"]
+
+    while True:
+        kwargs = {"search_after": search_after} if search_after else {}
+        resp = elastic_client.search(
+            pit={"id": pit_id, "keep_alive": keep_alive},
+            query=query or {"match_all": {}},
+            sort=[{"_shard_doc": "asc"}],
+            size=batch_size,
+            source_excludes=["embedding"],
+            **kwargs
+        )
+        pit_id = resp.get("pit_id", pit_id)
+        hits = resp["hits"]["hits"]
+        if not hits:
+            break
+        search_after = hits[-1]["sort"]
+        yield hits, {"pit_id": pit_id, "search_after": search_after}
+
+    # Nur nach vollständigem Durchlauf schließen; bei einem Abbruch bleibt der PIT für die Fortsetzung offen
+    try:
+        elastic_client.close_point_in_time(id=pit_id)
+    except Exception:
+        pass
 
 
 class RAGService:
     def __init__(self, elasticsearch_uri: str, groq_api_key: str, username: str, password: str):
 
         self._openAI_client = OpenAI(base_url=os.getenv("LLM_URL"), api_key="not-needed")
-        models = self._openAI_client.models.list()
-        print(models)
-
-         # Anfrage an das Groq-Modell
-        completion = self._openAI_client.chat.completions.create(
-            model="/models/Meta-Llama-3.1-8B-Instruct-Q5_K_M.gguf",
-            messages=[ { "role": "system", "content": "Du bist ein hilfreicher Assistent."},{"role": "user", "content": "What is the capital of france?"}]
-        )
-        print(completion)
 
         warnings.filterwarnings(
             'ignore',
@@ -132,6 +1235,8 @@ class RAGService:
             elasticsearch_uri,
             basic_auth=(username, password)
         )
+        # Indizes, deren 'embedding'-Feld keinen HNSW-Index hat (kNN fällt dort auf exakte Suche zurück)
+        self._knn_unsupported = set()
         if self._elastic_client.ping():
             print("Erfolgreich mit Elasticsearch verbunden.")
         else:
@@ -139,25 +1244,32 @@ class RAGService:
 
         load_dotenv()
 
+    def check_languageModel(self) -> None:
+        """
+        Prüft die Verbindung zum LLM (Modell-Liste + kurze Test-Anfrage).
+        Nicht mehr Teil des Konstruktors, damit das Erzeugen des Service nicht auf das LLM wartet.
+        """
+        models = self._openAI_client.models.list()
+        print(models)
+
+        completion = self._openAI_client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=chat_messages("What is the capital of france?"),
+            max_tokens=1
+        )
+        print(completion)
+
     # 2. Search text passages in Elasticsearch
-    def search_elasticsearch(self, query: str, index: str = "_all", max_results: int = 100) -> List[dict]:
+    def search_elasticsearch(self, query: str, index: str = "_all", max_results: int = 100, include_content: bool = True) -> List[dict]:
         """
         Fuehrt die Suche in Elasticsearch aus und gibt eine Liste von Ergebnissen zurueck.
         Jedes Ergebnis enthaelt 'content', 'page_number' und 'score'.
         """
         load_dotenv()
-        response = self._elastic_client.search(index=index, body={
-            "query": {
-                "query_string": {
-                    "query": query,
-                    # optional: lenient=true bei z.B. Zahlen-/Datumsparse-Fehlern
-                    # "lenient": True
-                }
-            },
-            "size": max_results
-        })
+        body = document_search_body("keyword", index, max_results, query, include_content=include_content)
+        response = self._elastic_client.search(index=index, body=body)
 
-        return prepare_search_results(response, index)
+        return prepare_search_results(response, index, include_content)
 
 
     # 3. Query Groq
@@ -168,8 +1280,8 @@ class RAGService:
         """
         # Anfrage an das Groq-Modell
         completion = self._openAI_client.chat.completions.create(
-            model="/models/Meta-Llama-3.1-8B-Instruct-Q5_K_M.gguf",
-            messages=[ { "role": "system", "content": "Du bist ein hilfreicher Assistent."},{"role": "user", "content": prompt}]
+            model=LLM_MODEL,
+            messages=chat_messages(prompt)
         )
         print(completion)
 
@@ -195,216 +1307,351 @@ class RAGService:
         if not document_text.strip():
             raise ValueError("Dokument ist leer oder enthält kein 'content'-Feld")
 
-        # 2. Hardcoded Prompt Extension
-        prompt_extension = (
-            "Bitte beantworte die folgende Frage basierend auf dem bereitgestellten Textauszug oder fass das Dokument zusammen, falls es keine sinnvolle Frage gibt "
-            "Nutze ausschließlich Informationen aus dem Text. Wenn keine passende Antwort möglich ist, gib das an."
-        )
+        # 2. Prompt mit Hardcoded Prompt Extension zusammensetzen (auf das Token-Budget gekürzt)
+        prompt, _ = fit_document_prompt(user_query, document_text)
 
-        # 3. Prompt zusammensetzen
-        prompt = (
-            f"{prompt_extension}\n\n"
-            f"Frage:\n{user_query}\n\n"
-            f"Textauszug:\n{document_text}"
-        )
-
-        # 4. Anfrage an LLM
+        # 3. Anfrage an LLM
         try:
             llm_answer = self.query_languageModel(prompt)
         except Exception as e:
             raise ValueError(f"Fehler bei der Anfrage an das Sprachmodell: {str(e)}")
 
-        # 5. Rückgabe
+        # 4. Rückgabe
         return llm_answer
 
 
     def compute_embeddings_for_elasticsearch_index(
         self, 
         index_name: str,
-        model_name: str = "distiluse-base-multilingual-cased-v1",
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
         batch_size: int = 128,
-        scroll_ttl: str = '2m',
+        scroll_ttl: str = '10m',
         show_progress: bool = True,
+        incremental: bool = False,
+        checkpoint_path: Optional[str] = None,
+        queue_size: int = 4,
+        write_threads: int = 2,
+        encode_processes: int = 0,
+        backend: Optional[str] = None,
+        chunks: bool = False,
+        chunk_max_tokens: Optional[int] = None,
+        chunk_overlap: Optional[int] = None,
         ) -> int:
         """
-        Laedt alle Dokumente eines Elasticsearch-Index, serialisiert das komplette Dokument als JSON-String,
+        Laedt alle Dokumente eines Elasticsearch-Index, extrahiert den relevanten Text,
         berechnet ihre Embeddings mit einem SentenceTransformer-Modell
         und speichert die Embeddings zurueck im Elasticsearch-Index.
 
+        Neben dem Vektor werden 'embedding_text_hash' (Hash des extrahierten Textes) und
+        'embedding_model' (Modellversion) gespeichert. Im inkrementellen Modus werden nur Dokumente
+        gelesen, deren Embedding der aktuellen Modellversion fehlt (siehe stale_embedding_query), und
+        davon nur die mit geändertem Text neu berechnet.
+
+        Die Dokumente werden per Point-in-Time + search_after gelesen. Mit checkpoint_path wird der
+        Fortschritt nach jedem geschriebenen Batch gespeichert, sodass ein abgebrochener Lauf dort weitermacht.
+
+        Lesen, Extraktion, Encoding und Bulk-Write laufen als Pipeline nebenläufig (siehe EmbeddingPipeline);
+        der Durchsatz jeder Stufe wird am Ende ausgegeben.
+
+        Mit chunks=True wird der Text zusätzlich in überlappende Passagen zerlegt und mit eigenem Vektor
+        in den Passagen-Index (siehe ensure_chunk_index) geschrieben, da das Modell lange Texte abschneidet.
+
         Args:
-            elastic_client (Elasticsearch): Initialisierter Elasticsearch-Client.
             index_name (str): Name des zu aktualisierenden Index.
             model_name (str): Bezeichnung des SentenceTransformer-Modells.
             batch_size (int): Anzahl der Dokumente pro Batch.
+            scroll_ttl (str): Keep-Alive des Point-in-Time zwischen zwei Batches.
             show_progress (bool): Fortschrittsanzeige beim Berechnen.
+            incremental (bool): Nur fehlende oder veraltete Embeddings berechnen.
+            checkpoint_path (str): Datei für den Fortschritt (optional).
+            queue_size (int): Maximale Anzahl Batches zwischen zwei Pipeline-Stufen.
+            write_threads (int): Threads für parallel_bulk.
+            encode_processes (int): Anzahl Prozesse für das Encoding (> 1 startet einen Multi-Process-Pool, nur mit torch).
+            backend (str): Encoder-Backend (torch, onnx, onnx-int8); ohne Angabe gilt EMBEDDING_BACKEND.
+            chunks (bool): Passagen-Index "<index>_chunks" mitpflegen.
+            chunk_max_tokens (int): Maximale Tokens pro Passage (Standard: CHUNK_MAX_TOKENS bzw. max_seq_length des Modells).
+            chunk_overlap (int): Überlappung aufeinanderfolgender Passagen in Tokens (Standard: CHUNK_OVERLAP_TOKENS).
 
         Returns:
-            int: Anzahl der bearbeiteten Dokumente.
+            int: Anzahl der neu berechneten Dokumente.
         """
-         # Modell laden
-        model = SentenceTransformer(model_name)
-        elastic_client=self._elastic_client
-
-        total_processed = 0
-                
-        # High-Level search mit Scroll
-        resp = elastic_client.search(
-            index=index_name,
-            body={"query": {"match_all": {}}},
-            scroll=scroll_ttl,
-            size=batch_size
+        from services.embedding_pipeline import EmbeddingPipeline
+
+         # Modell aus der Registry holen (wird nur beim ersten Aufruf geladen)
+        backend = backend or DEFAULT_ENCODER_BACKEND
+        model = model_registry.get(model_name, backend)
+        if backend != "torch" and encode_processes > 1:
+            # ONNX Runtime parallelisiert über EMBEDDING_INTRA_OP_THREADS, die Session lässt sich nicht auf Prozesse verteilen
+            print("Multi-Process-Encoding wird nur mit dem torch-Backend unterstützt, verwende einen Prozess.")
+            encode_processes = 0
+
+        chunk_index = None
+        if chunks:
+            chunk_index = self.ensure_chunk_index(index_name, model_name)
+            if chunk_max_tokens is None:
+                chunk_max_tokens = int(os.getenv("CHUNK_MAX_TOKENS", "0")) or model.max_seq_length
+            if chunk_overlap is None:
+                chunk_overlap = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+
+        pipeline = EmbeddingPipeline(
+            self._elastic_client,
+            model,
+            embedding_model_version(model_name),
+            batch_size=batch_size,
+            keep_alive=scroll_ttl,
+            incremental=incremental,
+            checkpoint_path=checkpoint_path,
+            queue_size=queue_size,
+            write_threads=write_threads,
+            encode_processes=encode_processes,
+            show_progress=show_progress,
+            chunk_index=chunk_index,
+            chunk_max_tokens=chunk_max_tokens or 128,
+            chunk_overlap=chunk_overlap or 0,
         )
-        scroll_id = resp.get("_scroll_id")
-        hits = resp["hits"]["hits"]
-
-        def extract_text(doc_source, index_name):
-            if index_name == "jira":
-                fields = [
-                    ("Issue.assignee.displayName", "Bearbeiter:"),
-                    ("Issue.creator.displayName", "Erstellt von:"),
-                    #("Issue.comments.body", "Kommentare:"),
-                    ("Issue.summary", "Zusammenfassung:"),
-                    ("Issue.description", "Beschreibung:"),
-                    ("Issue.project.name", "Projektname:"),
-                    ("Issue.project.projectCategory.description", "Projektkategorie:"),
-                    ("Issue.resolution.name", "Lösung:"),
-                    ("Type", "Typ:"),
-                    ("Custom_Fields.Kunde(n)", "Kunde(n):")
-                ]
-            elif index_name == "wiki":
-                fields = [
-                    ("title", "Titel:"),
-                    ("body", "Inhalt:"),
-                    ("url", "URL:")
-                ]
-            else:
-                return ""
-
-            def get_nested_value(obj, path):
-                keys = path.split(".")
-                for key in keys:
-                    if isinstance(obj, dict):
-                        obj = obj.get(key)
-                    else:
-                        return None
-                return obj
-
-            lines = []
-            for path, label in fields:
-                value = get_nested_value(doc_source, path)
-                if value:
-                    if isinstance(value, list):
-                        value = "\n".join(str(v) for v in value)
-                    lines.append(f"{label} {value}")
-            return "\n".join(lines)
-
-
-
-        while hits:
-            texts = [extract_text(doc["_source"], index_name) for doc in hits]
-            ids = [doc["_id"] for doc in hits]
-
-            embeddings = model.encode(
-                texts,
-                batch_size=batch_size,
-                show_progress_bar=show_progress,
-                convert_to_numpy=True,
-            )
-
-            actions = [
-                {
-                    "_op_type": "update",
-                    "_index": index_name,
-                    "_id": doc_id,
-                    "doc": {"embedding": emb.tolist()}
-                }
-                for doc_id, emb in zip(ids, embeddings)
-            ]
-            helpers.bulk(elastic_client, actions)
-
-            total_processed += len(hits)
-
-            resp = elastic_client.scroll(
-                scroll_id=scroll_id,
-                scroll=scroll_ttl
-            )
-            scroll_id = resp.get("_scroll_id")
-            hits = resp["hits"]["hits"]
-
-        # Scroll-Kontext löschen
-        try:
-            elastic_client.clear_scroll(scroll_id=scroll_id)
-        except Exception:
-            pass
-
-        return total_processed
+        return pipeline.run(index_name)
 
     
+    def encode_query(self, query: str, model_name: str = DEFAULT_EMBEDDING_MODEL) -> List[float]:
+        """
+        Berechnet das Embedding eines Suchstrings mit dem Modell aus der Registry.
+        """
+        return encode_query(query, model_name)
+
     def vector_search_elasticsearch(
         self,
         index_name: str,
         query: str,
-        model_name: str = "distiluse-base-multilingual-cased-v1",
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
         top_k: int = 30,
+        mode: VectorSearchMode = VectorSearchMode.knn,
+        num_candidates: Optional[int] = None,
+        query_vector: Optional[List[float]] = None,
+        include_content: bool = True,
     ) -> List:
         """
         Führt eine Vektor-Suche in Elasticsearch durch:
         1. Berechnet das Embedding des Suchstrings.
-        2. Verwendet script_score mit cosineSimilarity, um die Top-K-Dokumente zu ranken.
+        2. kNN: approximative Suche über den HNSW-Index (knn-Abschnitt) mit Attachment-Pre-Filter.
+           Exact: script_score mit cosineSimilarity über alle Dokumente.
+
+        Ist das 'embedding'-Feld eines Index nicht als indizierter dense_vector gemappt,
+        fällt der kNN-Modus automatisch auf die exakte Suche zurück.
+        Ein bereits berechnetes query_vector wird wiederverwendet (z.B. bei mehreren Quellen).
 
         Returns:
             List[Dict[str, Any]]: Die Treffer mit _id, _score und _source.
         """
-        model = SentenceTransformer(model_name)
         # Query-Embedding berechnen
-        query_emb = model.encode([query], convert_to_numpy=True)[0].tolist()
-
-        # Script-Score Abfrage
-        body = {
-            "size": top_k,
-            "query": {
-                "script_score": {
-                    # 1) Erst filtern …
-                    "query": {
-                        "bool": {
-                            "must":   {"match_all": {}},            # alle Dokumente
-                            "must_not": {"term": {
-                                "Type": "Attachment"
-                                }
-                            }  # … außer type=attachment
-                        }
-                    },
-                    # 2) … dann mit dem Vektor scorieren
-                    "script": {
-                        "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                        "params": {"query_vector": query_emb}
-                    }
-                }
-            }
-        }
+        query_emb = query_vector if query_vector is not None else self.encode_query(query, model_name)
 
-        resp = self._elastic_client.search(
-            index=index_name,
-            body=body
-        )
+        if mode == VectorSearchMode.knn and index_name not in self._knn_unsupported:
+            try:
+                resp = self._elastic_client.search(index=index_name, body=document_search_body(
+                    "knn", index_name, top_k, query_vector=query_emb, num_candidates=num_candidates,
+                    include_content=include_content
+                ))
+                return prepare_search_results(resp, index_name, include_content)
+            except BadRequestError as e:
+                note_knn_error(self._knn_unsupported, index_name, e)
 
-        return prepare_search_results(resp, index_name)
+        resp = self._elastic_client.search(index=index_name, body=document_search_body(
+            "exact", index_name, top_k, query_vector=query_emb, include_content=include_content
+        ))
 
+        return prepare_search_results(resp, index_name, include_content)
 
+    def ensure_knn_mapping(
+        self,
+        index_name: str,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        quantize: bool = True,
+        m: int = 16,
+        ef_construction: int = 100,
+    ) -> bool:
+        """
+        Stellt sicher, dass 'embedding' im Index als HNSW-indizierter dense_vector gemappt ist.
+        - Index existiert nicht: wird mit passendem Mapping angelegt.
+        - Feld fehlt noch: Mapping wird ergänzt.
+        - Feld existiert ohne Index: lässt sich nicht in-place ändern -> migrate_index_to_knn verwenden.
+
+        Returns:
+            bool: True, wenn der Index kNN-fähig ist.
+        """
+        dims = model_registry.get(model_name).get_sentence_embedding_dimension()
+        field_mapping = embedding_field_mapping(dims, quantize, m, ef_construction)
+
+        if not self._elastic_client.indices.exists(index=index_name):
+            self._elastic_client.indices.create(
+                index=index_name,
+                mappings={"properties": {"embedding": field_mapping}}
+            )
+            self._knn_unsupported.discard(index_name)
+            return True
+
+        mapping = self._elastic_client.indices.get_mapping(index=index_name)
+        for index_mapping in mapping.values():
+            current = index_mapping.get("mappings", {}).get("properties", {}).get("embedding")
+            if current is None:
+                self._elastic_client.indices.put_mapping(
+                    index=index_name,
+                    properties={"embedding": field_mapping}
+                )
+            elif current.get("type") != "dense_vector" or current.get("index") is False:
+                print(f"'embedding' in '{index_name}' ist nicht HNSW-indiziert, bitte migrate_index_to_knn verwenden.")
+                return False
+
+        self._knn_unsupported.discard(index_name)
+        return True
+
+    def ensure_chunk_index(
+        self,
+        index_name: str,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        quantize: bool = True,
+        m: int = 16,
+        ef_construction: int = 100,
+    ) -> str:
+        """
+        Legt den Passagen-Index "<index>_chunks" an, falls er noch nicht existiert:
+        parent_id (Dokument-ID im Index), chunk_no, passage (Text, auch per BM25 durchsuchbar)
+        und embedding als HNSW-indizierter dense_vector.
+
+        Returns:
+            str: Name des Passagen-Index.
+        """
+        chunk_index = chunk_index_name(index_name)
+        if not self._elastic_client.indices.exists(index=chunk_index):
+            dims = model_registry.get(model_name).get_sentence_embedding_dimension()
+            self._elastic_client.indices.create(
+                index=chunk_index,
+                mappings={"properties": {
+                    "parent_id": {"type": "keyword"},
+                    "chunk_no": {"type": "integer"},
+                    "passage": {"type": "text"},
+                    "embedding": embedding_field_mapping(dims, quantize, m, ef_construction),
+                    "embedding_model": {"type": "keyword"},
+                }}
+            )
+            print(f"Passagen-Index '{chunk_index}' angelegt.")
+        return chunk_index
+
+    def passage_search_elasticsearch(
+        self,
+        index_name: str,
+        query: str,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        top_k: int = 30,
+        num_candidates: Optional[int] = None,
+        passages_per_parent: int = 3,
+        query_vector: Optional[List[float]] = None,
+        include_content: bool = True,
+    ) -> List[dict]:
+        """
+        Vektor-Suche über den Passagen-Index:
+        1. kNN über alle Passagen, per collapse auf das Dokument zusammengefasst (Score der besten Passage).
+        2. Die Dokumente werden per mget aus dem Index geladen; jedes Ergebnis enthält unter 'passages'
+           die passages_per_parent besten Passagen, die der generative Schritt statt des ganzen Textes nutzt.
+
+        Gibt es (noch) keinen Passagen-Index, wird auf vector_search_elasticsearch zurückgefallen.
+
+        Returns:
+            List[dict]: Treffer mit Feldern aus _source, Score und 'passages'.
+        """
+        query_emb = query_vector if query_vector is not None else self.encode_query(query, model_name)
+
+        try:
+            resp = self._elastic_client.search(
+                index=chunk_index_name(index_name),
+                body=chunk_search_body(query_emb, top_k, num_candidates, passages_per_parent)
+            )
+        except NotFoundError:
+            print(f"Kein Passagen-Index für '{index_name}', nutze Vektor-Suche auf Dokumentebene.")
+            return self.vector_search_elasticsearch(
+                index_name, query, model_name, top_k, num_candidates=num_candidates,
+                query_vector=query_emb, include_content=include_content
+            )
+
+        hits = self._passage_parent_hits(index_name, resp, include_content)
+        return prepare_search_results({"hits": {"hits": hits}}, index_name, include_content)
+
+    def _passage_parent_hits(self, index_name: str, chunk_response, include_content: bool) -> List[dict]:
+        # Lädt die Dokumente zu den zusammengefassten Passagen (ein mget-Roundtrip)
+        collapsed = collapse_passages(chunk_response)
+        if not collapsed:
+            return []
+        resp = self._elastic_client.mget(**parent_mget_params(index_name, collapsed, include_content))
+        return passage_parent_hits(collapsed, resp["docs"])
+
+    def migrate_index_to_knn(
+        self,
+        source_index: str,
+        target_index: str,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        quantize: bool = True,
+        m: int = 16,
+        ef_construction: int = 100,
+        poll_interval: float = 5.0,
+    ) -> dict:
+        """
+        Migriert einen Index mit nicht-indiziertem 'embedding'-Feld in einen neuen Index mit HNSW-Mapping.
+        Übernimmt alle übrigen Feld-Mappings, kopiert die Dokumente per _reindex (inkl. vorhandener Vektoren)
+        und wartet auf den Abschluss des Tasks.
+
+        Returns:
+            dict: Ergebnis des _reindex-Tasks.
+        """
+        dims = model_registry.get(model_name).get_sentence_embedding_dimension()
+
+        source_mapping = self._elastic_client.indices.get_mapping(index=source_index)
+        properties = dict(next(iter(source_mapping.values())).get("mappings", {}).get("properties", {}))
+        properties["embedding"] = embedding_field_mapping(dims, quantize, m, ef_construction)
+
+        if not self._elastic_client.indices.exists(index=target_index):
+            self._elastic_client.indices.create(index=target_index, mappings={"properties": properties})
+
+        task = self._elastic_client.reindex(
+            source={"index": source_index},
+            dest={"index": target_index},
+            wait_for_completion=False,
+        )
+        task_id = task["task"]
+        print(f"Reindex {source_index} -> {target_index} gestartet (Task {task_id}).")
+
+        while True:
+            status = self._elastic_client.tasks.get(task_id=task_id)
+            if status.get("completed"):
+                break
+            progress = status.get("task", {}).get("status", {})
+            print(f"{progress.get('created', 0) + progress.get('updated', 0)}/{progress.get('total', '?')} Dokumente migriert...")
+            time.sleep(poll_interval)
+
+        self._knn_unsupported.discard(target_index)
+        print(f"Migration abgeschlossen. Index '{target_index}' kann jetzt per Alias an die Stelle von '{source_index}' treten.")
+        return status.get("response", {})
 
 
     def hybrid_search_elasticsearch(
         self,
         index_name: str,
         query: str,
-        model_name: str = "distiluse-base-multilingual-cased-v1",
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
         top_k: int = 30,
         bm25_weight: float = 1.0,
         embedding_weight: float = 35.0,
+        mode: HybridMode = HybridMode.weighted,
+        window_size: int = 50,
+        rank_constant: int = 60,
+        num_candidates: Optional[int] = None,
+        query_vector: Optional[List[float]] = None,
+        include_content: bool = True,
+        passages: bool = False,
+        passages_per_parent: int = 3,
     ) -> List[dict]:
         """
         Führt eine hybride Suche in Elasticsearch durch:
-        - Kombiniert BM25-basierten Query-String-Score mit Vektor-Score (Cosine Similarity).
+        - Weighted: Kombiniert BM25-basierten Query-String-Score mit Vektor-Score (Cosine Similarity).
+        - RRF: siehe rrf_search_elasticsearch.
         - Entfernt Dokumente vom Typ "Attachment".
 
         Args:
@@ -414,50 +1661,92 @@ class RAGService:
             top_k (int): Anzahl der zurückzugebenden Top-Dokumente.
             bm25_weight (float): Gewichtung des BM25-Scores.
             embedding_weight (float): Gewichtung des Embedding-Scores.
+            mode (HybridMode): Weighted (script_score) oder RRF (Rank Fusion).
+            window_size (int): Treffer pro Teilabfrage bei RRF.
+            rank_constant (int): Rangkonstante bei RRF.
+            num_candidates (int): Kandidaten pro Shard für den kNN-Teil bei RRF.
+            query_vector (List[float]): Bereits berechnetes Query-Embedding (optional).
+            passages (bool): Vektor-Teil bei RRF über den Passagen-Index (siehe passage_search_elasticsearch).
+            passages_per_parent (int): Anzahl der besten Passagen pro Dokument.
 
         Returns:
             List[dict]: Treffer mit Feldern aus _source und kombiniertem Score.
         """
-        from sentence_transformers import SentenceTransformer
+        if mode == HybridMode.rrf:
+            return self.rrf_search_elasticsearch(
+                index_name, query, model_name, top_k, window_size, rank_constant, num_candidates, query_vector,
+                include_content, passages, passages_per_parent
+            )
 
         # 1) Embedding des Suchstrings berechnen
-        model = SentenceTransformer(model_name)
-        query_emb = model.encode([query], convert_to_numpy=True)[0].tolist()
+        query_emb = query_vector if query_vector is not None else self.encode_query(query, model_name)
 
         # 2) Hybrid-Abfrage zusammenstellen
-        body = {
-            "size": top_k,
-            "query": {
-                "script_score": {
-                    # a) Alle Dokumente (außer Attachments) durchsuchen
-                    "query": {
-                        "bool": {
-                            "should": [
-                                {"query_string": {"query": query}},  # BM25-Teil
-                                {"match_all": {}}                      # Basis für Embeddings
-                            ],
-                            "must_not": {"term": {"Type": "Attachment"}}
-                        }
-                    },
-                    # b) Score-Kombination: bm25_weight * BM25 + embedding_weight * (Cosine + Offset)
-                    "script": {
-                        "source": (
-                            "double bm25 = _score;"
-                            "double emb = cosineSimilarity(params.query_vector, 'embedding') + 1.0;"
-                            "return params.bm25_weight * bm25 + params.embedding_weight * emb;"
-                        ),
-                        "params": {
-                            "query_vector": query_emb,
-                            "bm25_weight": bm25_weight,
-                            "embedding_weight": embedding_weight
-                        }
-                    }
-                }
-            }
-        }
+        body = document_search_body(
+            "weighted", index_name, top_k, query, query_emb, bm25_weight=bm25_weight,
+            embedding_weight=embedding_weight, include_content=include_content
+        )
 
         # 3) Anfrage ausführen
         response = self._elastic_client.search(index=index_name, body=body)
 
-        return prepare_search_results(response, index_name)
+        return prepare_search_results(response, index_name, include_content)
+
+
+    def rrf_search_elasticsearch(
+        self,
+        index_name: str,
+        query: str,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        top_k: int = 30,
+        window_size: int = 50,
+        rank_constant: int = 60,
+        num_candidates: Optional[int] = None,
+        query_vector: Optional[List[float]] = None,
+        include_content: bool = True,
+        passages: bool = False,
+        passages_per_parent: int = 3,
+    ) -> List[dict]:
+        """
+        Hybride Suche per Reciprocal Rank Fusion:
+        - BM25 (query_string) und kNN liefern je höchstens window_size Treffer,
+          beide Abfragen gehen in einem _msearch-Roundtrip an Elasticsearch.
+        - Die beiden Listen werden clientseitig per RRF fusioniert.
+        - Mit passages=True läuft der kNN-Teil über den Passagen-Index; die Treffer enthalten
+          dann die besten Passagen (siehe passage_search_elasticsearch).
+
+        Die Kosten hängen damit von window_size ab und nicht von der Größe des Index.
+
+        Returns:
+            List[dict]: Treffer mit Feldern aus _source und RRF-Score.
+        """
+        window_size = max(window_size, top_k)
+        query_emb = query_vector if query_vector is not None else self.encode_query(query, model_name)
+
+        def _vector_body(exact: bool):
+            return document_search_body(
+                "exact" if exact else "knn", index_name, window_size, query_vector=query_emb,
+                num_candidates=num_candidates, include_content=include_content
+            )
+
+        resp = self._elastic_client.msearch(searches=rrf_searches(
+            index_name, query, query_emb, window_size, index_name in self._knn_unsupported, num_candidates,
+            include_content, passages, passages_per_parent
+        ))
+        keyword_resp, vector_resp = resp["responses"]
+
+        if passages and "error" in vector_resp:
+            print(f"Passagen-Suche für '{index_name}' nicht möglich, nutze Dokumentebene: {vector_resp['error']}")
+            passages = False
+            vector_resp = self._elastic_client.search(
+                index=index_name, body=_vector_body(index_name in self._knn_unsupported)
+            )
+        elif "error" in vector_resp and index_name not in self._knn_unsupported:
+            note_knn_error(self._knn_unsupported, index_name, vector_resp["error"])
+            vector_resp = self._elastic_client.search(index=index_name, body=_vector_body(True))
+
+        if passages:
+            vector_resp = {"hits": {"hits": self._passage_parent_hits(index_name, vector_resp, include_content)}}
 
+        fused = fuse_rrf_responses(index_name, (keyword_resp, vector_resp), rank_constant, top_k)
+        return prepare_search_results({"hits": {"hits": fused}}, index_name, include_content)
@@ -0,0 +1,89 @@
+import heapq
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+def normalize_scores(results: List[dict], best: Optional[float] = None) -> List[dict]:
+    """
+    Macht die Scores einer Quelle vergleichbar: score / bester Score der Quelle (0..1), der
+    ursprüngliche Score bleibt in raw_score erhalten. best gibt den Bezugs-Score vor (z.B. den
+    der ersten Seite beim Blättern, damit die Scores über Seiten hinweg vergleichbar bleiben).
+
+    Anders als Min-Max hängt die Normalisierung nur vom besten Treffer ab und ändert sich nicht,
+    wenn eine Quelle mit geringerer Tiefe abgefragt wird. Die Treffer werden kopiert, nicht verändert
+    (sie können z.B. aus dem Such-Cache stammen).
+    """
+    if best is None:
+        best = max((r.get("score") or 0.0 for r in results), default=0.0)
+    return [
+        {**r, "raw_score": r.get("score") or 0.0, "score": (r.get("score") or 0.0) / best if best > 0 else 0.0}
+        for r in results
+    ]
+
+
+def merge_top_k(results_by_source: Dict[str, List[dict]], top_k: int) -> List[dict]:
+    """
+    Globale Top-K über alle Quellen (normalisierte Scores) per Heap. Dokumente, die mehrere Quellen
+    liefern (gleicher Index und doc_id), zählen einmal mit dem besten Score; bei Gleichstand
+    entscheidet die Reihenfolge der Quellen.
+    """
+    best: Dict[Tuple, dict] = {}
+    for source, results in results_by_source.items():
+        for r in results:
+            key = (r.get("index"), r.get("doc_id")) if r.get("doc_id") is not None else (source, id(r))
+            if key not in best or r["score"] > best[key]["score"]:
+                best[key] = r
+    return heapq.nlargest(top_k, best.values(), key=lambda r: r["score"])
+
+
+class SourceDepthEstimator:
+    """
+    Adaptive Abfragetiefe je Quelle und Suchtyp.
+
+    Gemerkt wird (gleitender Mittelwert, alpha) der Anteil, den eine Quelle zur globalen Top-K beiträgt.
+    Die Tiefe ist topK * Anteil * headroom + min_depth, aufgerundet auf ein Vielfaches von step (damit
+    der Such-Cache stabile Schlüssel sieht) und höchstens topK. Unbekannte Quellen starten mit topK.
+    """
+
+    def __init__(self, min_depth: int = 3, headroom: float = 1.5, alpha: float = 0.2, step: int = 5):
+        self.min_depth = min_depth
+        self.headroom = headroom
+        self.alpha = alpha
+        self.step = step
+        self._shares: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self.merges = 0
+        self.refetches = 0
+        self.fetched = 0
+        self.returned = 0
+
+    def depth(self, source: str, search_type: str, top_k: int) -> int:
+        with self._lock:
+            share = self._shares.get((source, search_type))
+        if share is None:
+            return top_k
+        depth = math.ceil(top_k * share * self.headroom) + self.min_depth
+        depth = math.ceil(depth / self.step) * self.step
+        return max(1, min(top_k, depth))
+
+    def update(self, search_type: str, shares: Dict[str, float], fetched: int, returned: int, refetched: int) -> None:
+        with self._lock:
+            for source, share in shares.items():
+                key = (source, search_type)
+                previous = self._shares.get(key)
+                self._shares[key] = share if previous is None else previous + self.alpha * (share - previous)
+            self.merges += 1
+            self.refetches += refetched
+            self.fetched += fetched
+            self.returned += returned
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "merges": self.merges,
+                "refetches": self.refetches,
+                "fetched_hits": self.fetched,
+                "returned_hits": self.returned,
+                "shares": {f"{source}/{search_type}": round(share, 3) for (source, search_type), share in self._shares.items()},
+            }
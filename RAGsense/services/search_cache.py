@@ -0,0 +1,229 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+from dotenv import load_dotenv
+
+from services.instrumentation import record_search_cache
+
+load_dotenv()
+
+# Generation eines Index: (indexierte Dokumente, gelöschte Dokumente, externe Refreshes) der Primärshards
+Generation = Tuple[int, int, int]
+
+
+class IndexGenerationTracker:
+    """
+    Billiges Änderungssignal pro Index: fragt die Indexing- und Refresh-Statistiken (_stats) der
+    beobachteten Indizes im Hintergrund alle poll_interval Sekunden ab.
+
+    Ein Schreibzugriff ändert index_total/delete_total, der anschließende Refresh (erst dann ist die
+    Änderung suchbar) noch einmal external_total. Ist ein Index nicht erreichbar, ist seine Generation
+    unbekannt (None) und der Cache wird für ihn umgangen.
+    """
+
+    def __init__(self, client, poll_interval: float = 2.0):
+        self._client = client
+        self._poll_interval = poll_interval
+        self._generations: Dict[str, Optional[Generation]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._failing: Set[str] = set()
+        self.polls = 0
+        self.errors = 0
+
+    async def _fetch(self, index_name: str) -> Optional[Generation]:
+        try:
+            resp = await self._client.indices.stats(index=index_name, metric="indexing,refresh")
+            primaries = resp["_all"]["primaries"]
+            self._failing.discard(index_name)
+            return (
+                primaries["indexing"]["index_total"],
+                primaries["indexing"]["delete_total"],
+                primaries["refresh"]["external_total"],
+            )
+        except Exception as e:
+            self.errors += 1
+            if index_name not in self._failing:
+                self._failing.add(index_name)
+                print(f"Generation von '{index_name}' nicht abrufbar, Such-Cache wird umgangen: {e}")
+            return None
+
+    async def generation(self, index_name: str) -> Optional[Generation]:
+        """
+        Zuletzt bekannte Generation; beim ersten Zugriff auf einen Index wird sie direkt abgefragt
+        und der Index ab dann im Hintergrund beobachtet.
+        """
+        if index_name not in self._generations:
+            self._generations[index_name] = await self._fetch(index_name)
+            if self._task is None:
+                self._task = asyncio.create_task(self._poll())
+        return self._generations[index_name]
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            names = list(self._generations)
+            for name, generation in zip(names, await asyncio.gather(*(self._fetch(n) for n in names))):
+                self._generations[name] = generation
+            self.polls += 1
+
+    def watched(self) -> int:
+        return len(self._generations)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class SearchResultCache:
+    """
+    LRU-Cache für aufbereitete Suchergebnisse (Liste aus prepare_search_results), Schlüssel ist
+    (Index, Suchtyp, normalisierte Query, Parameter wie topK und Gewichte).
+
+    Jeder Eintrag merkt sich die Generationen seiner Indizes beim Start der Abfrage; weicht sie beim
+    Lesen von der aktuellen ab, wird er verworfen. Die TTL begrenzt zusätzlich das Alter.
+    Das Speicherbudget begrenzt die Summe der (als JSON geschätzten) Größen der Einträge.
+    """
+
+    def __init__(self, max_memory_mb: float = 64, ttl_seconds: float = 300):
+        self._max_bytes = int(max_memory_mb * 1024 * 1024)
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(index_name: str, search_type: str, query: str, **params) -> Hashable:
+        # Nur Whitespace normalisieren: query_string-Operatoren und das Embedding-Modell sind case-sensitiv
+        return (index_name, search_type, " ".join(query.split()), tuple(sorted(params.items())))
+
+    def get(self, key: Hashable, generation: Tuple[Generation, ...]) -> Optional[List[dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                record_search_cache("miss")
+                return None
+            if entry["generation"] != generation or entry["expires_at"] < time.monotonic():
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                record_search_cache("invalidated")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry["seconds"]
+        record_search_cache("hit", entry["seconds"])
+        # Flache Kopien, damit Aufrufer die Treffer im Cache nicht verändern
+        return [dict(hit) for hit in entry["results"]]
+
+    def put(self, key: Hashable, generation: Tuple[Generation, ...], results: List[dict], seconds: float) -> None:
+        # Flache Kopien, damit spätere Änderungen des Aufrufers (z.B. Score-Normalisierung) den Eintrag nicht verändern
+        results = [dict(hit) for hit in results]
+        size = len(json.dumps(results, default=str))
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "results": results,
+                "generation": generation,
+                "seconds": seconds,
+                "size": size,
+                "expires_at": time.monotonic() + self._ttl,
+            }
+            self._bytes += size
+            while self._bytes > self._max_bytes and self._entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        # Muss unter self._lock aufgerufen werden
+        self._bytes -= self._entries.pop(key)["size"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "saved_es_seconds": self.saved_seconds,
+            }
+
+
+class CachedSearch:
+    """
+    Verbindet SearchResultCache und IndexGenerationTracker für die Suchmethoden von AsyncRAGService.
+    """
+
+    def __init__(self, cache: SearchResultCache, tracker: IndexGenerationTracker):
+        self.cache = cache
+        self.tracker = tracker
+
+    async def run(
+        self,
+        index_name: str,
+        search_type: str,
+        query: str,
+        fetch: Callable[[], Awaitable[List[dict]]],
+        extra_indices: Sequence[str] = (),
+        **params,
+    ) -> List[dict]:
+        """
+        Ergebnis aus dem Cache oder per fetch(); die Generation wird vor der Abfrage bestimmt,
+        damit eine währenddessen geänderte Generation den neuen Eintrag sofort ungültig macht.
+        extra_indices sind weitere Indizes, aus denen fetch liest (z.B. der Passagen-Index).
+        """
+        generation = tuple([await self.tracker.generation(name) for name in (index_name, *extra_indices)])
+        if None in generation:
+            return await fetch()
+        key = self.cache.key(index_name, search_type, query, **params)
+        results = self.cache.get(key, generation)
+        if results is not None:
+            return results
+        started = time.perf_counter()
+        results = await fetch()
+        self.cache.put(key, generation, results, time.perf_counter() - started)
+        return results
+
+    def stats(self) -> dict:
+        return {
+            **self.cache.stats(),
+            "watched_indices": self.tracker.watched(),
+            "generation_polls": self.tracker.polls,
+            "generation_errors": self.tracker.errors,
+        }
+
+    async def close(self) -> None:
+        await self.tracker.close()
+
+
+def create_search_cache(client) -> Optional[CachedSearch]:
+    """
+    Such-Cache laut SEARCH_CACHE (on/off) für den übergebenen AsyncElasticsearch-Client.
+    """
+    if os.getenv("SEARCH_CACHE", "on") == "off":
+        return None
+    return CachedSearch(
+        SearchResultCache(
+            max_memory_mb=float(os.getenv("SEARCH_CACHE_MB", "64")),
+            ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL", "300")),
+        ),
+        IndexGenerationTracker(client, poll_interval=float(os.getenv("SEARCH_CACHE_POLL_INTERVAL", "2"))),
+    )
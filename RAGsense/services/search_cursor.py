@@ -0,0 +1,109 @@
+import base64
+import binascii
+import hashlib
+import json
+import time
+from typing import Dict, Optional
+
+
+class InvalidCursorError(ValueError):
+    """
+    Cursor ist nicht lesbar oder gehört zu einer anderen Suchanfrage.
+    """
+
+
+class CursorExpiredError(Exception):
+    """
+    Der Point-in-Time des Cursors ist abgelaufen bzw. geschlossen oder der Cursor lässt sich nicht
+    fortsetzen (z.B. kNN nicht mehr möglich); die Suche muss neu beginnen.
+    """
+
+
+def request_fingerprint(params: dict) -> str:
+    """
+    Hash der Suchparameter, die das Ergebnis bestimmen; ein Cursor gilt nur für dieselben Parameter.
+    """
+    payload = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_cursor(fingerprint: str, sources: Dict[str, dict]) -> str:
+    """
+    Opaker Cursor (base64url-JSON) mit dem Zustand je Quelle: PIT-IDs, search_after bzw. Offset.
+    """
+    payload = json.dumps({"v": 1, "fp": fingerprint, "sources": sources}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> Dict[str, dict]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorError("Cursor ist ungültig")
+    if not isinstance(payload, dict) or payload.get("v") != 1 or not isinstance(payload.get("sources"), dict):
+        raise InvalidCursorError("Cursor ist ungültig")
+    if payload.get("fp") != fingerprint:
+        raise InvalidCursorError("Cursor gehört zu einer anderen Suchanfrage")
+    return payload["sources"]
+
+
+class PitRegistry:
+    """
+    Point-in-Times der Cursor-Pagination, die dieser Prozess geöffnet oder verlängert hat.
+
+    Abgelaufene PITs gibt Elasticsearch selbst frei (keep_alive_seconds nach der letzten Seite). Hier
+    werden sie nur vorgemerkt, um beim Herunterfahren die noch offenen zu schließen; geschlossen wird
+    sonst nichts, da mit mehreren Workern die weiteren Seiten desselben Cursors auch ein anderer
+    Prozess bedienen kann.
+    """
+
+    def __init__(self, client, keep_alive_seconds: int = 120):
+        self._client = client
+        self.keep_alive_seconds = keep_alive_seconds
+        self._expires: Dict[str, float] = {}
+        self.opened = 0
+        self.closed = 0
+        self.expired = 0
+
+    @property
+    def keep_alive(self) -> str:
+        return f"{self.keep_alive_seconds}s"
+
+    async def open(self, index_name: str) -> str:
+        resp = await self._client.open_point_in_time(index=index_name, keep_alive=self.keep_alive)
+        self.opened += 1
+        self.touch(resp["id"])
+        return resp["id"]
+
+    def touch(self, pit_id: str, previous_id: Optional[str] = None) -> None:
+        """
+        Merkt die Verlängerung nach einer Seite vor; Elasticsearch kann dabei eine neue PIT-ID liefern.
+        """
+        if previous_id is not None and previous_id != pit_id:
+            self._expires.pop(previous_id, None)
+        self._forget_expired()
+        self._expires[pit_id] = time.monotonic() + self.keep_alive_seconds
+
+    async def close_pit(self, pit_id: str) -> None:
+        self._expires.pop(pit_id, None)
+        try:
+            await self._client.close_point_in_time(id=pit_id)
+            self.closed += 1
+        except Exception as e:
+            print(f"Point-in-Time konnte nicht geschlossen werden: {e}")
+
+    def _forget_expired(self) -> None:
+        # Hier nicht mehr verlängerte PITs sind abgelaufen oder werden von einem anderen Worker genutzt
+        now = time.monotonic()
+        for pit_id in [pit_id for pit_id, expires_at in self._expires.items() if expires_at < now]:
+            del self._expires[pit_id]
+            self.expired += 1
+
+    async def close(self) -> None:
+        self._forget_expired()
+        for pit_id in list(self._expires):
+            await self.close_pit(pit_id)
+
+    def stats(self) -> dict:
+        self._forget_expired()
+        return {"open": len(self._expires), "opened": self.opened, "closed": self.closed, "expired": self.expired}
@@ -0,0 +1,79 @@
+"""
+Gemeinsame Fixtures der Tests: Elasticsearch, LLM-Server und Embedding-Modell sind die lokalen Fakes
+aus benchmarks/ (ohne Netzwerk, ohne Modelle). Aus dem Verzeichnis RAGsense starten:
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.__main__ import configure_environment
+from benchmarks.fake_llm import FakeLLMServer
+
+# Die Konfiguration wird beim Import von services/API_RAGsense gelesen, der LLM-Server muss vorher laufen
+_llm = FakeLLMServer(answer_tokens=8, first_token_ms=0, token_ms=0).start()
+configure_environment(_llm.url)
+
+import API_RAGsense as api
+from benchmarks import scenarios
+from benchmarks.corpus import SyntheticCorpus
+from benchmarks.fake_elasticsearch import FakeElasticsearch, FakeElasticsearchServer
+from benchmarks.fake_encoder import FakeEncoder
+from services.async_rag_service import AsyncRAGService
+
+
+@pytest.fixture(scope="session", autouse=True)
+def llm_server():
+    yield _llm
+    _llm.stop()
+
+
+@pytest.fixture(scope="session")
+def corpus() -> SyntheticCorpus:
+    return SyntheticCorpus(size=300, seed=1)
+
+
+@pytest.fixture(scope="session")
+def encoder() -> FakeEncoder:
+    encoder = FakeEncoder(dims=32, batch_ms=0, text_ms=0)
+    scenarios.register_encoder(encoder)
+    return encoder
+
+
+@pytest.fixture
+def es(corpus, encoder) -> FakeElasticsearch:
+    es = FakeElasticsearch()
+    scenarios.load_search_corpus(es, corpus, encoder)
+    return es
+
+
+@pytest.fixture
+def es_server(es):
+    server = FakeElasticsearchServer(es).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def run_api(es_server):
+    """
+    Führt scenario(client, rag) in einer eigenen Event-Loop gegen die API aus (ASGI, ohne Netzwerk);
+    der AsyncRAGService wird dafür neu angelegt, Umgebungsvariablen gelten also ab dem Aufruf.
+    """
+    def run(scenario):
+        async def main():
+            api.rag = AsyncRAGService(es_server.url, None, "elastic", "password")
+            try:
+                transport = httpx.ASGITransport(app=api.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+                    return await scenario(client, api.rag)
+            finally:
+                await api.rag.close()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,74 @@
+import asyncio
+
+from services.answer_cache import AnswerCache, MemoryAnswerStore
+from services.async_rag_service import AsyncRAGService
+
+DOCS = ["jira/BENCH-1", "jira/BENCH-2"]
+VERSIONS = {"jira/BENCH-1": 1, "jira/BENCH-2": 3}
+
+
+def semantic_cache() -> AnswerCache:
+    return AnswerCache(MemoryAnswerStore(), semantic=True, threshold=0.9)
+
+
+def test_prompt_variants_do_not_share_semantic_entries():
+    cache = semantic_cache()
+    cache.put("m", "Fasse zusammen: Wie starte ich den Dienst?", DOCS, "kurz", VERSIONS, [1.0, 0.0],
+              instructions="Fasse zusammen.")
+
+    # Ähnliche Frage über dieselben Dokumente, aber mit anderer promptExtension
+    assert cache.lookup("m", "Auf Englisch: Wie startet man den Dienst?", DOCS, [0.99, 0.1],
+                        instructions="Antworte auf Englisch.") is None
+    entry = cache.lookup("m", "Fasse zusammen: Wie startet man den Dienst?", DOCS, [0.99, 0.1],
+                         instructions="Fasse zusammen.")
+    assert entry is not None and entry["tier"] == "semantic" and entry["answer"] == "kurz"
+
+
+def test_exact_hit_requires_same_prompt_and_documents():
+    cache = AnswerCache(MemoryAnswerStore())
+    cache.put("m", "Wie starte ich den Dienst?", DOCS, "so", VERSIONS)
+
+    # Reihenfolge der Dokumente spielt keine Rolle, Prompt und Modell schon
+    entry = cache.lookup("m", "Wie starte ich den Dienst?", list(reversed(DOCS)))
+    assert entry["tier"] == "exact" and entry["answer"] == "so"
+    assert cache.lookup("m", "Wie stoppe ich den Dienst?", DOCS) is None
+    assert cache.lookup("m2", "Wie starte ich den Dienst?", DOCS) is None
+    assert cache.lookup("m", "Wie starte ich den Dienst?", DOCS[:1]) is None
+
+
+def test_semantic_hit_requires_similar_query():
+    cache = semantic_cache()
+    cache.put("m", "Wie starte ich den Dienst?", DOCS, "so", VERSIONS, [1.0, 0.0])
+
+    entry = cache.lookup("m", "Wie startet man den Dienst?", DOCS, [0.95, 0.05])
+    assert entry["tier"] == "semantic" and entry["similarity"] >= 0.9
+    assert cache.lookup("m", "Wer betreibt den Dienst?", DOCS, [0.5, 0.5]) is None
+    # Ohne semantische Stufe nur exakte Treffer
+    exact_only = AnswerCache(MemoryAnswerStore())
+    exact_only.put("m", "Wie starte ich den Dienst?", DOCS, "so", VERSIONS, [1.0, 0.0])
+    assert exact_only.lookup("m", "Wie startet man den Dienst?", DOCS, [1.0, 0.0]) is None
+
+
+def test_changed_document_invalidates_cached_answer(es, es_server, corpus):
+    doc_ids = list(es.indices["jira"].docs)[:2]
+    doc_refs = [f"jira/{doc_id}" for doc_id in doc_ids]
+    prompt = f"Beantworte: {corpus.queries(1)[0]}"
+
+    async def main():
+        rag = AsyncRAGService(es_server.url, None, "elastic", "password")
+        rag.answer_cache = AnswerCache(MemoryAnswerStore())
+        try:
+            first, first_tier = await rag.cached_answer(prompt, doc_refs)
+            second, second_tier = await rag.cached_answer(prompt, doc_refs)
+            # Ein Quelldokument wird neu geschrieben: neue _version, die Antwort ist veraltet
+            es.indices["jira"].put(doc_ids[1], dict(es.indices["jira"].docs[doc_ids[1]]))
+            _, third_tier = await rag.cached_answer(prompt, doc_refs)
+            _, fourth_tier = await rag.cached_answer(prompt, doc_refs)
+            return (first, first_tier), (second, second_tier), third_tier, fourth_tier, rag.answer_cache.stats()
+        finally:
+            await rag.close()
+
+    first, second, third_tier, fourth_tier, stats = asyncio.run(main())
+    assert first[1] is None and second == (first[0], "exact")
+    assert (third_tier, fourth_tier) == (None, "exact")
+    assert (stats["exact_hits"], stats["invalidations"]) == (2, 1)
@@ -0,0 +1,52 @@
+from Models import HybridMode
+from services.batch_search import BatchSearch
+
+
+def test_msearch_chunks_and_failed_sub_search_falls_back(run_api, corpus):
+    queries = corpus.queries(5)
+
+    async def scenario(client, rag):
+        msearch_sizes, fallbacks = [], []
+        msearch = rag.msearch
+
+        async def counting_msearch(searches):
+            msearch_sizes.append(len(searches) // 2)
+            return await msearch(searches)
+
+        rag.msearch = counting_msearch
+        batch = BatchSearch(rag, chunk_size=4)
+        vectors = [await rag.encode_query(q) for q in queries]
+        units = [batch.plan(i, "jira", "keyword", q, None, 10, include_content=False) for i, q in enumerate(queries[:3])]
+        units += [
+            batch.plan(i, "jira", "hybrid", q, v, 10, hybrid_mode=HybridMode.rrf, include_content=False)
+            for i, q, v in zip((3, 4), queries[3:], vectors[3:])
+        ]
+        # Teilabfrage auf einen fehlenden Index: _msearch meldet den Fehler nur für diese Einheit
+        units[1].searches = [({"index": "fehlt"}, units[1].searches[0][1])]
+        fallback = units[1].fallback
+
+        async def counting_fallback():
+            fallbacks.append(units[1].key)
+            return await fallback()
+
+        units[1].fallback = counting_fallback
+        results = {key: hits async for key, hits in batch.run(units)}
+
+        expected = {
+            i: await rag.search_elasticsearch(q, "jira", 10, include_content=False) for i, q in enumerate(queries[:3])
+        }
+        for i, q, v in zip((3, 4), queries[3:], vectors[3:]):
+            expected[i] = await rag.hybrid_search_elasticsearch(
+                "jira", q, top_k=10, mode=HybridMode.rrf, query_vector=v, include_content=False
+            )
+        return results, expected, msearch_sizes, fallbacks
+
+    results, expected, msearch_sizes, fallbacks = run_api(scenario)
+    # 3 Keyword-Abfragen + 2 x 2 für RRF = 7 Teilabfragen; die Teilabfragen einer Einheit bleiben zusammen
+    assert sorted(msearch_sizes) == [3, 4]
+    assert fallbacks == [1]
+    assert sorted(results) == list(range(5))
+    for key, hits in results.items():
+        assert not isinstance(hits, BaseException), hits
+        assert [(h["doc_id"], h["score"]) for h in hits] == [(h["doc_id"], h["score"]) for h in expected[key]]
+    assert all(results.values())
@@ -0,0 +1,63 @@
+from typing import List
+
+import httpx
+
+from services.context_builder import ContextBuilder, HeuristicTokenCounter, ServerTokenCounter, TokenCounter
+
+
+class WordCounter(TokenCounter):
+    # Ein Token pro Wort, damit die Budgets im Test genau nachrechenbar sind
+    def count_many(self, texts: List[str]) -> List[int]:
+        return [len(text.split()) for text in texts]
+
+
+def test_context_fits_the_budget_and_keeps_the_best_sentences():
+    filler = [f"Absatz {n} beschreibt allgemeine Hinweise zur Bedienung der Oberfläche." for n in range(30)]
+    relevant = "Den Export startet man im Menü Berichte über die Schaltfläche Export."
+    sentences = filler[:20] + [relevant] + filler[20:]
+    sources = [
+        {"label": "Handbuch", "text": " ".join(sentences)},
+        {"label": "FAQ", "text": "Wie funktioniert der Export nach Excel? Über Berichte und dann Export wählen."},
+    ]
+    reserved = "Beantworte die Frage anhand des Kontexts."
+
+    context = ContextBuilder(WordCounter(), budget_tokens=60).build("Export Berichte", sources, reserved)
+    assert context.truncated
+    assert context.tokens <= 60
+    assert context.tokens == WordCounter().count(reserved) + WordCounter().count(context.text)
+    assert relevant in context.text
+    # Quellen in Rangfolge, die Einheiten einer Quelle in Originalreihenfolge
+    assert context.text.startswith("Handbuch\n") and "\n\nFAQ\n" in context.text
+    lines = context.text.split("\n\nFAQ\n")[0].splitlines()[1:]
+    assert lines == [sentence for sentence in sentences if sentence in lines]
+
+    # Ohne Platz neben dem reservierten Teil bleibt der Kontext leer
+    empty = ContextBuilder(WordCounter(), budget_tokens=5).build("Export", sources, reserved)
+    assert (empty.text, empty.truncated) == ("", True)
+
+
+def test_overlapping_passages_are_included_once():
+    first = "Der Dienst wird mit systemctl start rag gestartet. Danach prüft man den Status mit systemctl status rag."
+    second = "Danach prüft man den Status mit systemctl status rag. Die Logs liegen unter /var/log/rag."
+    sources = [{"label": "Betrieb", "passages": [first, second]}]
+
+    context = ContextBuilder(HeuristicTokenCounter(), budget_tokens=500).build("systemctl status Logs", sources)
+    assert not context.truncated
+    assert context.text.count("Danach prüft man den Status") == 1
+    assert "systemctl start rag gestartet" in context.text and "/var/log/rag" in context.text
+
+
+def test_server_counter_backs_off_after_a_failure(capsys):
+    counter = ServerTokenCounter("http://tokenizer/tokenize", HeuristicTokenCounter(chars_per_token=4), backoff_seconds=60)
+    calls = []
+
+    def failing_post(url, json):
+        calls.append(json["content"])
+        raise httpx.ConnectError("nicht erreichbar")
+
+    counter._client.post = failing_post
+    assert [counter.count("abcdefgh") for _ in range(3)] == [2, 2, 2]
+    assert counter.count_many(["abcd", "abcdefgh"]) == [1, 2]
+    # Ein Versuch, danach bis zum Ende der Backoff-Zeit nur die Schätzung und eine einzige Meldung
+    assert len(calls) == 1
+    assert capsys.readouterr().out.count("fehlgeschlagen") == 1
@@ -0,0 +1,60 @@
+import json
+
+from elasticsearch import Elasticsearch
+
+from benchmarks.fake_elasticsearch import FakeElasticsearch, FakeElasticsearchServer
+from services.embedding_pipeline import EmbeddingPipeline
+from services.rag_service import extract_text, text_fingerprint
+
+
+def test_restart_after_expired_pit_resets_counters(corpus, encoder, tmp_path):
+    es = FakeElasticsearch()
+    es.load("jira", corpus.jira_documents())
+    total = len(es.indices["jira"].docs)
+    # Der abgebrochene Lauf hat die ersten 50 Dokumente bereits geschrieben
+    for doc_id in list(es.indices["jira"].docs)[:50]:
+        source = es.indices["jira"].docs[doc_id]
+        source.update(embedding_model="v1", embedding_text_hash=text_fingerprint(extract_text(source, "jira")))
+    checkpoint_path = tmp_path / "checkpoint.json"
+    checkpoint_path.write_text(json.dumps({
+        "index": "jira", "model": "v1", "processed": 50, "skipped": 0, "pit_id": "abgelaufen", "search_after": [0.0, 49],
+    }))
+
+    server = FakeElasticsearchServer(es).start()
+    try:
+        pipeline = EmbeddingPipeline(
+            Elasticsearch(server.url), encoder, "v1", batch_size=32, checkpoint_path=str(checkpoint_path),
+            show_progress=False,
+        )
+        processed = pipeline.run("jira")
+    finally:
+        server.stop()
+
+    assert processed == total - 50
+    assert pipeline.skipped == 50
+    assert not checkpoint_path.exists()
+    assert all(doc.get("embedding_model") == "v1" for doc in es.indices["jira"].docs.values())
+
+
+def test_incremental_run_reads_only_stale_documents(corpus, encoder):
+    es = FakeElasticsearch()
+    es.load("jira", corpus.jira_documents())
+    total = len(es.indices["jira"].docs)
+    doc_ids = list(es.indices["jira"].docs)
+    for doc_id in doc_ids[:100]:
+        source = es.indices["jira"].docs[doc_id]
+        source.update(embedding_model="v1", embedding_text_hash=text_fingerprint(extract_text(source, "jira")))
+    # Älteres Modell: wird gelesen und neu berechnet
+    es.indices["jira"].docs[doc_ids[0]]["embedding_model"] = "v0"
+
+    server = FakeElasticsearchServer(es).start()
+    try:
+        pipeline = EmbeddingPipeline(Elasticsearch(server.url), encoder, "v1", batch_size=32, incremental=True,
+                                     show_progress=False)
+        processed = pipeline.run("jira")
+    finally:
+        server.stop()
+
+    assert processed == total - 99
+    assert pipeline.skipped == 99
+    assert pipeline.stats["fetch"].docs == total - 99
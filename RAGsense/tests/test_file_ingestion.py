@@ -0,0 +1,103 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from elasticsearch import Elasticsearch
+
+from benchmarks.fake_elasticsearch import FakeElasticsearch, FakeElasticsearchServer
+from services import file_ingestion
+from services.file_handler import FileHandler
+from services.file_ingestion import FileIngestionPipeline, IngestManifest, page_doc_id
+
+
+def extracted(path: str, pages: int) -> dict:
+    return {"path": path, "mtime": 1.0, "size": 10, "hash": path, "pages": [(n, f"Seite {n}") for n in range(1, pages + 1)]}
+
+
+def index_result(path: str, page_number: int, ok: bool = True):
+    item = {"_index": "files", "_id": page_doc_id(path, page_number), "status": 201 if ok else 429}
+    if not ok:
+        item["error"] = {"type": "es_rejected_execution_exception"}
+    return ok, {"index": item}
+
+
+def test_retried_actions_are_credited_to_their_file():
+    pipeline = FileIngestionPipeline(None, "files", IngestManifest(None))
+    actions = list(pipeline._actions(iter([extracted("/a.pdf", 2), extracted("/b.pdf", 1)])))
+    assert len(actions) == 3
+
+    # Seite 2 von a wurde wiederholt (429) und kommt erst nach b zurück
+    pipeline._acknowledge(*index_result("/a.pdf", 1))
+    pipeline._acknowledge(*index_result("/b.pdf", 1))
+    assert list(pipeline.manifest.files) == ["/b.pdf"]
+    pipeline._acknowledge(*index_result("/a.pdf", 2))
+    assert sorted(pipeline.manifest.files) == ["/a.pdf", "/b.pdf"]
+    assert pipeline.stats["pages"] == 3
+
+
+def test_failed_retry_marks_only_its_file_failed():
+    pipeline = FileIngestionPipeline(None, "files", IngestManifest(None))
+    list(pipeline._actions(iter([extracted("/a.pdf", 2), extracted("/b.pdf", 1)])))
+
+    pipeline._acknowledge(*index_result("/a.pdf", 1))
+    pipeline._acknowledge(*index_result("/b.pdf", 1))
+    pipeline._acknowledge(*index_result("/a.pdf", 2, ok=False))
+    assert list(pipeline.manifest.files) == ["/b.pdf"]
+    assert (pipeline.stats["indexed"], pipeline.stats["failed"]) == (1, 1)
+
+
+def test_unchanged_files_are_skipped_and_removed_pages_deleted(tmp_path, monkeypatch):
+    # "PDFs" als Textdateien, Seiten durch Formfeed getrennt; PyPDF2 wird nicht gebraucht
+    reads, hashes = [], []
+
+    def iter_pdf_pages(path):
+        reads.append(os.path.basename(path))
+        with open(path, encoding="utf-8") as f:
+            yield from enumerate(f.read().split("\f"), start=1)
+
+    def file_hash(path):
+        hashes.append(os.path.basename(path))
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    monkeypatch.setattr(FileHandler, "iter_pdf_pages", staticmethod(iter_pdf_pages))
+    monkeypatch.setattr(FileHandler, "file_hash", staticmethod(file_hash))
+    # Im selben Prozess extrahieren, damit die Ersetzungen greifen
+    monkeypatch.setattr(file_ingestion, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+    root = tmp_path / "docs"
+    root.mkdir()
+    a, b = root / "a.pdf", root / "b.pdf"
+    a.write_text("Seite eins\fSeite zwei\fSeite drei", encoding="utf-8")
+    b.write_text("Nur eine Seite", encoding="utf-8")
+    manifest_path = str(tmp_path / "manifest.json")
+
+    es = FakeElasticsearch()
+    server = FakeElasticsearchServer(es).start()
+    try:
+        def run() -> dict:
+            reads.clear()
+            hashes.clear()
+            pipeline = FileIngestionPipeline(Elasticsearch(server.url), "files", IngestManifest(manifest_path), workers=2)
+            return pipeline.run(str(root))
+
+        stats = run()
+        assert (stats["indexed"], stats["pages"]) == (2, 4)
+        assert len(es.indices["files"].docs) == 4
+
+        # Zweiter Lauf: mtime und Größe unverändert, keine Datei wird gelesen oder gehasht
+        stats = run()
+        assert (stats["unchanged"], stats["indexed"]) == (2, 0)
+        assert (reads, hashes) == ([], [])
+
+        # a.pdf verliert zwei Seiten, b.pdf bekommt nur eine neue mtime
+        a.write_text("Seite eins", encoding="utf-8")
+        os.utime(b, (1.0, 1.0))
+        stats = run()
+        assert (stats["indexed"], stats["unchanged"], stats["deleted_pages"]) == (1, 1, 2)
+        assert sorted(hashes) == ["a.pdf", "b.pdf"] and reads == ["a.pdf"]
+        assert sorted(es.indices["files"].docs) == sorted([page_doc_id(str(a), 1), page_doc_id(str(b), 1)])
+        assert IngestManifest(manifest_path).files[str(a)]["pages"] == [1]
+        assert IngestManifest(manifest_path).files[str(b)]["mtime"] == 1.0
+    finally:
+        server.stop()
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from benchmarks.fake_elasticsearch import ElasticsearchError
+from Models import SearchRequest
+from services.async_rag_service import AsyncRAGService
+from services.rag_service import KNN_MAX_CANDIDATES, chunk_search_body, knn_search_body, note_knn_error
+
+
+def test_knn_body_is_clamped_to_the_elasticsearch_limit():
+    knn = knn_search_body([0.1, 0.2], top_k=20000, num_candidates=50000)["knn"]
+    assert (knn["k"], knn["num_candidates"]) == (KNN_MAX_CANDIDATES, KNN_MAX_CANDIDATES)
+    assert knn_search_body([0.1, 0.2], top_k=10)["knn"]["num_candidates"] == 100
+
+    knn = chunk_search_body([0.1, 0.2], top_k=5000, passages_per_parent=3)["knn"]
+    assert knn["k"] <= knn["num_candidates"] <= KNN_MAX_CANDIDATES
+
+
+def test_num_candidates_is_bounded():
+    with pytest.raises(ValidationError):
+        SearchRequest(query="x", sources=["jira"], searchType="Embedding", numCandidates=20000)
+
+
+def test_only_mapping_errors_disable_knn():
+    unsupported = set()
+    note_knn_error(unsupported, "jira", {"type": "illegal_argument_exception", "reason": "[k] must be greater than 0"})
+    assert not unsupported
+    note_knn_error(unsupported, "jira", {
+        "type": "illegal_argument_exception",
+        "reason": "to perform knn search on field [embedding], its mapping must have [index] set to [true]",
+    })
+    assert unsupported == {"jira"}
+
+
+def failing_knn(es, monkeypatch, reason: str) -> None:
+    # Jede kNN-Abfrage der Fake-Instanz scheitert mit einem 400, die exakte Suche funktioniert
+    search = es.search
+
+    def _search(expression, body, params):
+        if "knn" in (body or {}):
+            raise ElasticsearchError(400, "illegal_argument_exception", reason)
+        return search(expression, body, params)
+
+    monkeypatch.setattr(es, "search", _search)
+
+
+def vector_search(es_server, query: str):
+    async def main():
+        rag = AsyncRAGService(es_server.url, None, "elastic", "password")
+        try:
+            hits = await rag.vector_search_elasticsearch("jira", query, top_k=5, include_content=False)
+            return hits, rag.knn_supported("jira")
+        finally:
+            await rag.close()
+    return asyncio.run(main())
+
+
+def test_request_error_falls_back_without_disabling_knn(es, es_server, corpus, monkeypatch):
+    failing_knn(es, monkeypatch, "[num_candidates] cannot exceed [10000]")
+    hits, knn_supported = vector_search(es_server, corpus.queries(1)[0])
+    assert len(hits) == 5
+    assert knn_supported
+
+
+def test_mapping_error_disables_knn_for_the_index(es, es_server, corpus, monkeypatch):
+    failing_knn(es, monkeypatch, "field [embedding] is not a dense_vector")
+    hits, knn_supported = vector_search(es_server, corpus.queries(1)[0])
+    assert len(hits) == 5
+    assert not knn_supported
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+import API_RAGsense as api
+from services.llm_scheduler import LLMOverloadedError, LLMPriority, LLMScheduler
+
+
+async def queued(scheduler: LLMScheduler, priority: LLMPriority, deadline=None) -> asyncio.Task:
+    # Auftrag anstellen und warten, bis er in der Warteschlange steht
+    task = asyncio.create_task(scheduler.acquire(priority, deadline))
+    await asyncio.sleep(0)
+    return task
+
+
+def test_interactive_request_sheds_the_youngest_bulk_waiter():
+    async def main():
+        scheduler = LLMScheduler(max_in_flight=1, max_queue=2, queue_timeout=5)
+        await scheduler.acquire(LLMPriority.bulk)
+        older = await queued(scheduler, LLMPriority.bulk)
+        younger = await queued(scheduler, LLMPriority.bulk)
+
+        interactive = await queued(scheduler, LLMPriority.interactive)
+        with pytest.raises(LLMOverloadedError) as shed:
+            await younger
+        assert (shed.value.status_code, scheduler.shed) == (503, 1)
+
+        # Nur noch Gleichrangige bzw. Höhere in der Warteschlange: abweisen statt verdrängen
+        with pytest.raises(LLMOverloadedError) as rejected:
+            scheduler.check_admission(LLMPriority.bulk)
+        assert rejected.value.status_code == 429
+        with pytest.raises(LLMOverloadedError):
+            await scheduler.acquire(LLMPriority.bulk)
+        assert scheduler.rejected == 2
+
+        # Der freie Slot geht an die interaktive Anfrage, danach an den älteren bulk-Auftrag
+        scheduler.release()
+        await interactive
+        assert not older.done()
+        scheduler.release()
+        await older
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["in_flight"], stats["queue_depth"], stats["admitted"]) == (1, 0, 3)
+
+
+def test_expired_deadline_answers_503_with_retry_after():
+    async def main():
+        scheduler = LLMScheduler(max_in_flight=1, max_queue=4)
+        # Zwei Completions à ca. 4 s: Retry-After schätzt die Wartezeit aus deren Laufzeit
+        scheduler._durations.extend([4.0, 4.0])
+        await scheduler.acquire()
+        waiting = await queued(scheduler, LLMPriority.interactive)
+        with pytest.raises(LLMOverloadedError) as expired:
+            await scheduler.acquire(deadline=0.01)
+        scheduler.release()
+        await waiting
+        return scheduler, expired.value
+
+    scheduler, error = asyncio.run(main())
+    assert (error.status_code, error.retry_after) == (503, 8)
+    assert scheduler.expired == 1 and not scheduler._queue
+
+    response = asyncio.run(api.llm_overloaded_handler(None, error))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "8"
@@ -0,0 +1,87 @@
+import json
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import Reindex
+
+ORIGINAL = {"refresh_interval": "30s", "number_of_replicas": "2"}
+
+
+class SettingsRecorder:
+    """
+    Elasticsearch-Client, der nur die Index-Einstellungen kennt; reindex bzw. search scheitern mit error.
+    """
+
+    def __init__(self, error: BaseException):
+        self.error = error
+        self.settings = []
+        self.indices = SimpleNamespace(
+            exists=lambda index: True,
+            get_settings=lambda index, include_defaults=False: {
+                index: {"settings": {"index": {**ORIGINAL, "number_of_shards": "1"}}}
+            },
+            put_settings=lambda index, settings: self.settings.append(settings["index"]),
+            refresh=lambda index: None,
+        )
+
+    def reindex(self, **kwargs):
+        raise self.error
+
+    def search(self, **kwargs):
+        raise self.error
+
+
+@pytest.mark.parametrize("mode, error", [
+    ("server", KeyboardInterrupt()),
+    ("client", ConnectionError("Elasticsearch nicht erreichbar")),
+])
+def test_failed_reindex_restores_target_settings(tmp_path, monkeypatch, mode, error):
+    es = SettingsRecorder(error)
+    checkpoint = tmp_path / "checkpoint.json"
+    monkeypatch.setattr(Reindex, "Elasticsearch", lambda *args, **kwargs: es)
+    monkeypatch.setattr(sys, "argv", ["Reindex.py", "--mode", mode, "--checkpoint", str(checkpoint)])
+
+    with pytest.raises(type(error)):
+        Reindex.main()
+
+    assert es.settings == [{"refresh_interval": "-1", "number_of_replicas": 0}, ORIGINAL]
+    # Der Checkpoint bleibt für den Neustart erhalten
+    assert json.loads(checkpoint.read_text(encoding="utf-8"))["original_settings"] == ORIGINAL
+
+
+class SliceSource:
+    """
+    Sliced Scroll über feste Dokumente je Slice, in einer Antwort.
+    """
+
+    def __init__(self, docs_per_slice: int, slices: int):
+        self.docs = {s: [{"_id": f"{s}-{n}", "_source": {"n": n}} for n in range(docs_per_slice)] for s in range(slices)}
+        self.searched = []
+
+    def search(self, index, scroll, size, body):
+        slice_id = body["slice"]["id"]
+        self.searched.append(slice_id)
+        return {"_scroll_id": f"scroll-{slice_id}", "hits": {"hits": self.docs[slice_id]}}
+
+    def scroll(self, scroll_id, scroll):
+        return {"_scroll_id": scroll_id, "hits": {"hits": []}}
+
+    def clear_scroll(self, scroll_id):
+        pass
+
+
+def test_client_reindex_resumes_with_the_unfinished_slices(tmp_path, monkeypatch):
+    written = []
+    monkeypatch.setattr(Reindex.helpers, "bulk", lambda es, actions: written.extend(a["_id"] for a in actions))
+    # Ein abgebrochener Lauf hat die Slices 0 und 2 abgeschlossen
+    checkpoint_path = tmp_path / "checkpoint.json"
+    checkpoint_path.write_text(json.dumps({"completed_slices": [0, 2], "slice_counts": {"0": 5, "2": 5}}))
+
+    es = SliceSource(docs_per_slice=5, slices=3)
+    total = Reindex.reindex_client(es, "jira", "jira-neu", 3, 100, 0, Reindex.Checkpoint(str(checkpoint_path)))
+    assert es.searched == [1]
+    assert sorted(written) == [f"1-{n}" for n in range(5)]
+    assert total == 15
+    assert json.loads(checkpoint_path.read_text())["completed_slices"] == [0, 1, 2]
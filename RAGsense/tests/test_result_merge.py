@@ -0,0 +1,46 @@
+from services.result_merge import merge_top_k, normalize_scores
+
+
+def hits(index: str, scores) -> list:
+    return [{"index": index, "doc_id": f"{index}-{n}", "score": score} for n, score in enumerate(scores)]
+
+
+def test_normalize_scores_returns_copies():
+    original = hits("jira", [8.0, 4.0, 0.0])
+    normalized = normalize_scores(original)
+    assert [h["score"] for h in normalized] == [1.0, 0.5, 0.0]
+    assert [h["raw_score"] for h in normalized] == [8.0, 4.0, 0.0]
+    assert [h["score"] for h in original] == [8.0, 4.0, 0.0]
+    assert "raw_score" not in original[0]
+
+
+def test_merge_top_k_deduplicates_by_index_and_doc_id():
+    jira = normalize_scores(hits("jira", [10.0, 5.0]))
+    again = normalize_scores([{"index": "jira", "doc_id": "jira-1", "score": 2.0}, *hits("wiki", [1.0])])
+    merged = merge_top_k({"jira": jira, "wiki": again}, 3)
+    assert [(h["doc_id"], h["score"]) for h in merged] == [("jira-0", 1.0), ("jira-1", 1.0), ("wiki-0", 0.5)]
+
+
+def test_shallow_source_is_refetched_at_full_depth(run_api):
+    # a liefert viele gleich gute Treffer, b nur einen sehr guten
+    full = {"a": hits("a", [100 - n for n in range(10)]), "b": hits("b", [100, 50, 40, 30, 20, 10, 9, 8, 7, 6])}
+    calls = []
+
+    async def search_fn(src: str, depth: int):
+        calls.append((src, depth))
+        return [dict(h) for h in full[src][:depth]]
+
+    async def scenario(client, rag):
+        # Bisher trug a nichts zur Top-K bei: Tiefe min_depth, aufgerundet auf 5
+        rag.source_depths.update("keyword", {"a": 0.0, "b": 1.0}, 0, 0, 0)
+        merged, failed = await rag.search_sources_top_k(["a", "b"], search_fn, 10, "keyword")
+        return merged, failed, rag.source_depths.stats()
+
+    merged, failed, stats = run_api(scenario)
+    assert failed == []
+    assert calls == [("a", 5), ("b", 10), ("a", 10)]
+    reference = merge_top_k({src: normalize_scores(results) for src, results in full.items()}, 10)
+    assert [h["doc_id"] for h in merged] == [h["doc_id"] for h in reference]
+    assert sum(h["index"] == "a" for h in merged) == 9
+    assert stats["refetches"] == 1
+    assert all(h["raw_score"] == full[h["index"]][int(h["doc_id"].split("-")[1])]["score"] for h in merged)
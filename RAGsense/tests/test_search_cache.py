@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from services.search_cache import SearchResultCache
+
+
+@pytest.fixture(autouse=True)
+def search_cache_on(monkeypatch):
+    monkeypatch.setenv("SEARCH_CACHE", "on")
+    monkeypatch.setenv("SEARCH_CACHE_POLL_INTERVAL", "0.05")
+
+
+def search_body(query: str) -> dict:
+    # Eine Quelle: die adaptive Abfragetiefe bleibt bei topK, der Cache-Schlüssel also gleich
+    return {"query": query, "sources": ["jira"], "searchType": "Keyword", "topK": 10, "includeContent": False}
+
+
+def test_repeated_search_keeps_raw_scores(run_api, corpus):
+    query = corpus.queries(1)[0]
+
+    async def scenario(client, rag):
+        first = (await client.post("/api/search", json=search_body(query))).json()
+        second = (await client.post("/api/search", json=search_body(query))).json()
+        return first, second, rag.search_cache.stats()
+
+    first, second, stats = run_api(scenario)
+    assert stats["hits"] == 1
+    assert first["results"]
+    assert [r["rawScore"] for r in second["results"]] == [r["rawScore"] for r in first["results"]]
+    assert [r["score"] for r in second["results"]] == [r["score"] for r in first["results"]]
+    assert first["results"][0]["rawScore"] > 1.0  # BM25, nicht der normalisierte Score
+
+
+def test_hit_miss_and_invalidation_after_write(run_api, es, corpus):
+    query = corpus.queries(1)[0]
+
+    async def scenario(client, rag):
+        first = (await client.post("/api/search", json=search_body(query))).json()
+        after_miss = rag.search_cache.stats()
+        await client.post("/api/search", json=search_body(query))
+        after_hit = rag.search_cache.stats()
+
+        # Kopie des besten Treffers unter neuer ID: ändert die Generation des Index
+        best = first["results"][0]["docId"]
+        es.index("jira").put("BENCH-COPY", dict(es.indices["jira"].docs[best]))
+        await asyncio.sleep(0.3)
+
+        third = (await client.post("/api/search", json=search_body(query))).json()
+        return third, after_miss, after_hit, rag.search_cache.stats()
+
+    third, after_miss, after_hit, after_write = run_api(scenario)
+    assert (after_miss["hits"], after_miss["misses"]) == (0, 1)
+    assert (after_hit["hits"], after_hit["misses"]) == (1, 1)
+    assert after_write["invalidations"] == 1
+    assert "BENCH-COPY" in [r["docId"] for r in third["results"]]
+
+
+def test_cached_results_are_copies():
+    cache = SearchResultCache(max_memory_mb=1, ttl_seconds=60)
+    key = cache.key("jira", "keyword", "foo  bar", top_k=10)
+    generation = ((1, 0, 1),)
+    results = [{"doc_id": "1", "score": 7.5}]
+    cache.put(key, generation, results, 0.01)
+
+    results[0]["score"] = 1.0
+    cached = cache.get(key, generation)
+    assert cached == [{"doc_id": "1", "score": 7.5}]
+    cached[0]["score"] = 0.5
+    assert cache.get(cache.key("jira", "keyword", "foo bar", top_k=10), generation)[0]["score"] == 7.5
+    assert cache.get(key, ((2, 0, 2),)) is None
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fake_elasticsearch import ElasticsearchError
+from services.async_rag_service import AsyncRAGService
+from services.search_cursor import CursorExpiredError, PitRegistry
+
+
+def page_body(query: str, search_type: str, cursor=None) -> dict:
+    return {
+        "query": query, "sources": ["jira"], "searchType": search_type, "topK": 20, "includeContent": False,
+        "paginate": True, "cursor": cursor,
+    }
+
+
+@pytest.mark.parametrize("search_type", ["Keyword", "Embedding"])
+def test_cursor_pages_to_the_end(run_api, es, corpus, search_type):
+    query = corpus.queries(1)[0]
+
+    async def scenario(client, rag):
+        pages, cursor = [], None
+        while True:
+            resp = await client.post("/api/search", json=page_body(query, search_type, cursor))
+            assert resp.status_code == 200, resp.text
+            pages.append(resp.json()["results"])
+            cursor = resp.json()["nextCursor"]
+            if cursor is None:
+                return pages
+            assert len(pages) < 50
+
+    pages = run_api(scenario)
+    hits = [hit for page in pages for hit in page]
+    ids = [hit["docId"] for hit in hits]
+    assert len(pages) > 2
+    assert len(ids) == len(set(ids))
+    if search_type == "Embedding":
+        assert len(ids) == len(es.indices["jira"].docs)
+
+    # Normalisiert wird auf den besten Score der ersten Seite: über alle Seiten absteigend und vergleichbar
+    best = pages[0][0]["rawScore"]
+    assert [hit["score"] for hit in hits] == pytest.approx([hit["rawScore"] / best for hit in hits])
+    assert all(a["score"] >= b["score"] for a, b in zip(hits, hits[1:]))
+    assert pages[1][0]["score"] < 1.0
+
+    # Die letzte Seite hat die PITs freigegeben
+    assert not es._pits
+
+
+class PitClient:
+    # Nur open/close_point_in_time, für die PitRegistry
+    def __init__(self):
+        self.closed = []
+
+    async def open_point_in_time(self, index, keep_alive):
+        return {"id": f"pit-{index}"}
+
+    async def close_point_in_time(self, id):
+        self.closed.append(id)
+
+
+def test_pit_registry_leaves_expiry_to_elasticsearch():
+    async def main():
+        client = PitClient()
+        pits = PitRegistry(client, keep_alive_seconds=0)
+        await pits.open("jira")
+        await asyncio.sleep(0.01)
+        # Abgelaufen heißt hier nur: dieser Prozess hat den PIT nicht verlängert (evtl. ein anderer Worker)
+        stats = pits.stats()
+        assert client.closed == []
+        assert (stats["open"], stats["expired"]) == (0, 1)
+
+        pits.keep_alive_seconds = 120
+        pit_id = await pits.open("wiki")
+        await pits.close()
+        return client.closed, pit_id
+
+    closed, pit_id = asyncio.run(main())
+    assert closed == [pit_id]
+
+
+def test_knn_cursor_restarts_when_knn_fails_mid_pagination(es, es_server, corpus, monkeypatch):
+    query = corpus.queries(1)[0]
+
+    async def main():
+        rag = AsyncRAGService(es_server.url, None, "elastic", "password")
+        try:
+            first, state = await rag.search_page("jira", "embedding", query, 10)
+            # Ab der zweiten Seite lehnt der Index kNN ab (Mapping geändert)
+            search = es.search
+
+            def _search(expression, body, params):
+                if "knn" in (body or {}):
+                    raise ElasticsearchError(400, "illegal_argument_exception", "field [embedding] is not a dense_vector")
+                return search(expression, body, params)
+
+            monkeypatch.setattr(es, "search", _search)
+            with pytest.raises(CursorExpiredError):
+                await rag.search_page("jira", "embedding", query, 10, state)
+
+            # Ein neuer Cursor nutzt die exakte Suche und beginnt bei der ersten Seite
+            restarted, new_state = await rag.search_page("jira", "embedding", query, 10)
+            return first, restarted, new_state
+        finally:
+            await rag.close()
+
+    first, restarted, new_state = asyncio.run(main())
+    assert new_state["plan"] == "sorted"
+    assert [hit["doc_id"] for hit in restarted] == [hit["doc_id"] for hit in first]
+    assert not es._pits